@@ -2,6 +2,7 @@
 
 import os
 import warnings
+from distutils.util import strtobool
 from pathlib import Path
 from ruamel.yaml import YAML
 from datetime import date
@@ -14,6 +15,7 @@ from astropy.coordinates import Angle
 from . import base_config
 from ..version import __version__
 from ..plots.pointings import plot_pointings
+from ..io.pointing_index import PointingIndex, PointingCatalog
 
 
 _crab_dec = 'dec_2276'
@@ -388,10 +390,17 @@ class PathConfigAllSkyBase(PathConfig):
     dataset_type: 'Training' or 'Testing'
     """
 
-    def __init__(self, prod_id, dec):
+    # index of the scanned pointing directories, reused by the next calls.
+    # It only records whether each pointing has simtel files, not their number or size.
+    # Set to None to scan the directories every time.
+    pointing_index = PointingIndex()
+
+    def __init__(self, prod_id, dec, catalog=None):
         super().__init__(prod_id)
         self.prod_id = prod_id
         self.dec = dec
+        # pointings shared with the other configs of the production, see `lstmcpipe.io.pointing_index`
+        self.catalog = PointingCatalog(self.pointing_index) if catalog is None else catalog
         self.base_dir = "/fefs/aswg/data/mc/{data_level}/AllSky/{prod_id}/{dataset_type}/{particle}/{dec}/{pointing}/"
 
         self.paths = {}
@@ -498,8 +507,8 @@ class PathConfigAllSkyTraining(PathConfigAllSkyBase):
     Handles a single declination from R0 up to RF generation.
     """
 
-    def __init__(self, prod_id, dec):
-        super().__init__(prod_id, dec)
+    def __init__(self, prod_id, dec, catalog=None):
+        super().__init__(prod_id, dec, catalog=catalog)
         # dec must be read here and not later as a f-string, hence the + dec +
         self.training_dir = (
             "/fefs/aswg/data/mc/DL0/LSTProd2/TrainingDataset/{particle}/"
@@ -522,11 +531,7 @@ class PathConfigAllSkyTraining(PathConfigAllSkyBase):
         list directories in r0_path that contain simtel files
         """
         r0_pointing_path = Path(self.r0_dir(particle, pointing='$$$').split('$$$')[0])
-        return [
-            d.name
-            for d in r0_pointing_path.iterdir()
-            if d.is_dir() and list(Path(self.r0_dir(particle, d.name)).glob('*.simtel.gz'))
-        ]
+        return self.catalog.pointing_dirs(r0_pointing_path, lambda pointing: self.r0_dir(particle, pointing))
 
     def pointing_dirs(self, particle):
         return self.pointings[f'dirname_{particle}']
@@ -551,6 +556,12 @@ class PathConfigAllSkyTraining(PathConfigAllSkyBase):
         'astropy.table.QTable`
     
         """
+        self._training_pointings = self.catalog.table(
+            ("training", self.training_dir, tuple(self.training_particles), join_type),
+            lambda: self._build_training_pointings(join_type),
+        )
+
+    def _build_training_pointings(self, join_type):
         tabs = {}
 
         for particle in self.training_particles:
@@ -574,7 +585,7 @@ class PathConfigAllSkyTraining(PathConfigAllSkyBase):
         for part in self.training_particles[2:]:
             tab = join(tab, tabs[part], keys=['alt', 'az'], join_type=join_type)
 
-        self._training_pointings = tab
+        return tab
 
     @property
     def pointings(self):
@@ -675,9 +686,22 @@ class PathConfigAllSkyTraining(PathConfigAllSkyBase):
 
 
 class PathConfigAllSkyTrainingWithSplit(PathConfigAllSkyTraining):
-    def __init__(self, prod_id, dec):
-        super().__init__(prod_id, dec)
+    def __init__(self, prod_id, dec, split_lists=False, catalog=None):
+        """
+        Parameters
+        ----------
+        prod_id: str
+        dec: str
+        split_lists: bool
+            If True, the GammaDiffuse DL1 files are not moved into train and test directories, the split only writes
+            `train.list` and `test.list` manifests read by the merge stage
+        catalog: `lstmcpipe.io.pointing_index.PointingCatalog` or None
+            pointings shared with the other configs
+        """
+        super().__init__(prod_id, dec, catalog=catalog)
         self.stages.insert(1, 'train_test_split')
+        # may be given as a string by `lstmcpipe_generate_config --kwargs`
+        self.split_lists = bool(strtobool(str(split_lists)))
 
     def dl1_diffuse_test_dir(self, pointing):
         return self.dl1_dir('GammaDiffuse', pointing).replace('TrainingDataset', 'TestingDataset') + '/test'
@@ -685,13 +709,23 @@ class PathConfigAllSkyTrainingWithSplit(PathConfigAllSkyTraining):
     def dl1_diffuse_train_dir(self, pointing):
         return self.dl1_dir('GammaDiffuse', pointing) + '/train'
 
+    def dl1_diffuse_test_list(self, pointing):
+        return os.path.join(self.dl1_dir('GammaDiffuse', pointing), 'test.list')
+
+    def dl1_diffuse_train_list(self, pointing):
+        return os.path.join(self.dl1_dir('GammaDiffuse', pointing), 'train.list')
+
     @property
     def train_test_split(self):
         paths = []
         for pointing in self.pointing_dirs('GammaDiffuse'):
             dl1 = self.dl1_dir('GammaDiffuse', pointing)
-            train = self.dl1_diffuse_train_dir(pointing)
-            test = self.dl1_diffuse_test_dir(pointing)
+            if self.split_lists:
+                train = self.dl1_diffuse_train_list(pointing)
+                test = self.dl1_diffuse_test_list(pointing)
+            else:
+                train = self.dl1_diffuse_train_dir(pointing)
+                test = self.dl1_diffuse_test_dir(pointing)
             paths.append({'input': dl1, 'output': {'train': train, 'test': test}, 'options': {'test_size': 0.5}})
         return paths
 
@@ -702,6 +736,16 @@ class PathConfigAllSkyTrainingWithSplit(PathConfigAllSkyTraining):
         for particle in self.training_particles:
             dl1 = self.dl1_dir(particle, '')
             merged_dl1 = self.training_merged_dl1(particle)
+            if particle == 'GammaDiffuse' and self.split_lists:
+                paths.append(
+                    {
+                        'input': [self.dl1_diffuse_train_list(pointing) for pointing in self.pointing_dirs(particle)],
+                        'output': merged_dl1,
+                        'options': '--no-image',
+                        'extra_slurm_options': {'partition': 'long', 'time': '06:00:00'},
+                    }
+                )
+                continue
             pattern = '*/*/*.h5' if particle == 'GammaDiffuse' else '*/*.h5'  # this is needed because search is not recursive in lstchain. can be changed after https://github.com/cta-observatory/cta-lstchain/pull/1286
             paths.append(
                 {
@@ -715,8 +759,8 @@ class PathConfigAllSkyTrainingWithSplit(PathConfigAllSkyTraining):
 
 
 class PathConfigAllSkyTesting(PathConfigAllSkyBase):
-    def __init__(self, prod_id, dec):
-        super().__init__(prod_id, dec)
+    def __init__(self, prod_id, dec, catalog=None):
+        super().__init__(prod_id, dec, catalog=catalog)
         self.testing_dir = "/fefs/aswg/data/mc/DL0/LSTProd2/TestDataset/sim_telarray/{pointing}/output_v1.4/"
         self.dataset_type = 'TestingDataset'
         self.particle = 'Gamma'
@@ -733,11 +777,7 @@ class PathConfigAllSkyTesting(PathConfigAllSkyBase):
         list directories in r0_path that contain simtel files
         """
         r0_pointing_path = Path(self.r0_dir(pointing='$$$').split('$$$')[0])
-        return [
-            d.name
-            for d in r0_pointing_path.iterdir()
-            if d.is_dir() and list(Path(self.r0_dir(d.name)).glob('*.simtel.gz'))
-        ]
+        return self.catalog.pointing_dirs(r0_pointing_path, self.r0_dir)
 
     def load_pointings(self):
         """
@@ -748,13 +788,18 @@ class PathConfigAllSkyTesting(PathConfigAllSkyBase):
         -------
         'astropy.table.QTable`
         """
+        self._testing_pointings = self.catalog.table(
+            ("testing", self.testing_dir, self.particle), self._build_testing_pointings
+        )
+
+    def _build_testing_pointings(self):
         data = []
         for d in self._search_pointings():
             pt = self._extract_pointing(d)
             alt, az = (90.0 - float(pt.groups()[0])) * u.deg, (float(pt.groups()[1])) * u.deg
             data.append([Angle(alt).wrap_at('180d'), Angle(az).wrap_at('360d'), d])
         reshaped_data = [[dd[0] for dd in data], [dd[1] for dd in data], [dd[2] for dd in data]]
-        self._testing_pointings = QTable(data=reshaped_data, names=['alt', 'az', f'dirname_{self.particle}'])
+        return QTable(data=reshaped_data, names=['alt', 'az', f'dirname_{self.particle}'])
 
     @property
     def pointings(self):
@@ -883,15 +928,18 @@ class PathConfigAllSkyTesting(PathConfigAllSkyBase):
 
 
 class PathConfigAllSkyTestingGammaDiffuse(PathConfigAllSkyTesting):
-    def __init__(self, prod_id, dec):
+    def __init__(self, prod_id, dec, split_lists=False, catalog=None):
         """
         This config must be used after a PathConfigAllSkyTrainingWithSplit has been generated and run.
         It uses the test dataset of GammaDiffuse created by the train_test_split stage of PathConfigAllSkyTrainingWithSplit, 
         merges the nodes and runs the dl1_to_dl2 and dl2_to_irfs stages.
+        `split_lists` must be the same as for the PathConfigAllSkyTrainingWithSplit.
         """
-        super().__init__(prod_id, dec)
+        super().__init__(prod_id, dec, catalog=catalog)
         self.stages = ['merge_dl1', 'dl1_to_dl2', 'dl2_to_irfs']
-        self.train_config = PathConfigAllSkyTrainingWithSplit(prod_id, dec)
+        self.train_config = PathConfigAllSkyTrainingWithSplit(
+            prod_id, dec, split_lists=split_lists, catalog=self.catalog
+        )
         # self.pointings = self.train_config.pointings
         self.particle = 'GammaDiffuse'
 
@@ -910,6 +958,16 @@ class PathConfigAllSkyTestingGammaDiffuse(PathConfigAllSkyTesting):
         for pointing in self.train_config.pointing_dirs(self.particle):
             dl1 = self.dl1_dir(pointing, dec=self.dec)
             merged_dl1 = self.testing_merged_dl1(pointing, dec=self.dec)
+            if self.train_config.split_lists:
+                paths.append(
+                    {
+                        'input': self.train_config.dl1_diffuse_test_list(pointing),
+                        'output': merged_dl1,
+                        'options': '--no-image',
+                        'extra_slurm_options': {'partition': 'long', 'time': '06:00:00'},
+                    }
+                )
+                continue
             paths.append(
                 {
                     'input': dl1, 
@@ -940,7 +998,7 @@ class PathConfigAllSkyTestingGammaDiffuse(PathConfigAllSkyTesting):
 
 
 class PathConfigAllSkyFull(PathConfig):
-    def __init__(self, prod_id, dec_list):
+    def __init__(self, prod_id, dec_list, catalog=None):
         """
         Does training and testing for a list of declinations
 
@@ -948,14 +1006,17 @@ class PathConfigAllSkyFull(PathConfig):
         ----------
         prod_id: str
         dec_list: [str]
+        catalog: `lstmcpipe.io.pointing_index.PointingCatalog` or None
+            pointings shared by the configs of all the declinations, so that each directory is scanned once
         """
         super().__init__(prod_id)
         self.prod_id = prod_id
         self.dec_list = dec_list
         self.stages = ['r0_to_dl1', 'merge_dl1', 'train_pipe', 'dl1_to_dl2', 'dl2_to_irfs']
+        self.catalog = PointingCatalog(PathConfigAllSkyBase.pointing_index) if catalog is None else catalog
 
-        self.train_configs = {dec: PathConfigAllSkyTraining(prod_id, dec) for dec in dec_list}
-        self.test_configs = {dec: PathConfigAllSkyTesting(prod_id, dec) for dec in dec_list}
+        self.train_configs = {dec: PathConfigAllSkyTraining(prod_id, dec, catalog=self.catalog) for dec in dec_list}
+        self.test_configs = {dec: PathConfigAllSkyTesting(prod_id, dec, catalog=self.catalog) for dec in dec_list}
 
     @property
     def r0_to_dl1(self):
@@ -1031,7 +1092,7 @@ class PathConfigAllSkyFull(PathConfig):
 
 
 class PathConfigAllSkyTrainingDL1ab(PathConfigAllSkyTraining):
-    def __init__(self, prod_id, source_prod_id, dec, run_checker=True):
+    def __init__(self, prod_id, source_prod_id, dec, run_checker=True, catalog=None):
         """
         Parameters
         ----------
@@ -1043,11 +1104,13 @@ class PathConfigAllSkyTrainingDL1ab(PathConfigAllSkyTraining):
             the declination
         run_checker: boolean
             True to check if the source prod exists
+        catalog: `lstmcpipe.io.pointing_index.PointingCatalog` or None
+            pointings shared with the other configs
         """
-        super().__init__(prod_id, dec)
+        super().__init__(prod_id, dec, catalog=catalog)
         self.stages = ['dl1ab', 'merge_dl1', 'train_pipe']
         self.source_prod_id = source_prod_id
-        self.source_config = PathConfigAllSkyTraining(source_prod_id, dec)
+        self.source_config = PathConfigAllSkyTraining(source_prod_id, dec, catalog=self.catalog)
         if run_checker:
             self.check_source_prod()
 
@@ -1077,7 +1140,7 @@ class PathConfigAllSkyTrainingDL1ab(PathConfigAllSkyTraining):
 
 
 class PathConfigAllSkyTestingDL1ab(PathConfigAllSkyTesting):
-    def __init__(self, prod_id, source_prod_id, dec, run_checker=True):
+    def __init__(self, prod_id, source_prod_id, dec, run_checker=True, catalog=None):
         """
         Parameters
         ----------
@@ -1089,11 +1152,13 @@ class PathConfigAllSkyTestingDL1ab(PathConfigAllSkyTesting):
             the declination
         run_checker: boolean
             True to check if the source prod exists
+        catalog: `lstmcpipe.io.pointing_index.PointingCatalog` or None
+            pointings shared with the other configs
         """
-        super().__init__(prod_id, dec)
+        super().__init__(prod_id, dec, catalog=catalog)
         self.stages = ['dl1ab', 'merge_dl1', 'dl1_to_dl2', 'dl2_to_irfs']
         self.source_prod_id = source_prod_id
-        self.source_config = PathConfigAllSkyTesting(source_prod_id, dec)
+        self.source_config = PathConfigAllSkyTesting(source_prod_id, dec, catalog=self.catalog)
         if run_checker:
             self.check_source_prod()
 
@@ -1121,7 +1186,7 @@ class PathConfigAllSkyTestingDL1ab(PathConfigAllSkyTesting):
 
 
 class PathConfigAllSkyFullDL1ab(PathConfigAllSkyFull):
-    def __init__(self, prod_id, source_prod_id, dec_list, run_checker=True):
+    def __init__(self, prod_id, source_prod_id, dec_list, run_checker=True, catalog=None):
         """
         Parameters
         ----------
@@ -1133,16 +1198,23 @@ class PathConfigAllSkyFullDL1ab(PathConfigAllSkyFull):
             list of declinations
         run_checker: boolean
             True to check if the source prod exists
+        catalog: `lstmcpipe.io.pointing_index.PointingCatalog` or None
+            pointings shared by the configs of all the declinations
         """
-        super().__init__(prod_id, dec_list)
+        super().__init__(prod_id, dec_list, catalog=catalog)
         self.source_prod_id = source_prod_id
         self.stages = ['dl1ab', 'merge_dl1', 'train_pipe', 'dl1_to_dl2', 'dl2_to_irfs']
         self.train_configs = {
-            dec: PathConfigAllSkyTrainingDL1ab(prod_id, source_prod_id, dec, run_checker=run_checker)
+            dec: PathConfigAllSkyTrainingDL1ab(
+                prod_id, source_prod_id, dec, run_checker=run_checker, catalog=self.catalog
+            )
             for dec in dec_list
         }
         self.test_configs = {
-            dec: PathConfigAllSkyTestingDL1ab(prod_id, source_prod_id, dec, run_checker=run_checker) for dec in dec_list
+            dec: PathConfigAllSkyTestingDL1ab(
+                prod_id, source_prod_id, dec, run_checker=run_checker, catalog=self.catalog
+            )
+            for dec in dec_list
         }
 
     @property
@@ -1156,7 +1228,7 @@ class PathConfigAllSkyFullDL1ab(PathConfigAllSkyFull):
 
 
 class PathConfigAllTrainTestDL1b(PathConfigAllSkyFullDL1ab):
-    def __init__(self, prod_id, source_prod_id, dec_list, run_checker=True):
+    def __init__(self, prod_id, source_prod_id, dec_list, run_checker=True, catalog=None):
         """
         Config for an allsky train-test analysis from an existing source prod.
         It runs:
@@ -1165,13 +1237,15 @@ class PathConfigAllTrainTestDL1b(PathConfigAllSkyFullDL1ab):
         Note that in of source-dependent analysis,
         missing src-dep parameters are recomputed on the fly during the train stage by lstchain.
         """
-        super().__init__(prod_id, source_prod_id, dec_list)
+        super().__init__(prod_id, source_prod_id, dec_list, catalog=catalog)
         self.dec_list = dec_list
         self.source_prod_id = source_prod_id
         self.source_configs = PathConfigAllSkyFullDL1ab(
-            source_prod_id, source_prod_id, dec_list, run_checker=run_checker
+            source_prod_id, source_prod_id, dec_list, run_checker=run_checker, catalog=self.catalog
+        )
+        self.target_configs = PathConfigAllSkyFullDL1ab(
+            prod_id, source_prod_id, dec_list, run_checker=run_checker, catalog=self.catalog
         )
-        self.target_configs = PathConfigAllSkyFullDL1ab(prod_id, source_prod_id, dec_list, run_checker=run_checker)
         self.stages = ['train_pipe', 'dl1_to_dl2']
         if run_checker:
             self.check_source_prod()
@@ -1221,13 +1295,19 @@ class PathConfigAllTrainTestDL1b(PathConfigAllSkyFullDL1ab):
 
 
 class PathConfigAllSkyFullSplitDiffuse(PathConfigAllSkyFull):
-    def __init__(self, prod_id, dec_list):
-        super().__init__(prod_id, dec_list)
+    def __init__(self, prod_id, dec_list, split_lists=False, catalog=None):
+        super().__init__(prod_id, dec_list, catalog=catalog)
         self.stages = ['r0_to_dl1', 'train_test_split', 'merge_dl1', 'train_pipe', 'dl1_to_dl2', 'dl2_to_irfs']
 
-        self.train_configs = {dec: PathConfigAllSkyTrainingWithSplit(prod_id, dec) for dec in dec_list}
-        self.test_configs = {dec: PathConfigAllSkyTesting(prod_id, dec) for dec in dec_list}
-        self.test_diffuse_config = {dec: PathConfigAllSkyTestingGammaDiffuse(prod_id, dec) for dec in dec_list}
+        self.train_configs = {
+            dec: PathConfigAllSkyTrainingWithSplit(prod_id, dec, split_lists=split_lists, catalog=self.catalog)
+            for dec in dec_list
+        }
+        self.test_configs = {dec: PathConfigAllSkyTesting(prod_id, dec, catalog=self.catalog) for dec in dec_list}
+        self.test_diffuse_config = {
+            dec: PathConfigAllSkyTestingGammaDiffuse(prod_id, dec, split_lists=split_lists, catalog=self.catalog)
+            for dec in dec_list
+        }
 
     @property
     def train_test_split(self):
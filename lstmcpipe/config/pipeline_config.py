@@ -38,6 +38,7 @@ def load_config(config_path):
         "Slurm configuration:"
         + f"\n - Source environment: {config['batch_config']['source_environment']}"
         + f"\n - Slurm account: {config['batch_config']['slurm_account']}"
+        + f"\n - Executor: {config['batch_config']['executor']}"
     )
 
     log.warning("\n! Subdirectories with the same PROD_ID and analysed the same day will be overwritten !")
@@ -159,9 +160,50 @@ def complete_lstmcpipe_config(loaded_config):
     slurm_account = loaded_config.get("slurm_config", {}).get("user_account", "")
 
     # 2 - Create a dict for all env configuration and slurm configuration (batch arguments)
+    # The executor (`slurm` by default, or `local`) defines where the jobs run, see `lstmcpipe.executors`
+    # `array_submission` submits the jobs of a stage as slurm job arrays instead of one job per path
+    # `submission_threads` is the number of jobs of a stage submitted concurrently
+    # `stage_cache` (directory, max_age_days, max_size_gb, stages) enables the cache shared between productions,
+    # see `lstmcpipe.io.stage_cache`
     config["batch_config"] = {
         "source_environment": src_env,
         "slurm_account": slurm_account,
+        "executor": loaded_config.get("executor", "slurm"),
+        "array_submission": loaded_config.get("slurm_config", {}).get("array_submission", False),
+        "submission_threads": loaded_config.get("slurm_config", {}).get("submission_threads", 8),
+        "stage_cache": loaded_config.get("stage_cache", None),
+        # SQLite catalog of the MC files (path, or true for the default one) queried instead of listing the input
+        # directories, see `lstmcpipe.io.file_catalog`
+        "file_catalog": loaded_config.get("file_catalog", None),
+        # `min_success_fraction` (float or per stage) and `poll_interval` of the `lstmcpipe --controller` mode
+        "controller": loaded_config.get("controller", None),
+        # mem, time and partition of the stages predicted from the `check_MC_*.txt` files of previous productions
+        "resource_tuning": loaded_config.get("resource_tuning", None),
+        # r0_to_dl1 files are packed in tasks of about `r0_dl1_task_walltime` seconds, estimated from the runtimes
+        # recorded in the `r0_dl1_runtime_history` directories (glob patterns) of previous productions
+        "r0_dl1_task_walltime": loaded_config.get("slurm_config", {}).get("r0_dl1_task_walltime", None),
+        "r0_dl1_runtime_history": loaded_config.get("slurm_config", {}).get("r0_dl1_runtime_history", []),
+        # maximum number of tasks of the r0_to_dl1 arrays, at most the MaxArraySize of the slurm cluster
+        "r0_dl1_max_array_size": loaded_config.get("slurm_config", {}).get("r0_dl1_max_array_size", 1000),
+        # process all the files of a r0_to_dl1/dl1ab task in a single python process importing lstchain once
+        "lstchain_in_process": loaded_config.get("slurm_config", {}).get("lstchain_in_process", False),
+        # r0_to_dl1/dl1ab tasks read and write on the node-local scratch ($TMPDIR) instead of the shared file system
+        "dl1_scratch_staging": loaded_config.get("slurm_config", {}).get("dl1_scratch_staging", False),
+        # maximal number of jobs of the user in the slurm queue (`auto`: MaxSubmitJobs of the account), the jobs
+        # above it are queued client-side and submitted in the background as capacity frees
+        "max_submitted_jobs": loaded_config.get("slurm_config", {}).get("max_submitted_jobs", None),
+        # the merge_dl1 outputs of more than `merge_fan_in` files are merged as a tree of jobs merging `merge_fan_in`
+        # files each, see `lstmcpipe.stages.mc_merge_dl1.batch_merge_dl1_tree`
+        "merge_fan_in": loaded_config.get("slurm_config", {}).get("merge_fan_in", None),
+        # append to the existing merge_dl1 outputs only the input files not merged yet
+        "merge_incremental": loaded_config.get("slurm_config", {}).get("merge_incremental", False),
+        # write the merge_dl1 outputs as HDF5 virtual datasets over the input files instead of copying them
+        "merge_virtual": loaded_config.get("slurm_config", {}).get("merge_virtual", False),
+        # only keep in the merge_dl1 outputs used by train_pipe the parameters used by the training
+        "merge_training_columns": loaded_config.get("slurm_config", {}).get("merge_training_columns", False),
+        # only keep in the merge_dl1 outputs used by train_pipe a stratified subsample of about this number of events
+        "merge_training_max_events": loaded_config.get("slurm_config", {}).get("merge_training_max_events", None),
+        "merge_subsampling_seed": loaded_config.get("slurm_config", {}).get("merge_subsampling_seed", 0),
     }
 
     return config
@@ -151,3 +151,24 @@ def test_PathConfigProd5Trans80():
         with tempfile.NamedTemporaryFile() as f:
             cfg.save_yml(f.name, overwrite=True)
             pipeline_config.load_config(f.name)
+
+
+def test_PathConfigAllSkyFull_shared_pointings(monkeypatch):
+    from astropy.table import QTable
+
+    built = []
+
+    def build_testing_pointings(self):
+        built.append(self.dec)
+        return QTable({'alt': [80.0], 'az': [102.2], 'dirname_Gamma': ['node_theta_10.0_az_102.199_']})
+
+    monkeypatch.setattr(paths_config.PathConfigAllSkyTesting, '_build_testing_pointings', build_testing_pointings)
+    dec_list = ['dec_2276', 'dec_3476', 'dec_4822']
+    config = paths_config.PathConfigAllSkyFull('prod', dec_list)
+    assert all(test_config.catalog is config.catalog for test_config in config.test_configs.values())
+    # the test dataset is the same for all the declinations and is scanned once
+    for dec in dec_list:
+        assert len(config.test_configs[dec].pointings) == 1
+    config.test_configs[dec_list[0]].pointings.remove_rows([0])
+    assert len(config.test_configs[dec_list[1]].pointings) == 1
+    assert built == [dec_list[0]]
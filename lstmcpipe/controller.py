@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+# Controller mode of `lstmcpipe --controller`.
+# Instead of submitting all the stages at once chained by `afterok` dependencies (a single failed job then leaves
+# all the downstream jobs pending forever), lstmcpipe stays alive and submits each stage only once the jobs of the
+# previous one are over. The stage is accepted if enough of its tasks succeeded (`min_success_fraction`), the next
+# stage then runs on the outputs actually produced.
+
+import time
+import logging
+
+from .io.job_store import ACTIVE_STATES, DONE_STATES
+
+log = logging.getLogger(__name__)
+
+
+class StageFailedError(RuntimeError):
+    pass
+
+
+class Controller:
+    """
+    Wait for the jobs of each stage and decide whether the production can go on.
+
+    Parameters
+    ----------
+    executor: `lstmcpipe.executors.SlurmExecutor`
+        Executor of the production, with a `job_store` recording the submitted jobs
+    min_success_fraction: float or dict
+        Minimal fraction of succeeded tasks for a stage to be accepted, or {stage: fraction} (default 1 for the
+        stages not listed)
+    poll_interval: float
+        Seconds between two checks of the jobs states
+    """
+
+    def __init__(self, executor, min_success_fraction=1.0, poll_interval=60):
+        self.executor = executor
+        self.min_success_fraction = min_success_fraction
+        self.poll_interval = poll_interval
+
+    @classmethod
+    def from_config(cls, executor, config=None):
+        """
+        Parameters
+        ----------
+        executor: `lstmcpipe.executors.SlurmExecutor`
+        config: dict or None
+            `controller` section of the lstmcpipe config (`min_success_fraction`, `poll_interval`)
+        """
+        return cls(executor, **(config or {}))
+
+    def required_fraction(self, stage):
+        if isinstance(self.min_success_fraction, dict):
+            return self.min_success_fraction.get(stage, 1.0)
+        return self.min_success_fraction
+
+    def _submit_queued(self, jobids):
+        """
+        Submit the jobs waiting in the submission queue of the executor, if any, as capacity frees.
+
+        Returns
+        -------
+        list: job ids with the placeholders of the submitted jobs replaced, None while some are still queued
+        """
+        queue = self.executor.submission_queue
+        if queue is None or not self.executor.n_queued:
+            return jobids
+
+        from .utils import run_command
+        from .submission_queue import current_job_count, resolve_placeholders
+
+        n_jobs = current_job_count()
+        queue.submit_next(self.executor.job_limit - n_jobs, run_command, idle=n_jobs == 0)
+        submitted = queue.submitted()
+        if queue.pending():
+            return None
+        # everything submitted: the following stages are submitted directly again
+        self.executor.n_queued = 0
+        return resolve_placeholders(",".join(jobids), submitted).split(",")
+
+    def stage_status(self, jobids):
+        """
+        Count the tasks of the given jobs in each state.
+
+        Parameters
+        ----------
+        jobids: list of str
+            job ids or `jobid_taskid` of single array tasks
+
+        Returns
+        -------
+        dict: {"done", "failed", "active"} numbers of tasks
+        """
+        store = self.executor.job_store
+        n_tasks = {job["jobid"]: job["n_tasks"] for job in store.jobs(all_runs=True)}
+        status = {"done": 0, "failed": 0, "active": 0}
+        for jobid in set(jobid.split("_")[0] for jobid in jobids):
+            tasks = store.tasks(jobid)
+            # restricted to the tasks other stages depend on, if only some tasks of the job are listed
+            selected = [taskid for taskid in tasks if taskid in jobids] or list(tasks)
+            for taskid in selected:
+                state = tasks[taskid]
+                key = "done" if state in DONE_STATES else "active" if state in ACTIVE_STATES else "failed"
+                status[key] += 1
+            if not tasks:
+                # not known by sacct yet
+                status["active"] += n_tasks.get(jobid, 1)
+            elif len(selected) == len(tasks) and n_tasks.get(jobid, 1) > len(tasks):
+                status["active"] += n_tasks[jobid] - len(tasks)
+        return status
+
+    def wait_for_stage(self, stage, jobids):
+        """
+        Block until all the jobs of a stage are over.
+
+        Parameters
+        ----------
+        stage: str
+        jobids: str or None
+            Comma-separated job ids of the stage, as returned by the stage submission functions
+
+        Returns
+        -------
+        str or None: comma-separated job ids of the stage, with the ids of the jobs that were waiting in the
+            submission queue
+
+        Raises
+        ------
+        StageFailedError: if the fraction of succeeded tasks is lower than required
+        """
+        if not jobids:
+            return jobids
+        jobids = [jobid for jobid in jobids.split(",") if jobid]
+        log.info(f"Controller: waiting for the {len(jobids)} jobs of stage {stage}")
+        while True:
+            submitted = self._submit_queued(jobids)
+            if submitted is not None:
+                jobids = submitted
+                self.executor.job_store.refresh()
+                status = self.stage_status(jobids)
+                if status["active"] == 0:
+                    break
+            time.sleep(self.poll_interval)
+
+        total = status["done"] + status["failed"]
+        fraction = status["done"] / total if total else 1.0
+        required = self.required_fraction(stage)
+        if fraction < required:
+            raise StageFailedError(
+                f"Stage {stage}: only {status['done']}/{total} tasks succeeded ({fraction:.1%} < {required:.1%}). "
+                f"Use lstmcpipe_recover then lstmcpipe --resume to complete the production."
+            )
+        if status["failed"]:
+            log.warning(
+                f"Controller: {status['failed']}/{total} tasks of stage {stage} failed ({fraction:.1%} succeeded, "
+                f"{required:.1%} required), going on with the outputs produced"
+            )
+        else:
+            log.info(f"Controller: stage {stage} completed ({total} tasks)")
+        return ",".join(jobids)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+# Per-path dependencies between the jobs of a production.
+# Each stage registers the outputs of its jobs and the following stages query the jobs producing their
+# actual inputs, so that a job only waits for the jobs it really depends on instead of a whole stage.
+
+import os
+from pathlib import Path
+
+
+def _flatten_paths(paths):
+    """
+    Return the list of paths found in a stage `input` or `output` entry (str, list or dict of str).
+    Non-path values (None, numbers such as the train/test `ratio`) are ignored.
+    """
+    if isinstance(paths, (str, Path)):
+        return [Path(os.path.abspath(paths))]
+    elif isinstance(paths, dict):
+        return [p for value in paths.values() for p in _flatten_paths(value)]
+    elif isinstance(paths, (list, tuple)):
+        return [p for value in paths for p in _flatten_paths(value)]
+    else:
+        return []
+
+
+class DependencyGraph:
+    """
+    Graph of the jobs of a production keyed by the paths they produce.
+
+    A job depends on a producer job if one of its inputs is the producer output, is inside the producer output
+    directory (e.g. a DL2 file in the dl1_to_dl2 output dir) or contains the producer output (e.g. a merge
+    input directory containing all the DL1 nodes directories).
+    """
+
+    def __init__(self):
+        self._producers = []
+
+    def add(self, jobid, outputs):
+        """
+        Register the outputs of a job.
+
+        Parameters
+        ----------
+        jobid: str
+            job id, or `jobid_taskid` for a single task of an array job
+        outputs: str, list or dict
+            path(s) produced by the job
+        """
+        if jobid is None or jobid == "":
+            return
+        for path in _flatten_paths(outputs):
+            self._producers.append((path, jobid))
+
+    def dependencies(self, inputs):
+        """
+        Find the jobs producing the given inputs.
+
+        Parameters
+        ----------
+        inputs: str, list or dict
+            path(s) read by a job
+
+        Returns
+        -------
+        str or None
+            comma-separated job ids to be used as slurm dependencies, None if there is no dependency
+        """
+        jobids = []
+        for input_path in _flatten_paths(inputs):
+            for output_path, jobid in self._producers:
+                related = (
+                    input_path == output_path or output_path in input_path.parents or input_path in output_path.parents
+                )
+                if related and jobid not in jobids:
+                    jobids.append(jobid)
+        return ",".join(jobids) if jobids else None
+
+    def clear(self):
+        """
+        Forget all the registered jobs, e.g. once they are over and the following jobs need not wait for them.
+        """
+        self._producers = []
+
+    def __len__(self):
+        return len(self._producers)
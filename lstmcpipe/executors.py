@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+# Execution backends used by `lstmcpipe.utils.SbatchLstMCStage` to run the jobs of the pipeline stages.
+#  - SlurmExecutor: submits every job to a Slurm cluster with `sbatch` (default)
+#  - LocalExecutor: runs every job on the local machine with a pool of processes,
+#    honouring the slurm dependencies, array ranges and `SLURM_ARRAY_TASK_ID` of each job.
+
+import os
+import logging
+import itertools
+import threading
+import subprocess as sp
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+
+log = logging.getLogger(__name__)
+
+
+def parse_array_range(array):
+    """
+    Expand a slurm `--array` specification into the list of task indices.
+
+    Parameters
+    ----------
+    array: str or None
+        e.g. "0-9%100", "0,3,5-7" or "1-9:2". The throttle (`%N`) is ignored.
+
+    Returns
+    -------
+    list: task indices, `[None]` if the job is not an array job
+    """
+    if array is None or str(array) == "":
+        return [None]
+
+    indices = []
+    for item in str(array).split("%")[0].split(","):
+        step = 1
+        if ":" in item:
+            item, step = item.split(":")
+            step = int(step)
+        if "-" in item:
+            first, last = item.split("-")
+            indices.extend(range(int(first), int(last) + 1, step))
+        else:
+            indices.append(int(item))
+    return indices
+
+
+def format_array_range(indices):
+    """
+    Compose a slurm `--array` specification from a list of task indices, the inverse of `parse_array_range`.
+
+    Parameters
+    ----------
+    indices: list of int
+
+    Returns
+    -------
+    str: e.g. "0-3,7,9-10"
+    """
+    ranges = []
+    for index in sorted(set(indices)):
+        if ranges and index == ranges[-1][1] + 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ",".join(f"{first}-{last}" if last != first else f"{first}" for first, last in ranges)
+
+
+def _run_local_task(command, env, output_file, error_file):
+    """
+    Run a single (array) task in a bash shell, the same way sbatch does with `--wrap`.
+    Executed in the worker processes of the `LocalExecutor`.
+
+    Returns
+    -------
+    int: return code of the task
+    """
+    for file in [output_file, error_file]:
+        os.makedirs(os.path.dirname(os.path.abspath(file)), exist_ok=True)
+    with open(output_file, "a") as out, open(error_file, "a") as err:
+        # the command is quoted as in `sbatch --wrap="..."` so that the shell unescapes it identically
+        result = sp.run(f'bash -c "{command}"', shell=True, env=env, stdout=out, stderr=err)
+    return result.returncode
+
+
+class SlurmExecutor:
+    """
+    Submit the jobs to Slurm with `sbatch`. Jobs are not awaited.
+
+    If a `job_limit` and a `submission_queue` are set, the number of jobs of the user in the slurm queue is kept
+    below `job_limit` (the `MaxSubmitJobs` of the account, above which sbatch rejects the jobs): once the limit is
+    reached, the following jobs are queued in the `lstmcpipe.submission_queue.SubmissionQueue` and get a placeholder
+    job id, to be submitted by `lstmcpipe_drain_queue` as capacity frees.
+    """
+
+    name = "slurm"
+    # `lstmcpipe.io.job_store.JobStore` recording the submitted jobs, if any
+    job_store = None
+    # `lstmcpipe.resource_tuning.ResourceTuner` predicting the resources of the stages, if any
+    resource_tuner = None
+    # maximal number of jobs (array tasks included) of the user in the slurm queue, None for no limit
+    job_limit = None
+    # `lstmcpipe.submission_queue.SubmissionQueue` of the jobs above `job_limit`
+    submission_queue = None
+
+    def __init__(self):
+        # jobs may be submitted from several threads, see `lstmcpipe.utils.submit_concurrently`
+        self._lock = threading.Lock()
+        # number of jobs that can still be submitted, refreshed from squeue when exhausted
+        self._capacity = None
+        self.n_queued = 0
+
+    def submit(self, sbatch_stage):
+        """
+        Parameters
+        ----------
+        sbatch_stage: `lstmcpipe.utils.SbatchLstMCStage`
+
+        Returns
+        -------
+        jobid: str
+            slurm job id, or placeholder job id if the job was queued
+        """
+        n_tasks = len(parse_array_range(sbatch_stage.slurm_options.get("array")))
+        return self.submit_command(sbatch_stage.slurm_command, n_tasks=n_tasks)
+
+    def submit_command(self, command, n_tasks=1):
+        """
+        Submit an sbatch command, or queue it if the job limit is reached.
+
+        Parameters
+        ----------
+        command: str
+        n_tasks: int
+            Number of array tasks, counted as jobs by slurm
+
+        Returns
+        -------
+        jobid: str
+        """
+        from .utils import run_command
+
+        if self.job_limit is None or self.submission_queue is None:
+            return run_command(command)
+
+        from .submission_queue import current_job_count
+
+        with self._lock:
+            # jobs are submitted in order: once a job is queued, the following ones are queued after it
+            reserved = False
+            if self.n_queued == 0:
+                if self._capacity is None or self._capacity < n_tasks:
+                    self._capacity = self.job_limit - current_job_count()
+                if n_tasks <= self._capacity:
+                    # the capacity is reserved under the lock, sbatch runs outside of it so that the threads of
+                    # `lstmcpipe.utils.submit_concurrently` submit concurrently
+                    self._capacity -= n_tasks
+                    reserved = True
+            if not reserved:
+                jobid = self.submission_queue.push(command, n_tasks=n_tasks)
+                self.n_queued += 1
+                log.info(f"Job limit of {self.job_limit} reached: job queued as {jobid}")
+                return jobid
+
+        try:
+            return run_command(command)
+        except Exception:
+            with self._lock:
+                self._capacity += n_tasks
+            raise
+
+    def wait(self):
+        """
+        Slurm jobs run on the cluster once submitted, nothing to wait for.
+
+        Returns
+        -------
+        dict: empty
+        """
+        return {}
+
+
+class LocalExecutor:
+    """
+    Run the jobs on the local machine using a pool of `max_workers` processes.
+
+    Each job (and each task of an array job) only starts once all its slurm dependencies have succeeded,
+    reproducing the `afterok` logic. Jobs depending on a failed job are never run.
+    Job ids are integers given in submission order, so that they can be used as slurm dependencies by the
+    following stages, either for the full job (`jobid`) or for a single array task (`jobid_taskid`).
+
+    Parameters
+    ----------
+    max_workers: int or None
+        Number of processes running in parallel. Default: number of CPUs on the machine.
+    """
+
+    name = "local"
+    job_store = None
+    resource_tuner = None
+
+    def __init__(self, max_workers=None):
+        self.max_workers = os.cpu_count() if max_workers is None else int(max_workers)
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._jobids = itertools.count(1)
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, sbatch_stage):
+        """
+        Parameters
+        ----------
+        sbatch_stage: `lstmcpipe.utils.SbatchLstMCStage`
+
+        Returns
+        -------
+        jobid: str
+        """
+        options = sbatch_stage.slurm_options
+        task_ids = parse_array_range(options.get("array"))
+        dependencies = [dep for dep in str(options.get("dependencies") or "").split(",") if dep != ""]
+
+        with self._lock:
+            jobid = str(next(self._jobids))
+            job_future = Future()
+            self._futures[jobid] = job_future
+            task_futures = []
+            for task_id in task_ids:
+                if task_id is not None:
+                    task_future = Future()
+                    self._futures[f"{jobid}_{task_id}"] = task_future
+                    task_futures.append(task_future)
+            dependency_futures = []
+            for dep in dependencies:
+                if dep in self._futures:
+                    dependency_futures.append(self._futures[dep])
+                else:
+                    log.warning(f"Dependency {dep} of local job {jobid} is unknown and will be ignored")
+
+        def launch(dependencies_ok):
+            if not dependencies_ok:
+                log.warning(f"Local job {jobid} ({sbatch_stage.stage}) will not run: a dependency failed")
+                for task_future in task_futures:
+                    task_future.set_result(False)
+                job_future.set_result(False)
+                return
+
+            results = []
+            for ii, task_id in enumerate(task_ids):
+                env = self._task_environment(jobid, task_id, options)
+                output_file = self._log_filename(sbatch_stage.slurm_output, jobid, task_id)
+                error_file = self._log_filename(sbatch_stage.slurm_error, jobid, task_id)
+                process = self._pool.submit(_run_local_task, sbatch_stage.shell_command, env, output_file, error_file)
+                result = Future()
+                process.add_done_callback(self._set_task_result(result))
+                if task_id is not None:
+                    result.add_done_callback(self._forward_result(task_futures[ii]))
+                results.append(result)
+
+            self._when_done(results, job_future.set_result)
+
+        self._when_done(dependency_futures, launch)
+        log.debug(f"Local job {jobid} ({sbatch_stage.stage}) with {len(task_ids)} task(s) queued")
+        return jobid
+
+    def wait(self):
+        """
+        Block until all the submitted jobs are over and shut down the pool of processes.
+
+        Returns
+        -------
+        dict: {jobid: True if the job succeeded, False otherwise}
+        """
+        while True:
+            with self._lock:
+                futures = dict(self._futures)
+            wait(futures.values())
+            with self._lock:
+                if len(futures) == len(self._futures):
+                    break
+        self._pool.shutdown()
+        status = {jobid: future.result() for jobid, future in futures.items()}
+        failed = [jobid for jobid, ok in status.items() if not ok]
+        if failed:
+            log.warning(f"Local jobs failed or not run: {','.join(failed)}")
+        return status
+
+    @staticmethod
+    def _task_environment(jobid, task_id, options):
+        env = dict(os.environ)
+        env["SLURM_JOB_ID"] = jobid
+        env["SLURM_CPUS_PER_TASK"] = str(options.get("cpus-per-task", 1))
+        if task_id is not None:
+            env["SLURM_ARRAY_JOB_ID"] = jobid
+            env["SLURM_ARRAY_TASK_ID"] = str(task_id)
+        return env
+
+    @staticmethod
+    def _log_filename(pattern, jobid, task_id):
+        filename = str(pattern).replace("%A", jobid).replace("%j", jobid)
+        return filename.replace("%a", "" if task_id is None else str(task_id))
+
+    @staticmethod
+    def _set_task_result(result):
+        def callback(process):
+            result.set_result(process.exception() is None and process.result() == 0)
+
+        return callback
+
+    @staticmethod
+    def _forward_result(target):
+        def callback(future):
+            target.set_result(future.result())
+
+        return callback
+
+    @staticmethod
+    def _when_done(futures, callback):
+        """
+        Call `callback(all_succeeded)` once all the `futures` are done.
+        """
+        futures = list(futures)
+        if not futures:
+            callback(True)
+            return
+
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                callback(all(future.result() for future in futures))
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+
+def get_executor(executor=None):
+    """
+    Return the executor corresponding to the `executor` entry of the lstmcpipe config.
+
+    Parameters
+    ----------
+    executor: None, str, dict or executor instance
+        - None or "slurm": `SlurmExecutor`
+        - "local" or {"name": "local", "max_workers": N}: `LocalExecutor`
+        - an executor instance is returned as is, so that all stages share it
+
+    Returns
+    -------
+    `SlurmExecutor` or `LocalExecutor`
+    """
+    if executor is None:
+        return SlurmExecutor()
+    if isinstance(executor, (SlurmExecutor, LocalExecutor)):
+        return executor
+
+    options = dict(executor) if isinstance(executor, dict) else {"name": executor}
+    name = options.pop("name", "slurm")
+    if name == "slurm":
+        return SlurmExecutor()
+    elif name == "local":
+        return LocalExecutor(**options)
+    else:
+        raise ValueError(f"Unknown executor {name}. Valid executors are: slurm, local")
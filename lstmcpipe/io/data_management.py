@@ -6,6 +6,8 @@ import shutil
 from pathlib import Path
 from distutils.util import strtobool
 
+from .file_catalog import get_file_catalog
+
 
 def query_yes_no(question, default="yes"):
     """
@@ -94,10 +96,16 @@ def get_input_filelist(data_path, glob_pattern=None):
     glob_pattern: str
         Glob the given pattern. To Glob recursively, add "**/" in front of the string
 
+    If a file catalog is in use (see `lstmcpipe.io.file_catalog.use_file_catalog`), the files matching a
+    non-recursive pattern are taken from the catalog, which lists the directory only if it changed.
+
     Returns
     -------
     list
     """
+    catalog = get_file_catalog()
+    if catalog is not None and glob_pattern is not None and "/" not in str(glob_pattern):
+        return catalog.list_files(data_path, pattern=str(glob_pattern))
     if glob_pattern is None:
         _path = Path(data_path).iterdir()
     else:
@@ -126,8 +134,8 @@ def check_and_make_dir(directory):
     os.makedirs(directory, exist_ok=True)
 
 
-def check_and_make_dir_without_verification(directory):
-    if os.path.exists(directory) and os.listdir(directory) != []:
+def check_and_make_dir_without_verification(directory, keep_content=False):
+    if os.path.exists(directory) and os.listdir(directory) != [] and not keep_content:
         shutil.rmtree(directory)
     os.makedirs(directory, exist_ok=True)
 
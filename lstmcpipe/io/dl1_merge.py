@@ -0,0 +1,708 @@
+#!/usr/bin/env python
+
+# Merge of DL1 files listed in `.list` manifests, used by `lstmcpipe_merge_dl1`.
+# The `.list` manifests are written by the metadata-only train/test split (`lstmcpipe_train_test_split
+# --train_list --test_list`): the DL1 files stay in their directory and the merge reads them from the lists.
+# The inputs of each merged file (size and modification time) are recorded next to it in `{merged}.inputs.json`,
+# so that the files added later to the inputs can be appended to it (`incremental_merge_dl1_files`).
+# A virtual merge (`virtual_merge_dl1_files`) writes a lightweight file of HDF5 virtual datasets concatenating the
+# tables of the inputs instead of copying them.
+# The merged training files can keep only the parameters used by the training (`training_columns`) and a
+# stratified subsample of the events (`stratified_subsample`), applied to all the per-event tables
+# (`subsampled_keys`). The per-run tables (configuration, run config, shower distribution) are kept whole.
+
+import os
+import json
+import logging
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+LIST_SUFFIX = ".list"
+INPUTS_SUFFIX = ".inputs.json"
+# partial files of the merge trees, see `lstmcpipe.stages.mc_merge_dl1.merge_tree_levels`
+PART_SUFFIX = ".part"
+# marker written instead of the partial file by the tasks of a merge tree with nothing to merge
+EMPTY_SUFFIX = ".empty"
+# groups copied from the first input by the virtual merge instead of being concatenated
+VIRTUAL_MERGE_COPIED_GROUPS = ["/configuration"]
+DL1_IMAGES_GROUP = "/dl1/event/telescope/image"
+DL1_PARAMETERS_KEY = "/dl1/event/telescope/parameters/LST_LSTCam"
+# parameters needed by `lstchain_mc_trainpipe` besides the features and the events filters of the config:
+# identifiers, MC truth and training targets, pointing and the columns used to reconstruct the source position
+TRAINING_COLUMNS = [
+    "obs_id",
+    "event_id",
+    "tel_id",
+    "event_type",
+    "mc_type",
+    "mc_energy",
+    "log_mc_energy",
+    "mc_alt",
+    "mc_az",
+    "mc_core_x",
+    "mc_core_y",
+    "mc_h_first_int",
+    "mc_x_max",
+    "src_x",
+    "src_y",
+    "disp_dx",
+    "disp_dy",
+    "disp_norm",
+    "disp_angle",
+    "disp_sign",
+    "x",
+    "y",
+    "psi",
+    "intensity",
+    "alt_tel",
+    "az_tel",
+]
+SUBSAMPLING_KEY = "/dl1/event/telescope/subsampling/LST_LSTCam"
+# the subsampling strata are made of the events of the same bin of true energy, pointing node and particle type
+ENERGY_BINS_PER_DECADE = 5
+# rounding of the pointing in rad (about 0.06 deg), much smaller than the distance between the pointing nodes
+POINTING_DECIMALS = 3
+# groups of the per-event tables, subsampled with the parameters table
+EVENT_GROUPS = ("dl1/event/", "simulation/event/")
+
+
+class IncrementalMergeError(RuntimeError):
+    """
+    The inputs already merged changed: the merged file must be merged again from scratch.
+    """
+
+
+class DL1SchemaError(ValueError):
+    """
+    The datasets of DL1 files to merge are not compatible.
+    """
+
+
+def is_file_list(path):
+    """
+    Whether a stage input is a `.list` manifest (or a list of manifests) instead of a directory.
+    """
+    if isinstance(path, (list, tuple)):
+        return len(path) > 0 and all(is_file_list(p) for p in path)
+    return isinstance(path, (str, Path)) and str(path).endswith(LIST_SUFFIX)
+
+
+def read_file_lists(list_files):
+    """
+    Files listed in `.list` manifests, one path per line.
+
+    Parameters
+    ----------
+    list_files: list of str or Path
+
+    Returns
+    -------
+    list of str: the listed files, in order, without duplicates
+    """
+    files = {}
+    for list_file in list_files:
+        with open(list_file) as file:
+            for line in file:
+                if line.strip():
+                    files[line.strip()] = None
+    return list(files)
+
+
+def write_file_list(files, filename):
+    """
+    Write a `.list` manifest, one path per line. The file is replaced atomically.
+    """
+    filename = Path(filename)
+    filename.parent.mkdir(exist_ok=True, parents=True)
+    tmp_file = filename.with_name(f".{filename.name}.tmp")
+    with open(tmp_file, "w") as file:
+        for path in files:
+            file.write(f"{path}\n")
+    tmp_file.replace(filename)
+
+
+def training_columns(config_file):
+    """
+    Parameters used by the training with a lstchain config: the `*_features` (energy regression, disp regression
+    and classification, particle classification), the parameters of the `events_filters` and `TRAINING_COLUMNS`.
+    The config is completed by the lstchain standard config, as `lstchain_mc_trainpipe` does.
+
+    Parameters
+    ----------
+    config_file: str or Path
+
+    Returns
+    -------
+    set of str
+    """
+    from lstchain.io.config import get_standard_config, read_configuration_file, replace_config
+
+    config = replace_config(get_standard_config(), read_configuration_file(config_file))
+    columns = set(TRAINING_COLUMNS)
+    for key, value in config.items():
+        if key.endswith("_features"):
+            columns.update(value)
+    columns.update(config.get("events_filters", {}))
+    return columns
+
+
+def _projected_rows(node, columns, mask=None):
+    from numpy.lib.recfunctions import repack_fields
+
+    rows = node.read()
+    return repack_fields(rows[list(columns)] if mask is None else rows[list(columns)][mask])
+
+
+def write_projected_table(files, output_file, key, columns=None, masks=None):
+    """
+    Concatenate a table of DL1 files into `output_file`, keeping only the `columns` of the table and the rows
+    selected by `masks`. The columns missing in the table of the first file are ignored.
+
+    Parameters
+    ----------
+    files: list of str
+    output_file: str or Path
+    key: str
+        path of the table
+    columns: set of str or None
+        all the columns if None
+    masks: list of numpy.ndarray or None
+        rows of the table of each file to keep, see `subsample_dl1_files`
+    """
+    import tables
+
+    key = "/" + key.strip("/")
+    where, name = key.rsplit("/", 1)
+    with tables.open_file(output_file, "a") as merged:
+        table = None
+        for ifile, filename in enumerate(files):
+            with tables.open_file(filename) as source:
+                node = source.get_node(key)
+                mask = None if masks is None else masks[ifile]
+                if table is None:
+                    kept = [column for column in node.colnames if columns is None or column in columns]
+                    log.info(f"Keeping {len(kept)} columns of {len(node.colnames)} in {key}")
+                    table = merged.create_table(
+                        where, name, _projected_rows(node, kept, mask), createparents=True, filters=node.filters
+                    )
+                    for attr in node.attrs._f_list("user"):
+                        table.attrs[attr] = node.attrs[attr]
+                else:
+                    table.append(_projected_rows(node, table.colnames, mask))
+
+
+def stratified_subsample(events, max_events, seed=0):
+    """
+    Select at most about `max_events` events, stratified by true energy, pointing node and particle type:
+    every stratum keeps a share of the events proportional to its size (largest remainder method), and at least
+    one event, so that the energy and pointing coverage of the sample is kept.
+
+    Parameters
+    ----------
+    events: numpy structured array
+        with the columns `mc_energy`, `alt_tel`, `az_tel` and `mc_type`
+    max_events: int
+    seed: int
+        seed of the random selection of the events in each stratum
+
+    Returns
+    -------
+    mask: numpy.ndarray of bool
+        the selected events
+    weights: numpy.ndarray
+        inverse of the selection probability of the selected events: size of their stratum / number of events kept
+    n_strata: int
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        energy_bins = np.floor(np.log10(events["mc_energy"]) * ENERGY_BINS_PER_DECADE)
+    strata = np.rec.fromarrays(
+        [
+            np.nan_to_num(energy_bins, nan=-1e9, neginf=-1e9).astype(np.int64),
+            np.round(events["alt_tel"], POINTING_DECIMALS),
+            np.round(events["az_tel"], POINTING_DECIMALS),
+            events["mc_type"],
+        ]
+    )
+    _, strata_ids, counts = np.unique(strata, return_inverse=True, return_counts=True)
+    strata_ids = strata_ids.ravel()
+    n_events = len(events)
+    if n_events <= max_events:
+        return np.ones(n_events, dtype=bool), np.ones(n_events), len(counts)
+
+    expected = counts * max_events / n_events
+    quotas = np.floor(expected).astype(np.int64)
+    n_missing = max_events - quotas.sum()
+    quotas[np.argsort(quotas - expected, kind="stable")[:n_missing]] += 1
+    quotas = np.maximum(quotas, 1)
+
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(n_events), strata_ids))
+    first_of_stratum = np.cumsum(counts) - counts
+    rank = np.empty(n_events, dtype=np.int64)
+    rank[order] = np.arange(n_events) - first_of_stratum[strata_ids[order]]
+    mask = rank < quotas[strata_ids]
+    return mask, (counts / quotas)[strata_ids[mask]], len(counts)
+
+
+def subsample_dl1_files(files, max_events, seed=0):
+    """
+    Stratified subsample of the events of DL1 files, see `stratified_subsample`.
+
+    Parameters
+    ----------
+    files: list of str
+    max_events: int
+    seed: int
+
+    Returns
+    -------
+    masks: list of numpy.ndarray
+        events of each file to keep
+    subsampling: numpy structured array
+        `obs_id`, `event_id` and `weight` of the events kept
+    metadata: dict
+    """
+    import tables
+
+    columns = ["obs_id", "event_id", "mc_energy", "alt_tel", "az_tel", "mc_type"]
+    events = []
+    for filename in files:
+        with tables.open_file(filename) as file:
+            node = file.get_node(DL1_PARAMETERS_KEY)
+            events.append(np.rec.fromarrays([node.col(column) for column in columns], names=columns))
+    n_file_events = [len(file_events) for file_events in events]
+    events = np.concatenate(events)
+    mask, weights, n_strata = stratified_subsample(events, max_events, seed)
+    masks = np.split(mask, np.cumsum(n_file_events)[:-1])
+    subsampling = np.rec.fromarrays(
+        [events["obs_id"][mask], events["event_id"][mask], weights], names=["obs_id", "event_id", "weight"]
+    )
+    metadata = {
+        "max_events": max_events,
+        "seed": seed,
+        "n_events": len(events),
+        "n_kept": int(mask.sum()),
+        "n_strata": n_strata,
+        "energy_bins_per_decade": ENERGY_BINS_PER_DECADE,
+        "pointing_decimals": POINTING_DECIMALS,
+    }
+    log.info(f"Keeping {metadata['n_kept']} events of {len(events)} in {n_strata} strata")
+    return masks, subsampling, metadata
+
+
+def subsampled_keys(files, dataset_keys, n_events):
+    """
+    Per-event tables subsampled with the same masks as the parameters table: the tables of `EVENT_GROUPS` with
+    one row per event of the parameters table in every file. The other tables (per-run tables, monitoring) are
+    merged whole.
+
+    Parameters
+    ----------
+    files: list of str
+    dataset_keys: list of str
+        keys of the datasets of the files, without leading "/"
+    n_events: list of int
+        number of events of the parameters table of each file
+
+    Returns
+    -------
+    list of str
+    """
+    import tables
+
+    keys = [
+        key
+        for key in dataset_keys
+        if key.startswith(EVENT_GROUPS) and key not in (DL1_PARAMETERS_KEY.strip("/"), SUBSAMPLING_KEY.strip("/"))
+    ]
+    for filename, n_file_events in zip(files, n_events):
+        with tables.open_file(filename) as file:
+            keys = [
+                key
+                for key in keys
+                if f"/{key}" in file
+                and isinstance(file.get_node(f"/{key}"), tables.Table)
+                and file.get_node(f"/{key}").nrows == n_file_events
+            ]
+    whole = [key for key in dataset_keys if key.startswith(EVENT_GROUPS) and key not in keys]
+    if whole:
+        log.info(f"Event tables without one row per event, merged whole: {', '.join(whole)}")
+    return keys
+
+
+def write_subsampling_table(output_file, subsampling, metadata):
+    """
+    Write the weights of the events kept by the subsampling in `SUBSAMPLING_KEY`, with the metadata of the
+    subsampling as attributes.
+    """
+    import tables
+
+    where, name = SUBSAMPLING_KEY.rsplit("/", 1)
+    with tables.open_file(output_file, "a") as merged:
+        table = merged.create_table(where, name, subsampling, createparents=True)
+        for key, value in metadata.items():
+            table.attrs[key] = value
+
+
+def merge_dl1_files(files, output_file, no_image=False, progress_bar=True, columns=None, max_events=None, seed=0):
+    """
+    Merge DL1 files with lstchain, as `lstchain_merge_hdf5_files`.
+
+    Parameters
+    ----------
+    files: list of str
+    output_file: str or Path
+    no_image: bool
+        Do not merge the images
+    progress_bar: bool
+    columns: set of str or None
+        Only keep these columns of the parameters table, see `training_columns`
+    max_events: int or None
+        Only keep a stratified subsample of about `max_events` events, see `stratified_subsample`. The weights of
+        the events kept and the metadata of the subsampling are written in `SUBSAMPLING_KEY`. All the per-event
+        tables are subsampled, see `subsampled_keys`.
+    seed: int
+        Seed of the subsampling
+    """
+    from lstchain.io.io import auto_merge_h5files, get_dataset_keys, dl1_images_lstcam_key
+
+    if not files:
+        raise ValueError(f"No DL1 file to merge into {output_file}")
+    dataset_keys = [key.strip("/") for key in get_dataset_keys(files[0])]
+    images_key = dl1_images_lstcam_key.strip("/")
+    skipped_keys = []
+    if no_image:
+        skipped_keys.append(images_key)
+    if columns is not None or max_events is not None:
+        skipped_keys.append(DL1_PARAMETERS_KEY.strip("/"))
+    masks, masked_keys = None, []
+    if max_events is not None:
+        skipped_keys.append(SUBSAMPLING_KEY.strip("/"))
+        masks, subsampling, metadata = subsample_dl1_files(files, max_events, seed=seed)
+        masked_keys = subsampled_keys(
+            files, [key for key in dataset_keys if key not in skipped_keys], [len(mask) for mask in masks]
+        )
+        skipped_keys.extend(masked_keys)
+    nodes_keys = None
+    if skipped_keys:
+        nodes_keys = [key for key in dataset_keys if key not in skipped_keys]
+    log.info(f"Merging {len(files)} DL1 files into {output_file}")
+    auto_merge_h5files(files, Path(output_file).as_posix(), nodes_keys=nodes_keys, progress_bar=progress_bar)
+
+    if masks is not None:
+        write_subsampling_table(output_file, subsampling, metadata)
+        for key in masked_keys:
+            write_projected_table(files, output_file, key, masks=masks)
+    if columns is not None or masks is not None:
+        write_projected_table(files, output_file, DL1_PARAMETERS_KEY, columns, masks)
+    write_merged_inputs(output_file, input_records(files))
+
+
+def inputs_record_path(merged_file):
+    merged_file = Path(merged_file)
+    return merged_file.with_name(merged_file.name + INPUTS_SUFFIX)
+
+
+def file_record(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def input_records(files):
+    """
+    Size and modification time of the inputs of a merge, as {resolved path: record}.
+    The inputs of the partial files of a merge tree are recorded instead of the partial files.
+    """
+    records = {}
+    for file in files:
+        if str(file).endswith(PART_SUFFIX) and inputs_record_path(file).exists():
+            records.update(read_merged_inputs(file)["inputs"])
+        else:
+            records[Path(file).resolve().as_posix()] = file_record(file)
+    return records
+
+
+def write_merged_inputs(merged_file, records, complete=True):
+    """
+    Record the inputs of a merged file.
+
+    Parameters
+    ----------
+    merged_file: str or Path
+    records: dict
+        {path: {"size", "mtime"}}, see `input_records`
+    complete: bool
+        False while files are appended to the merged file
+    """
+    record_file = inputs_record_path(merged_file)
+    tmp_file = record_file.with_name(record_file.name + ".tmp")
+    with open(tmp_file, "w") as file:
+        json.dump({"updated": datetime.now().isoformat(), "complete": complete, "inputs": records}, file)
+    tmp_file.replace(record_file)
+
+
+def read_merged_inputs(merged_file):
+    """
+    Recorded inputs of a merged file, None if they were not recorded.
+
+    Returns
+    -------
+    dict: {"updated", "complete", "inputs": {path: {"size", "mtime"}}}
+    """
+    record_file = inputs_record_path(merged_file)
+    if not record_file.exists():
+        return None
+    with open(record_file) as file:
+        return json.load(file)
+
+
+def append_dl1_files(files, merged_file):
+    """
+    Append the rows of the tables of DL1 files to the tables of a merged file, as `auto_merge_h5files` does for all
+    the files after the first one. The configuration is not merged. Only the columns of the tables of the merged
+    file are appended, so that the merged files keeping only the training columns stay consistent.
+    """
+    import tables
+
+    with tables.open_file(merged_file, "a") as merged:
+        keys = [
+            node._v_pathname
+            for node in merged.walk_nodes("/", classname="Table")
+            if not node._v_pathname.startswith("/configuration")
+        ]
+        for filename in files:
+            with tables.open_file(filename) as source:
+                missing = [key for key in keys if key not in source]
+                if missing:
+                    raise IncrementalMergeError(f"{filename} can not be appended to {merged_file}, it misses {missing}")
+                for key in keys:
+                    table = merged.get_node(key)
+                    table.append(_projected_rows(source.get_node(key), table.colnames))
+
+
+def incremental_merge_dl1_files(files, output_file, no_image=False, progress_bar=True, columns=None):
+    """
+    Append to an existing merged file only the inputs that were not merged yet.
+    The merged file is merged from scratch if its inputs were not recorded.
+
+    Parameters
+    ----------
+    files: list of str
+        All the inputs, already merged or not
+    output_file: str or Path
+    no_image: bool
+        Do not merge the images, for a merge from scratch
+    progress_bar: bool
+    columns: set of str or None
+        Only keep these columns of the parameters table, for a merge from scratch
+
+    Returns
+    -------
+    int: number of files merged or appended
+
+    Raises
+    ------
+    IncrementalMergeError
+        if an input already merged was modified or removed, or if a previous append was interrupted
+    """
+    recorded = read_merged_inputs(output_file) if Path(output_file).exists() else None
+    if recorded is None:
+        log.info(f"No record of the inputs of {output_file}, merged from scratch")
+        merge_dl1_files(files, output_file, no_image=no_image, progress_bar=progress_bar, columns=columns)
+        return len(files)
+    if not recorded["complete"]:
+        raise IncrementalMergeError(f"A previous append to {output_file} was interrupted, merge it from scratch")
+
+    current = {Path(file).resolve().as_posix(): file for file in files}
+    changed = [
+        path
+        for path, record in recorded["inputs"].items()
+        if path not in current or not os.path.exists(path) or file_record(path) != record
+    ]
+    if changed:
+        raise IncrementalMergeError(
+            f"{len(changed)} inputs of {output_file} were modified or removed since they were merged "
+            f"(e.g. {changed[:3]}), merge it from scratch"
+        )
+    new_files = [file for path, file in current.items() if path not in recorded["inputs"]]
+    if not new_files:
+        log.info(f"No new file to append to {output_file}")
+        return 0
+
+    log.info(f"Appending {len(new_files)} DL1 files to {output_file}")
+    write_merged_inputs(output_file, recorded["inputs"], complete=False)
+    append_dl1_files(new_files, output_file)
+    records = dict(recorded["inputs"])
+    records.update(input_records(new_files))
+    write_merged_inputs(output_file, records)
+    return len(new_files)
+
+
+def _in_groups(path, groups):
+    return any(path == group or path.startswith(group + "/") for group in groups)
+
+
+def dl1_datasets(filename, skipped_groups=()):
+    """
+    Datasets of an HDF5 file as {path: (dtype, shape)}, without the ones in `skipped_groups`.
+    """
+    import h5py
+
+    datasets = {}
+
+    def visit(name, node):
+        path = "/" + name
+        if isinstance(node, h5py.Dataset) and not _in_groups(path, skipped_groups):
+            datasets[path] = (node.dtype, node.shape)
+
+    with h5py.File(filename, "r") as file:
+        file.visititems(visit)
+    return datasets
+
+
+def check_dl1_schemas(files, skipped_groups=()):
+    """
+    Check that DL1 files can be concatenated: every dataset of the first file must exist in all the files, with the
+    same dtype (same fields in the same order for tables) and the same shape except along the first axis.
+    The scalar datasets are only taken from the first file.
+    The datasets of the other files missing in the first one are ignored by the merge and only logged.
+
+    Parameters
+    ----------
+    files: list of str
+    skipped_groups: list of str
+        groups not checked
+
+    Returns
+    -------
+    dict: datasets of each file, {file: {path: (dtype, shape)}}
+
+    Raises
+    ------
+    DL1SchemaError
+        listing all the incompatibilities found
+    """
+    if not files:
+        raise DL1SchemaError("No DL1 file to check")
+    schemas = {file: dl1_datasets(file, skipped_groups) for file in files}
+    reference = schemas[files[0]]
+    errors = []
+    for file in files[1:]:
+        for path, (dtype, shape) in reference.items():
+            if path not in schemas[file]:
+                errors.append(f"{file} misses {path}")
+            elif schemas[file][path][0] != dtype:
+                errors.append(f"{path} of {file} has dtype {schemas[file][path][0]} instead of {dtype}")
+            elif schemas[file][path][1][1:] != shape[1:]:
+                errors.append(f"{path} of {file} has shape {schemas[file][path][1]} instead of {shape}")
+        extra = set(schemas[file]) - set(reference)
+        if extra:
+            log.warning(f"{sorted(extra)} of {file} are not in {files[0]}, they are not merged")
+    if errors:
+        raise DL1SchemaError(
+            f"{len(errors)} incompatibilities between the DL1 files to merge:\n" + "\n".join(errors[:20])
+        )
+    return schemas
+
+
+def virtual_merge_dl1_files(files, output_file, no_image=False):
+    """
+    Merge DL1 files without copying their tables: every dataset of the output is an HDF5 virtual dataset
+    concatenating the datasets of the inputs, readable as a usual table by pytables and pandas.
+    The groups `VIRTUAL_MERGE_COPIED_GROUPS` (configuration, subarray description) are copied from the first file,
+    as `auto_merge_h5files` does, as well as the attributes of the root and of the groups.
+    The input files must not be moved or removed as long as the merged file is used.
+
+    Parameters
+    ----------
+    files: list of str
+    output_file: str or Path
+    no_image: bool
+        Do not merge the images
+
+    Raises
+    ------
+    DL1SchemaError
+        if the datasets of the files are not compatible, see `check_dl1_schemas`
+    """
+    import h5py
+
+    skipped_groups = VIRTUAL_MERGE_COPIED_GROUPS + ([DL1_IMAGES_GROUP] if no_image else [])
+    schemas = check_dl1_schemas(files, skipped_groups)
+    # the virtual sources are found whatever the directory the merged file is read from
+    sources = [Path(file).resolve().as_posix() for file in files]
+    log.info(f"Virtual merge of {len(files)} DL1 files into {output_file}")
+
+    output_file = Path(output_file)
+    output_file.parent.mkdir(exist_ok=True, parents=True)
+    with h5py.File(files[0], "r") as first, h5py.File(output_file, "w") as merged:
+        merged.attrs.update(first.attrs)
+        for group in VIRTUAL_MERGE_COPIED_GROUPS:
+            if group in first:
+                first.copy(first[group], merged, name=group)
+        for path, (dtype, shape) in schemas[files[0]].items():
+            if shape == ():
+                first.copy(first[path], merged, name=path)
+                continue
+            lengths = [schemas[file][path][1][0] for file in files]
+            layout = h5py.VirtualLayout(shape=(sum(lengths),) + shape[1:], dtype=dtype)
+            stops = np.cumsum(lengths)
+            for source, file, start, stop in zip(sources, files, stops - lengths, stops):
+                layout[start:stop] = h5py.VirtualSource(source, path, shape=schemas[file][path][1])
+            dataset = merged.create_virtual_dataset(path, layout)
+            dataset.attrs.update(first[path].attrs)
+            parent = first[path].parent
+            while parent.name != "/":
+                merged[parent.name].attrs.update(parent.attrs)
+                parent = parent.parent
+    write_merged_inputs(output_file, input_records(files))
+
+
+def non_empty_parts(files):
+    """
+    Partial files of a merge tree, without the ones of the empty groups (marked by a `{part}.empty` file).
+
+    Parameters
+    ----------
+    files: list of str
+
+    Returns
+    -------
+    list of str
+
+    Raises
+    ------
+    FileNotFoundError: if a partial file is missing without empty marker, i.e. its task failed
+    """
+    parts = []
+    for file in files:
+        if Path(file).exists():
+            parts.append(file)
+        elif not Path(f"{file}{EMPTY_SUFFIX}").exists():
+            raise FileNotFoundError(f"{file} not found: the task merging it failed")
+    return parts
+
+
+def select_group(files, group, n_groups):
+    """
+    Files of a group of the merge tree: the sorted files are split into `n_groups` contiguous groups of equal size
+    (within one file), so that every file belongs to exactly one group whatever the number of files.
+
+    Parameters
+    ----------
+    files: list of str
+    group: int
+        index of the group, from 0 to n_groups - 1
+    n_groups: int
+
+    Returns
+    -------
+    list of str
+    """
+    files = sorted(files)
+    start = group * len(files) // n_groups
+    stop = (group + 1) * len(files) // n_groups
+    return files[start:stop]
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+
+# SQLite catalog of the MC files, shared by the productions.
+# The files of a directory are listed once with `os.scandir` and recorded with their size, modification time and the
+# production, particle, pointing and data level parsed from their path. The listing is reused as long as the
+# modification time of the directory is unchanged (files added, removed or moved update it), so that the stages and
+# `get_input_filelist` query the catalog instead of listing the same Lustre directories again. As the modification
+# times have a 1 s resolution on Lustre, a directory modified less than `MTIME_RESOLUTION` before its listing is
+# listed again.
+# The event count and checksum of the files are computed on demand (`FileCatalog.describe`) and kept until the file
+# changes.
+
+import os
+import re
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from fnmatch import fnmatch
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_FILE = (
+    Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser().joinpath("lstmcpipe", "file_catalog.sqlite")
+)
+DATA_LEVELS = ("R0", "DL0", "DL1", "DL2", "DL3", "IRF")
+PARTICLES = (
+    "gamma",
+    "gamma-diffuse",
+    "gamma_diffuse",
+    "gammadiffuse",
+    "proton",
+    "protons",
+    "electron",
+    "electrons",
+)
+POINTING_PATTERN = re.compile(r"(.*theta_.+?_az_.+?_|.*_pointing)$")
+# tables of the DL1 files whose number of rows is the number of events, in order of preference
+EVENT_TABLES = (
+    "/dl1/event/telescope/parameters/LST_LSTCam",
+    "/dl1/event/subarray/trigger",
+    "/simulation/event/subarray/shower",
+)
+CHECKSUM_CHUNK_SIZE = 16 * 1024 * 1024
+# resolution of the modification times of the file system, in seconds
+MTIME_RESOLUTION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    directory TEXT,
+    name TEXT,
+    path TEXT,
+    size INTEGER,
+    mtime REAL,
+    production TEXT,
+    particle TEXT,
+    pointing TEXT,
+    data_level TEXT,
+    n_events INTEGER,
+    checksum TEXT,
+    PRIMARY KEY (directory, name)
+);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+CREATE INDEX IF NOT EXISTS files_query ON files (data_level, production, particle, pointing);
+CREATE TABLE IF NOT EXISTS directories (
+    directory TEXT PRIMARY KEY,
+    mtime REAL,
+    scanned REAL
+);
+"""
+QUERY_FIELDS = ("production", "particle", "pointing", "data_level")
+
+
+def parse_mc_path(path):
+    """
+    Production, particle, pointing and data level of a MC file, parsed from the directory names of its path,
+    e.g. `/fefs/aswg/data/mc/DL1/AllSky/{prod_id}/TrainingDataset/{particle}/{dec}/{pointing}/file.h5`.
+
+    Returns
+    -------
+    dict: {"production", "particle", "pointing", "data_level"}, None for the fields not found in the path
+    """
+    parts = Path(path).parent.parts
+    fields = dict.fromkeys(QUERY_FIELDS)
+    for ii, part in enumerate(parts):
+        if fields["data_level"] is None and part in DATA_LEVELS:
+            fields["data_level"] = part
+            following = [p for p in parts[ii:][1:] if p != "AllSky"]
+            fields["production"] = following[0] if following else None
+        elif part.lower() in PARTICLES:
+            fields["particle"] = part
+        elif POINTING_PATTERN.match(part):
+            fields["pointing"] = part
+    return fields
+
+
+def file_checksum(path):
+    """
+    MD5 checksum of a file.
+    """
+    md5 = hashlib.md5()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHECKSUM_CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def count_events(path):
+    """
+    Number of events of a DL1 file, None for the other files.
+    """
+    if not str(path).endswith(".h5"):
+        return None
+    import tables
+
+    try:
+        with tables.open_file(path) as file:
+            for key in EVENT_TABLES:
+                if key in file:
+                    return file.get_node(key).nrows
+    except (OSError, tables.HDF5ExtError) as e:
+        log.warning(f"Could not count the events of {path}: {e}")
+    return None
+
+
+class FileCatalog:
+    """
+    SQLite catalog of the MC files.
+
+    Parameters
+    ----------
+    filename: str or Path
+        SQLite database, created if needed
+    """
+
+    def __init__(self, filename=DEFAULT_CATALOG_FILE):
+        self.filename = Path(filename)
+        self.filename.parent.mkdir(exist_ok=True, parents=True)
+        self._lock = threading.Lock()
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.filename, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def update(self, directory):
+        """
+        List the files of a directory if it changed since the last listing, or if it was modified less than
+        `MTIME_RESOLUTION` before the last listing (files may have been added after the listing within the same
+        mtime).
+
+        Parameters
+        ----------
+        directory: str or Path
+
+        Returns
+        -------
+        str: resolved directory, None if it does not exist
+        """
+        directory = os.path.realpath(directory)
+        try:
+            mtime = os.stat(directory).st_mtime
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT mtime, scanned FROM directories WHERE directory = ?", (directory,)
+            ).fetchone()
+        if row is not None and row[0] == mtime and mtime < row[1] - MTIME_RESOLUTION:
+            return directory
+
+        entries = []
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                path = os.path.realpath(entry.path) if entry.is_symlink() else entry.path
+                entries.append((entry.name, path, stat.st_size, stat.st_mtime))
+
+        with self._lock, self._connect() as connection:
+            known = {
+                name: (size, file_mtime, n_events, checksum)
+                for name, size, file_mtime, n_events, checksum in connection.execute(
+                    "SELECT name, size, mtime, n_events, checksum FROM files WHERE directory = ?", (directory,)
+                )
+            }
+            rows = []
+            for name, path, size, file_mtime in entries:
+                n_events, checksum = None, None
+                if name in known and known[name][:2] == (size, file_mtime):
+                    n_events, checksum = known[name][2:]
+                fields = parse_mc_path(os.path.join(directory, name))
+                rows.append(
+                    (directory, name, path, size, file_mtime)
+                    + tuple(fields[key] for key in QUERY_FIELDS)
+                    + (n_events, checksum)
+                )
+            connection.execute("DELETE FROM files WHERE directory = ?", (directory,))
+            connection.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?)", (directory, mtime, time.time()))
+        log.debug(f"{len(rows)} files listed in {directory}")
+        return directory
+
+    def update_tree(self, directory):
+        """
+        `update` a directory and all its sub-directories.
+
+        Returns
+        -------
+        int: number of directories catalogued
+        """
+        n_directories = 0
+        to_update = [directory]
+        while to_update:
+            resolved = self.update(to_update.pop())
+            if resolved is None:
+                continue
+            n_directories += 1
+            with os.scandir(resolved) as scan:
+                to_update.extend(entry.path for entry in scan if entry.is_dir(follow_symlinks=False))
+        return n_directories
+
+    def list_files(self, directory, pattern="*"):
+        """
+        Resolved paths of the files of `directory` whose name matches the glob `pattern`.
+        """
+        resolved = self.update(directory)
+        if resolved is None:
+            return []
+        with self._connect() as connection:
+            rows = connection.execute("SELECT name, path FROM files WHERE directory = ? ORDER BY name", (resolved,))
+            return [path for name, path in rows if fnmatch(name, pattern)]
+
+    def query(self, pattern=None, directory=None, **fields):
+        """
+        Catalogued files.
+
+        Parameters
+        ----------
+        pattern: str or None
+            glob pattern on the file names
+        directory: str or Path or None
+            only the files of this directory and of its sub-directories (already catalogued)
+        fields:
+            `production`, `particle`, `pointing` or `data_level` of the files
+
+        Returns
+        -------
+        list of dict: one record per file, with the columns of the `files` table
+        """
+        unknown = set(fields) - set(QUERY_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields {unknown}, the files can be queried by {QUERY_FIELDS}")
+        conditions = [f"{key} = ?" for key in fields]
+        values = list(fields.values())
+        if directory is not None:
+            directory = os.path.realpath(directory)
+            conditions.append("(directory = ? OR directory LIKE ?)")
+            values += [directory, os.path.join(directory, "%")]
+        query = "SELECT * FROM files"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._connect() as connection:
+            connection.row_factory = sqlite3.Row
+            records = [dict(row) for row in connection.execute(query + " ORDER BY path", values)]
+        if pattern is not None:
+            records = [record for record in records if fnmatch(record["name"], pattern)]
+        return records
+
+    def describe(self, paths, events=True, checksum=False):
+        """
+        Compute the event count and/or checksum of catalogued files that do not have them yet, or whose size or
+        modification time changed since they were computed (files rewritten in place).
+
+        Parameters
+        ----------
+        paths: list of str
+            resolved paths, as returned by `list_files`
+        events: bool
+        checksum: bool
+
+        Returns
+        -------
+        dict: {path: {"size", "n_events", "checksum"}}
+        """
+        with self._connect() as connection:
+            records = {}
+            for path in paths:
+                row = connection.execute(
+                    "SELECT size, mtime, n_events, checksum FROM files WHERE path = ?", (path,)
+                ).fetchone()
+                if row is not None:
+                    records[path] = dict(zip(("size", "mtime", "n_events", "checksum"), row))
+        for path, record in records.items():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if (stat.st_size, stat.st_mtime) != (record["size"], record["mtime"]):
+                record.update(size=stat.st_size, mtime=stat.st_mtime, n_events=None, checksum=None)
+            if events and record["n_events"] is None:
+                record["n_events"] = count_events(path)
+            if checksum and record["checksum"] is None:
+                record["checksum"] = file_checksum(path)
+        with self._lock, self._connect() as connection:
+            connection.executemany(
+                "UPDATE files SET size = ?, mtime = ?, n_events = ?, checksum = ? WHERE path = ?",
+                [
+                    (record["size"], record["mtime"], record["n_events"], record["checksum"], path)
+                    for path, record in records.items()
+                ],
+            )
+        return {
+            path: {key: record[key] for key in ("size", "n_events", "checksum")} for path, record in records.items()
+        }
+
+
+_catalog = None
+
+
+def use_file_catalog(filename):
+    """
+    Make `get_input_filelist` query a catalog instead of listing the directories.
+
+    Parameters
+    ----------
+    filename: str or Path or bool or None
+        SQLite catalog. True for `DEFAULT_CATALOG_FILE`, None or False to list the directories.
+
+    Returns
+    -------
+    `FileCatalog` or None
+    """
+    global _catalog
+    if filename is True:
+        filename = DEFAULT_CATALOG_FILE
+    _catalog = FileCatalog(filename) if filename else None
+    return _catalog
+
+
+def get_file_catalog():
+    """
+    Catalog set by `use_file_catalog`, None if the directories are listed.
+    """
+    return _catalog
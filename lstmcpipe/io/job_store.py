@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+
+# SQLite store of the jobs of a production, written in `prod_logs/logs_{prod_id}`.
+# Every submitted job is recorded with its stage; the state, runtime and exit code of the jobs and array tasks are
+# refreshed with a single bulk `sacct` query, used by `lstmcpipe_status` to report the progress of the production.
+
+import re
+import time
+import sqlite3
+import logging
+import threading
+import subprocess as sp
+from pathlib import Path
+from contextlib import contextmanager
+from statistics import mean
+
+from ..executors import parse_array_range
+from ..submission_queue import is_placeholder
+
+log = logging.getLogger(__name__)
+
+SACCT_FORMAT = "JobID,State,Elapsed,ExitCode"
+SACCT_CHUNK_SIZE = 500
+DONE_STATES = ("COMPLETED",)
+ACTIVE_STATES = ("PENDING", "RUNNING", "REQUEUED", "RESIZING", "SUSPENDED", "CONFIGURING", "COMPLETING")
+# states of the tasks that can be resubmitted by `lstmcpipe_recover`, CANCELLED tasks are left to the user
+FAILED_STATES = ("FAILED", "TIMEOUT", "OUT_OF_MEMORY", "NODE_FAIL", "BOOT_FAIL", "PREEMPTED", "DEADLINE")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    jobid TEXT PRIMARY KEY,
+    stage TEXT,
+    run REAL,
+    submitted REAL,
+    n_tasks INTEGER,
+    dependencies TEXT,
+    command TEXT,
+    sbatch_command TEXT,
+    recovered_by TEXT
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    taskid TEXT PRIMARY KEY,
+    jobid TEXT,
+    state TEXT,
+    elapsed REAL,
+    exit_code TEXT,
+    updated REAL
+);
+"""
+
+
+def job_store_filename(log_dir, prod_id):
+    return Path(log_dir).joinpath(f"jobs_{prod_id}.sqlite")
+
+
+def parse_elapsed(elapsed):
+    """
+    Convert a slurm elapsed time `[D-]HH:MM:SS` (or `MM:SS.mmm`) to seconds.
+    """
+    days = 0
+    if "-" in elapsed:
+        days, elapsed = elapsed.split("-")
+    seconds = 0.0
+    for value in elapsed.split(":"):
+        seconds = seconds * 60 + float(value)
+    return int(days) * 86400 + seconds
+
+
+def parse_sacct(output):
+    """
+    Parse the output of `sacct --parsable2 --noheader --allocations --format=JobID,State,Elapsed,ExitCode`.
+    Pending array ranges (e.g. `123_[4-9%10]`) are expanded to one entry per task.
+
+    Returns
+    -------
+    list of tuple: (jobid, taskid, state, elapsed_seconds, exit_code)
+    """
+    records = []
+    for line in output.splitlines():
+        fields = line.strip().split("|")
+        if len(fields) < 4 or "." in fields[0]:
+            continue
+        taskid, state, elapsed, exit_code = fields[:4]
+        # e.g. "CANCELLED by 1234"
+        state = state.split(" ")[0]
+        jobid = taskid.split("_")[0]
+        if "_[" in taskid:
+            for index in parse_array_range(taskid.split("_[")[1].rstrip("]")):
+                records.append((jobid, f"{jobid}_{index}", state, 0.0, exit_code))
+        else:
+            records.append((jobid, taskid, state, parse_elapsed(elapsed), exit_code))
+    return records
+
+
+class JobStore:
+    """
+    SQLite store of the jobs of a production.
+
+    Parameters
+    ----------
+    filename: str or Path
+        SQLite database, created if needed
+    """
+
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        self.filename.parent.mkdir(exist_ok=True, parents=True)
+        # jobs may be submitted from several threads, see `lstmcpipe.utils.submit_concurrently`
+        self._lock = threading.Lock()
+        # jobs submitted by the same lstmcpipe call
+        self.run = time.time()
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.filename, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def add_job(self, jobid, stage, n_tasks=1, dependencies=None, command="", sbatch_command="", run=None):
+        """
+        Record a submitted job.
+
+        Parameters
+        ----------
+        jobid: str
+        stage: str
+        n_tasks: int
+            Number of array tasks, 1 for a non-array job
+        dependencies: str or None
+            Comma-separated job ids the job depends on
+        command: str
+            Command run by the job
+        sbatch_command: str
+            Full sbatch command used to submit the job
+        run: float or None
+            lstmcpipe run the job belongs to. Default: the current one
+        """
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                (
+                    str(jobid),
+                    stage,
+                    self.run if run is None else run,
+                    time.time(),
+                    n_tasks,
+                    dependencies,
+                    command,
+                    sbatch_command,
+                ),
+            )
+
+    def jobs(self, all_runs=False):
+        """
+        Recorded jobs, as a list of dict with the columns of the `jobs` table.
+        """
+        query = "SELECT * FROM jobs"
+        if not all_runs:
+            query += " WHERE run = (SELECT MAX(run) FROM jobs)"
+        with self._connect() as connection:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(query)]
+
+    def tasks(self, jobid):
+        """
+        States of the tasks of a job, as {taskid: state}.
+        """
+        with self._connect() as connection:
+            rows = connection.execute("SELECT taskid, state FROM tasks WHERE jobid = ?", (str(jobid),))
+            return dict(rows.fetchall())
+
+    def update_job(self, jobid, **columns):
+        """
+        Update some columns of a recorded job, e.g. its `dependencies` or `recovered_by`.
+        """
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with self._lock, self._connect() as connection:
+            connection.execute(f"UPDATE jobs SET {assignments} WHERE jobid = ?", (*columns.values(), str(jobid)))
+
+    def rename_job(self, jobid, new_jobid):
+        """
+        Replace a job id, in the `jobs` table and in the dependencies of the other jobs.
+        Used for the jobs recorded with a placeholder id while waiting in the `lstmcpipe.submission_queue`.
+        """
+        # the job itself or one of its array tasks (`jobid_i`) in the comma-separated dependencies
+        pattern = re.compile(rf"(?<![\w.]){re.escape(str(jobid))}(?![\d.])")
+        with self._lock, self._connect() as connection:
+            connection.execute("UPDATE jobs SET jobid = ? WHERE jobid = ?", (str(new_jobid), str(jobid)))
+            rows = connection.execute(
+                "SELECT jobid, dependencies FROM jobs WHERE dependencies LIKE ?", (f"%{jobid}%",)
+            ).fetchall()
+            for dependent, dependencies in rows:
+                connection.execute(
+                    "UPDATE jobs SET dependencies = ? WHERE jobid = ?",
+                    (pattern.sub(str(new_jobid), dependencies), dependent),
+                )
+
+    def jobids(self, all_runs=False):
+        with self._connect() as connection:
+            if all_runs:
+                rows = connection.execute("SELECT jobid FROM jobs")
+            else:
+                rows = connection.execute("SELECT jobid FROM jobs WHERE run = (SELECT MAX(run) FROM jobs)")
+            # jobs still waiting in the submission queue are unknown to slurm
+            return [row[0] for row in rows if not is_placeholder(row[0])]
+
+    def update_tasks(self, records):
+        """
+        Parameters
+        ----------
+        records: list of tuple
+            (jobid, taskid, state, elapsed_seconds, exit_code), see `parse_sacct`
+        """
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?)",
+                [(taskid, jobid, state, elapsed, code, now) for jobid, taskid, state, elapsed, code in records],
+            )
+
+    def refresh(self, all_runs=False):
+        """
+        Update the state of the jobs with bulk `sacct` queries.
+
+        Returns
+        -------
+        int: number of job or task records updated
+        """
+        jobids = self.jobids(all_runs=all_runs)
+        records = []
+        for start in range(0, len(jobids), SACCT_CHUNK_SIZE):
+            cmd = [
+                "sacct",
+                "--parsable2",
+                "--noheader",
+                "--allocations",
+                f"--format={SACCT_FORMAT}",
+                f"--jobs={','.join(jobids[start:start + SACCT_CHUNK_SIZE])}",
+            ]
+            result = sp.run(cmd, capture_output=True, text=True, check=True)
+            records.extend(parse_sacct(result.stdout))
+        self.update_tasks(records)
+        return len(records)
+
+    def summary(self, all_runs=False):
+        """
+        Progress of each stage.
+
+        Returns
+        -------
+        dict: {stage: {"jobs", "tasks", "states": {state: count}, "mean_runtime", "failed", "eta"}}
+            `failed` lists the failed job or task ids, `eta` is the estimated remaining time in seconds
+            (None if it can not be estimated yet)
+        """
+        query = "SELECT jobid, stage, n_tasks, recovered_by FROM jobs"
+        if not all_runs:
+            query += " WHERE run = (SELECT MAX(run) FROM jobs)"
+        with self._connect() as connection:
+            jobs = connection.execute(query).fetchall()
+            tasks = {}
+            for jobid, taskid, state, elapsed in connection.execute("SELECT jobid, taskid, state, elapsed FROM tasks"):
+                tasks.setdefault(jobid, []).append((taskid, state, elapsed))
+
+        summary = {}
+        for jobid, stage, n_tasks, recovered_by in jobs:
+            stage_summary = summary.setdefault(
+                stage, {"jobs": 0, "tasks": 0, "states": {}, "runtimes": [], "failed": [], "running": 0}
+            )
+            stage_summary["jobs"] += 1
+            stage_summary["tasks"] += n_tasks
+            job_tasks = tasks.get(jobid, [])
+            for taskid, state, elapsed in job_tasks:
+                if recovered_by and state in FAILED_STATES:
+                    # resubmitted and counted with the recovery job
+                    stage_summary["tasks"] -= 1
+                    continue
+                stage_summary["states"][state] = stage_summary["states"].get(state, 0) + 1
+                if state in DONE_STATES:
+                    stage_summary["runtimes"].append(elapsed)
+                elif state == "RUNNING":
+                    stage_summary["running"] += 1
+                elif state not in ACTIVE_STATES:
+                    stage_summary["failed"].append(taskid)
+            # not known by sacct yet
+            if n_tasks > len(job_tasks):
+                states = stage_summary["states"]
+                states["UNKNOWN"] = states.get("UNKNOWN", 0) + n_tasks - len(job_tasks)
+
+        for stage_summary in summary.values():
+            runtimes = stage_summary.pop("runtimes")
+            running = stage_summary.pop("running")
+            done = len(runtimes) + len(stage_summary["failed"])
+            stage_summary["mean_runtime"] = mean(runtimes) if runtimes else None
+            remaining = stage_summary["tasks"] - done
+            if remaining == 0:
+                stage_summary["eta"] = 0.0
+            elif runtimes and running:
+                stage_summary["eta"] = remaining * stage_summary["mean_runtime"] / running
+            else:
+                stage_summary["eta"] = None
+        return summary
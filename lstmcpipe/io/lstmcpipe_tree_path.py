@@ -3,6 +3,7 @@
 import shutil
 from pathlib import Path
 from lstmcpipe import prod_logs, __version__
+from lstmcpipe.submission_queue import is_placeholder
 
 
 def backup_log(file):
@@ -26,6 +27,22 @@ def backup_log(file):
         shutil.copyfile(file, save_file)
 
 
+def log_dir_path(prod_id):
+    """
+    Path of the log directory of a production, without creating it (e.g. for read-only queries).
+
+    Parameters
+    ----------
+    prod_id : str
+        production identifier
+
+    Returns
+    -------
+    Path
+    """
+    return prod_logs.joinpath(f"logs_{prod_id}")
+
+
 def create_log_dir(prod_id):
     """
 
@@ -39,7 +56,7 @@ def create_log_dir(prod_id):
     log_dir : Path
         Path to `prod_id` log directory
     """
-    log_dir = prod_logs.joinpath(f"logs_{prod_id}")
+    log_dir = log_dir_path(prod_id)
     log_dir.mkdir(exist_ok=True, parents=True)
     return log_dir
 
@@ -102,6 +119,13 @@ def update_scancel_file(scancel_file, jobids_to_update):
     jobids_to_update: str
         job_ids to be included into the the file
     """
+    # queued jobs are added once submitted, see `lstmcpipe.submission_queue`
+    jobids_to_update = ",".join(
+        jobid for jobid in (jobids_to_update or "").split(",") if jobid and not is_placeholder(jobid)
+    )
+    if not jobids_to_update:
+        # no job submitted, e.g. stage already complete when resuming a production
+        return
     if scancel_file.stat().st_size == 0:
         with open(scancel_file, "r+") as f:
             f.write(f"scancel {jobids_to_update}")
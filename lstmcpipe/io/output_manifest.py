@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+# Manifests of the outputs produced by the jobs of a production.
+# Each job writes a manifest of its outputs (size, modification time and sha256 of every file) once it succeeded.
+# When resuming a production, an output is considered complete only if its manifest is found and still matches
+# the files on disk, so that only the missing or stale outputs are reprocessed.
+
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".manifest.json"
+DIRECTORY_MANIFEST_NAME = ".lstmcpipe_manifest.json"
+# slurm logs may still be written after the manifest, they are not part of the outputs
+IGNORED_SUFFIXES = (MANIFEST_SUFFIX, ".e", ".o")
+
+
+def manifest_path(output):
+    """
+    Path of the manifest of an output.
+    The manifest of a directory is written inside it, the one of a file next to it.
+
+    Parameters
+    ----------
+    output: str or Path
+
+    Returns
+    -------
+    Path
+    """
+    output = Path(output).resolve()
+    if output.is_dir():
+        return output.joinpath(DIRECTORY_MANIFEST_NAME)
+    return output.with_name(output.name + MANIFEST_SUFFIX)
+
+
+def output_paths(outputs):
+    """
+    Return the list of paths found in a stage `output` entry (str, list or dict of str).
+    Non-path values (e.g. the train/test `ratio`) are ignored.
+    """
+    if isinstance(outputs, (str, Path)):
+        return [Path(outputs)]
+    elif isinstance(outputs, dict):
+        return [p for value in outputs.values() for p in output_paths(value)]
+    elif isinstance(outputs, (list, tuple)):
+        return [p for value in outputs for p in output_paths(value)]
+    else:
+        return []
+
+
+def list_output_files(path):
+    """
+    Files of an output: the output itself or all the files of an output directory, except manifests and slurm logs.
+    """
+    path = Path(path)
+    if path.is_dir():
+        return sorted(
+            file
+            for file in path.rglob("*")
+            if file.is_file() and file.name != DIRECTORY_MANIFEST_NAME and not file.name.endswith(IGNORED_SUFFIXES)
+        )
+    return [path]
+
+
+def file_checksum(filename, chunk_size=2**24):
+    """
+    sha256 of a file, read by chunks
+    """
+    sha = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def write_output_manifest(outputs, manifest_file=None, checksum=True, checksums=None):
+    """
+    Write the manifest of the outputs of a job.
+
+    Parameters
+    ----------
+    outputs: str, Path or list
+        Output files or directories. All the files of a directory are recorded.
+    manifest_file: str, Path or None
+        Default: `manifest_path` of the first output
+    checksum: bool
+        Record the sha256 of each file
+    checksums: dict or None
+        Known sha256 of files, as {resolved path: sha256}, recorded without reading the files again
+
+    Returns
+    -------
+    Path: the manifest file
+    """
+    outputs = output_paths(outputs)
+    checksums = checksums or {}
+    manifest_file = manifest_path(outputs[0]) if manifest_file is None else Path(manifest_file)
+
+    files = {}
+    for output in outputs:
+        if not output.exists():
+            raise FileNotFoundError(f"Output {output} not found, the manifest can not be written")
+        for file in list_output_files(output):
+            stat = file.stat()
+            filename = file.resolve().as_posix()
+            sha256 = checksums.get(filename)
+            if sha256 is None and checksum:
+                sha256 = file_checksum(file)
+            files[filename] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+
+    manifest = {
+        "created": datetime.now().isoformat(),
+        "outputs": [output.resolve().as_posix() for output in outputs],
+        "files": files,
+    }
+    tmp_file = manifest_file.with_name(manifest_file.name + ".tmp")
+    with open(tmp_file, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_file, manifest_file)
+    return manifest_file
+
+
+def read_output_manifest(manifest_file):
+    """
+    Read the files recorded in a manifest.
+
+    Parameters
+    ----------
+    manifest_file: str or Path
+
+    Returns
+    -------
+    dict: {filename: {"size", "mtime", "sha256"}}
+    """
+    with open(manifest_file) as file:
+        return json.load(file)["files"]
+
+
+def verify_output_manifest(manifest_file):
+    """
+    Check that the files recorded in a manifest are still there and unchanged.
+    Files with the recorded size and modification time are accepted without being read, the checksum
+    is only computed for files modified since the manifest was written.
+
+    Parameters
+    ----------
+    manifest_file: str or Path
+
+    Returns
+    -------
+    bool
+    """
+    manifest_file = Path(manifest_file)
+    if not manifest_file.exists():
+        return False
+    try:
+        files = read_output_manifest(manifest_file)
+    except (ValueError, KeyError):
+        log.warning(f"Corrupted manifest {manifest_file}")
+        return False
+
+    if not files:
+        return False
+    for filename, record in files.items():
+        file = Path(filename)
+        if not file.is_file():
+            return False
+        stat = file.stat()
+        if stat.st_size != record["size"]:
+            return False
+        if stat.st_mtime != record["mtime"]:
+            if record.get("sha256") is None or file_checksum(file) != record["sha256"]:
+                return False
+    return True
+
+
+def is_output_complete(outputs):
+    """
+    Whether all the outputs have a valid manifest, i.e. have been fully produced by a previous run.
+
+    Parameters
+    ----------
+    outputs: str, Path, list or dict
+        Stage `output` entry
+
+    Returns
+    -------
+    bool
+    """
+    paths = output_paths(outputs)
+    return len(paths) > 0 and all(verify_output_manifest(manifest_path(path)) for path in paths)
+
+
+def compose_output_manifest_command(outputs):
+    """
+    Command writing the manifest of each output, to be chained to the command of a job.
+
+    Parameters
+    ----------
+    outputs: str, Path, list or dict
+        Stage `output` entry
+
+    Returns
+    -------
+    str
+    """
+    return " && ".join(f"lstmcpipe_write_output_manifest -o {Path(path).as_posix()}" for path in output_paths(outputs))
+
+
+def incomplete_paths(dict_paths, stage, debug_log, get_output=None):
+    """
+    Filter out the paths of a stage whose outputs are already complete, to resume a production.
+
+    Parameters
+    ----------
+    dict_paths: list of dict
+        Paths of the stage
+    stage: str
+        Stage name, for logging
+    debug_log: dict
+        Debug log of the stage, updated with the skipped outputs
+    get_output: callable or None
+        Function returning the outputs of a path. Default: `paths["output"]`
+
+    Returns
+    -------
+    list of dict: the paths to be (re)processed
+    """
+    remaining = []
+    for paths in dict_paths:
+        output = paths["output"] if get_output is None else get_output(paths)
+        if is_output_complete(output):
+            log.info(f"{stage} output {output} already complete, skipped")
+            debug_log[f"**COMPLETE** {output}"] = f"{stage} output already complete, not resubmitted"
+        else:
+            remaining.append(paths)
+    return remaining
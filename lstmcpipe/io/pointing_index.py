@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+# Scan of the pointing directories of the all-sky MC productions, used by `lstmcpipe.config.paths_config`.
+# The directories are scanned in parallel with `os.scandir`, stopping at the first simtel file of each pointing, and
+# the result is kept in an on-disk index, reused by the next `lstmcpipe_generate_config` calls as long as the
+# modification time of the directory is unchanged. As the modification times have a 1 s resolution on Lustre, a
+# directory modified less than `MTIME_RESOLUTION` before its scan is scanned again.
+# The index only records whether a pointing has simtel files, not their number or total size: counting them would
+# list every file of the pointings, which the early exit avoids.
+
+import os
+import re
+import json
+import time
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from .file_catalog import MTIME_RESOLUTION
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INDEX_FILE = (
+    Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser().joinpath("lstmcpipe", "pointing_index.json")
+)
+SIMTEL_SUFFIX = ".simtel.gz"
+
+
+def list_subdirs(path):
+    """
+    Names of the sub-directories of `path`.
+    """
+    with os.scandir(path) as entries:
+        return [entry.name for entry in entries if entry.is_dir()]
+
+
+def has_files(path, suffix=SIMTEL_SUFFIX):
+    """
+    Whether `path` contains a file ending with `suffix`, stopping at the first one found.
+    """
+    try:
+        with os.scandir(path) as entries:
+            return any(entry.name.endswith(suffix) for entry in entries)
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+
+
+def pointing_alt_az(name):
+    """
+    Altitude and azimuth in degrees of a pointing directory named `*_theta_{zenith}_az_{azimuth}_`, None if the name
+    does not follow this pattern.
+    """
+    match = re.search(r".*theta_(.+?)_az_(.+?)_", name)
+    if match is None:
+        return None
+    return 90.0 - float(match.group(1)), float(match.group(2))
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+class PointingIndex:
+    """
+    On-disk index of the pointing directories.
+
+    Each scanned directory is recorded with its pointing `name`, `alt` and `az` (degrees), whether it contains
+    simtel files (`has_files`), the directory `mtime` and the time of the scan (`scanned`). Adding or removing
+    files updates the mtime of the directory, which invalidates its record. The records of directories modified
+    less than `MTIME_RESOLUTION` before their scan are not reused, as files may have been added after the scan
+    within the same mtime. The number and size of the files are not recorded.
+
+    Parameters
+    ----------
+    filename: str or Path or None
+        JSON index file, created if needed. None to keep the index in memory only.
+    max_workers: int
+        Number of directories scanned in parallel
+    """
+
+    def __init__(self, filename=DEFAULT_INDEX_FILE, max_workers=16):
+        self.filename = None if filename is None else Path(filename)
+        self.max_workers = max_workers
+        self._records = None
+
+    @property
+    def records(self):
+        """
+        {directory: record} of the indexed directories
+        """
+        if self._records is None:
+            self._records = self._read()
+        return self._records
+
+    def _read(self):
+        if self.filename is None or not self.filename.exists():
+            return {}
+        try:
+            with open(self.filename) as file:
+                return json.load(file)
+        except ValueError:
+            log.warning(f"Pointing index {self.filename} is corrupted, it will be rebuilt")
+            return {}
+
+    def save(self):
+        """
+        Write the index, merged with the records written meanwhile by other processes.
+        """
+        if self.filename is None:
+            return
+        records = self._read()
+        records.update(self.records)
+        try:
+            self.filename.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.filename.with_name(f"{self.filename.name}.{os.getpid()}.tmp")
+            with open(tmp_file, "w") as file:
+                json.dump(records, file)
+            os.replace(tmp_file, self.filename)
+        except OSError as e:
+            log.warning(f"Could not write the pointing index {self.filename}: {e}")
+
+    def _scan(self, name, directory):
+        mtime = _mtime(directory)
+        record = self.records.get(directory)
+        if (
+            record is not None
+            and mtime is not None
+            and record["mtime"] == mtime
+            and mtime < record.get("scanned", 0) - MTIME_RESOLUTION
+            and "has_files" in record
+        ):
+            return record
+        alt_az = pointing_alt_az(name)
+        scanned = time.time()
+        return {
+            "name": name,
+            "alt": None if alt_az is None else alt_az[0],
+            "az": None if alt_az is None else alt_az[1],
+            "has_files": has_files(directory),
+            "mtime": mtime,
+            "scanned": scanned,
+        }
+
+    def scan(self, directories):
+        """
+        Records of the given pointing directories, scanning only the new or modified ones.
+
+        Parameters
+        ----------
+        directories: dict
+            {pointing name: directory containing the simtel files}
+
+        Returns
+        -------
+        dict: {pointing name: record}
+        """
+        names = list(directories)
+        paths = [os.path.abspath(directories[name]) for name in names]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            records = list(pool.map(self._scan, names, paths))
+        modified = False
+        for path, record in zip(paths, records):
+            if self.records.get(path) != record:
+                self.records[path] = record
+                modified = True
+        if modified:
+            self.save()
+        return dict(zip(names, records))
+
+
+def find_pointing_dirs(base_dir, r0_dir, index=None, max_workers=16):
+    """
+    Names of the pointing directories of `base_dir` containing simtel files.
+
+    Parameters
+    ----------
+    base_dir: str or Path
+        directory containing one directory per pointing
+    r0_dir: callable
+        r0_dir(pointing name) -> directory containing the simtel files of the pointing
+    index: `PointingIndex` or None
+        If None, the directories are not indexed and only checked for a first simtel file
+    max_workers: int
+        Number of directories scanned in parallel without index
+
+    Returns
+    -------
+    list of str
+    """
+    names = list_subdirs(base_dir)
+    if index is None:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            found = list(pool.map(has_files, [r0_dir(name) for name in names]))
+        return [name for name, ok in zip(names, found) if ok]
+    records = index.scan({name: r0_dir(name) for name in names})
+    return [name for name in names if records[name]["has_files"]]
+
+
+class PointingCatalog:
+    """
+    Memoized pointings of the all-sky MC directories.
+
+    A single catalog is shared by all the configs of a production (e.g. the training and testing configs of every
+    declination, and the source and target configs of a DL1ab production), so that each directory tree is scanned
+    and each pointings table is built only once.
+
+    Parameters
+    ----------
+    index: `PointingIndex` or None
+        on-disk index used for the scans, see `find_pointing_dirs`
+    """
+
+    def __init__(self, index=None):
+        self.index = index
+        self._pointing_dirs = {}
+        self._tables = {}
+
+    def pointing_dirs(self, base_dir, r0_dir):
+        """
+        Memoized `find_pointing_dirs`.
+        """
+        key = os.path.abspath(base_dir)
+        if key not in self._pointing_dirs:
+            self._pointing_dirs[key] = find_pointing_dirs(base_dir, r0_dir, index=self.index)
+        return list(self._pointing_dirs[key])
+
+    def table(self, key, build):
+        """
+        Memoized pointings table.
+
+        Parameters
+        ----------
+        key: hashable
+            identifies the directories and options the table is built from
+        build: callable
+            returns the table, called on the first request only
+
+        Returns
+        -------
+        `astropy.table.QTable`: a copy, as the configs remove the pointings missing in their source production
+        """
+        if key not in self._tables:
+            self._tables[key] = build()
+        return self._tables[key].copy()
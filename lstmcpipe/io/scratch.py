@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+# Node-local staging of the I/O of the DL1 core scripts.
+# Inputs are copied to the local scratch ($TMPDIR), processed there, and the finished outputs are moved to the
+# shared file system at once (copy to a hidden temporary name in the destination directory, then rename), so that
+# the shared file system only sees large sequential reads and writes instead of the many small HDF5 writes.
+
+import os
+import shutil
+import logging
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+
+class ScratchArea:
+    """
+    Temporary directory on the node-local scratch.
+
+    The next input can be prefetched in a background thread while the current one is processed.
+    The area can be sent to worker processes, the prefetching is then only done in the process that created it.
+
+    Parameters
+    ----------
+    base_dir: str or Path or None
+        Default: `$TMPDIR`, or the system temporary directory
+    """
+
+    def __init__(self, base_dir=None):
+        base_dir = base_dir or os.environ.get("TMPDIR") or tempfile.gettempdir()
+        self.directory = Path(tempfile.mkdtemp(prefix="lstmcpipe_", dir=base_dir))
+        self._prefetcher = None
+        self._prefetched = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_prefetcher"] = None
+        state["_prefetched"] = {}
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+    def _copy_in(self, file):
+        local_file = self.directory.joinpath("inputs", Path(file).name)
+        if not local_file.exists():
+            local_file.parent.mkdir(exist_ok=True, parents=True)
+            tmp_file = local_file.with_name(f".{local_file.name}.part-{os.getpid()}")
+            shutil.copyfile(file, tmp_file)
+            os.replace(tmp_file, local_file)
+        return local_file
+
+    def prefetch(self, file):
+        """
+        Start copying `file` to the scratch in a background thread.
+        """
+        if self._prefetcher is None:
+            self._prefetcher = ThreadPoolExecutor(max_workers=1)
+        if str(file) not in self._prefetched:
+            self._prefetched[str(file)] = self._prefetcher.submit(self._copy_in, file)
+
+    def stage_in(self, file):
+        """
+        Copy of `file` on the scratch, waiting for its prefetch if started.
+
+        Returns
+        -------
+        Path: the local copy
+        """
+        future = self._prefetched.pop(str(file), None)
+        return future.result() if future is not None else self._copy_in(file)
+
+    def work_dir(self, file):
+        """
+        Local directory receiving the outputs produced from `file`.
+        """
+        directory = self.directory.joinpath("outputs", Path(file).name)
+        directory.mkdir(exist_ok=True, parents=True)
+        return directory
+
+    def stage_out(self, work_dir, output_dir):
+        """
+        Move all the files of a local `work_dir` to `output_dir`. Each file only appears in `output_dir` once
+        complete.
+
+        Returns
+        -------
+        list of Path: the files in `output_dir`
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(exist_ok=True, parents=True)
+        outputs = []
+        for file in sorted(Path(work_dir).iterdir()):
+            if not file.is_file():
+                continue
+            destination = output_dir.joinpath(file.name)
+            tmp_file = output_dir.joinpath(f".{file.name}.part-{os.getpid()}")
+            shutil.copyfile(file, tmp_file)
+            os.replace(tmp_file, destination)
+            file.unlink()
+            outputs.append(destination)
+        return outputs
+
+    def release(self, local_file):
+        """
+        Remove a local input once processed.
+        """
+        Path(local_file).unlink(missing_ok=True)
+
+    def cleanup(self):
+        if self._prefetcher is not None:
+            self._prefetcher.shutdown()
+        shutil.rmtree(self.directory, ignore_errors=True)
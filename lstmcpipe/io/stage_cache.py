@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+# Content-addressed cache of the outputs of the pipeline stages, shared between productions.
+# An entry is keyed by the digests of the stage inputs, the lstchain configuration and the source environment.
+# When a production requests the same work again (e.g. same merged DL1 files and same config), the cached
+# artifact is linked into the new production instead of submitting a job.
+#
+# Layout: {directory}/{stage}/{key}/files/...  +  {directory}/{stage}/{key}/cache_entry.json
+# The entry file records the sha256 of the cached files, written in the output manifest of a restored artifact so
+# that it can be used as a cached input by the next stage without being read again.
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+
+from .output_manifest import (
+    manifest_path,
+    list_output_files,
+    file_checksum,
+    read_output_manifest,
+    verify_output_manifest,
+    write_output_manifest,
+)
+
+log = logging.getLogger(__name__)
+
+ENTRY_FILE = "cache_entry.json"
+DEFAULT_CACHED_STAGES = ["train_pipe", "dl1_to_dl2"]
+
+
+def path_digest(path, manifest_only=False):
+    """
+    Digest of the content of an input file or directory.
+    The checksums recorded in a valid output manifest are used instead of reading the files again.
+
+    Parameters
+    ----------
+    path: str or Path
+    manifest_only: bool
+        Never read the files: the digest is only computed from the checksums of a valid output manifest
+
+    Returns
+    -------
+    str or None: None if the input does not exist (yet), or if `manifest_only` and it has no valid manifest
+    with checksums
+    """
+    path = Path(path).resolve()
+    if not path.exists():
+        return None
+
+    manifest = manifest_path(path)
+    if verify_output_manifest(manifest):
+        recorded = read_output_manifest(manifest)
+        files = [Path(filename) for filename in sorted(recorded)]
+    elif manifest_only:
+        return None
+    else:
+        recorded = {}
+        files = list_output_files(path)
+    if manifest_only and any(record.get("sha256") is None for record in recorded.values()):
+        return None
+
+    sha = hashlib.sha256()
+    for file in files:
+        checksum = recorded.get(file.as_posix(), {}).get("sha256") or file_checksum(file)
+        # only the names inside a directory matter, a file is identified by its content only
+        name = file.relative_to(path).as_posix() if path.is_dir() else ""
+        sha.update(f"{name}:{checksum}\n".encode())
+    return sha.hexdigest()
+
+
+def config_digest(config_file):
+    """
+    Digest of a configuration file, independent of the formatting of json files.
+    """
+    if config_file is None:
+        return ""
+    with open(config_file) as file:
+        content = file.read()
+    try:
+        content = json.dumps(json.loads(content), sort_keys=True)
+    except ValueError:
+        pass
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def environment_digest(source_environment):
+    return hashlib.sha256(str(source_environment).encode()).hexdigest()
+
+
+def _link(source, destination):
+    """
+    Hard link (no extra disk usage and independent of the cache eviction), or symlink across file systems.
+    """
+    destination = Path(destination)
+    destination.parent.mkdir(exist_ok=True, parents=True)
+    if destination.exists() or destination.is_symlink():
+        destination.unlink()
+    try:
+        os.link(source, destination)
+    except OSError:
+        os.symlink(Path(source).resolve(), destination)
+
+
+class StageCache:
+    """
+    Cache of stage outputs.
+
+    Parameters
+    ----------
+    directory: str or Path
+        Root directory of the cache
+    max_age_days: float or None
+        Entries not used for longer are evicted
+    max_size_gb: float or None
+        The least recently used entries are evicted above this total size
+    stages: list or None
+        Stages using the cache. Default: train_pipe and dl1_to_dl2
+    """
+
+    def __init__(self, directory, max_age_days=None, max_size_gb=None, stages=None):
+        self.directory = Path(directory)
+        self.max_age_days = max_age_days
+        self.max_size_gb = max_size_gb
+        self.stages = DEFAULT_CACHED_STAGES if stages is None else list(stages)
+
+    def enabled_for(self, stage):
+        return stage in self.stages
+
+    def entry_dir(self, stage, key):
+        return self.directory.joinpath(stage, key)
+
+    @staticmethod
+    def compute_key(stage, inputs, config_file, env_digest, manifest_only=False):
+        """
+        Key of a stage run, None if an input is not available.
+
+        Parameters
+        ----------
+        stage: str
+        inputs: list
+            Input files or directories
+        config_file: str or None
+        env_digest: str
+            `environment_digest` of the source environment
+        manifest_only: bool
+            Only use the checksums of the output manifests of the inputs, see `path_digest`
+
+        Returns
+        -------
+        str or None
+        """
+        sha = hashlib.sha256(f"{stage}\n{config_digest(config_file)}\n{env_digest}\n".encode())
+        for path in inputs:
+            digest = path_digest(path, manifest_only=manifest_only)
+            if digest is None:
+                return None
+            sha.update(f"{digest}\n".encode())
+        return sha.hexdigest()
+
+    def key(self, stage, inputs, config_file, source_environment, manifest_only=False):
+        return self.compute_key(
+            stage, inputs, config_file, environment_digest(source_environment), manifest_only=manifest_only
+        )
+
+    def restore(self, stage, key, output):
+        """
+        Link a cached artifact into `output` and write its output manifest with the checksums recorded in the entry
+        (computed for the entries stored without them).
+
+        Returns
+        -------
+        bool: True if the entry was found and restored
+        """
+        entry = self.entry_dir(stage, key)
+        if not entry.joinpath(ENTRY_FILE).exists():
+            return False
+
+        with open(entry.joinpath(ENTRY_FILE)) as file:
+            entry_info = json.load(file)
+        recorded = entry_info.get("checksums", {})
+        files_dir = entry.joinpath("files")
+        checksums = {}
+        if entry_info["is_dir"]:
+            for file in sorted(files_dir.rglob("*")):
+                if file.is_file():
+                    destination = Path(output).joinpath(file.relative_to(files_dir))
+                    _link(file, destination)
+                    checksums[destination.resolve().as_posix()] = recorded.get(file.relative_to(files_dir).as_posix())
+        else:
+            file = next(files_dir.iterdir())
+            _link(file, output)
+            checksums[Path(output).resolve().as_posix()] = recorded.get(file.name)
+        write_output_manifest(output, checksums=checksums)
+        # the modification time of the entry file tracks the last use, for the eviction
+        entry.joinpath(ENTRY_FILE).touch()
+        log.info(f"{stage} output {output} restored from cache entry {entry}")
+        return True
+
+    def store(self, stage, key, output):
+        """
+        Add the `output` of a stage run to the cache.
+
+        Returns
+        -------
+        Path: the cache entry
+        """
+        output = Path(output)
+        entry = self.entry_dir(stage, key)
+        if entry.joinpath(ENTRY_FILE).exists():
+            return entry
+
+        tmp_entry = entry.with_name(f"{entry.name}.tmp-{os.getpid()}")
+        files_dir = tmp_entry.joinpath("files")
+        files_dir.mkdir(parents=True)
+        root = output if output.is_dir() else output.parent
+        # the checksums of the output manifest written by the job, if still valid
+        manifest = manifest_path(output)
+        recorded = read_output_manifest(manifest) if verify_output_manifest(manifest) else {}
+        checksums = {}
+        for file in list_output_files(output):
+            name = file.relative_to(root).as_posix()
+            checksums[name] = recorded.get(file.resolve().as_posix(), {}).get("sha256") or file_checksum(file)
+            destination = files_dir.joinpath(file.relative_to(root))
+            destination.parent.mkdir(exist_ok=True, parents=True)
+            try:
+                os.link(file, destination)
+            except OSError:
+                shutil.copy2(file, destination)
+        with open(tmp_entry.joinpath(ENTRY_FILE), "w") as file:
+            json.dump(
+                {
+                    "stage": stage,
+                    "output": output.resolve().as_posix(),
+                    "is_dir": output.is_dir(),
+                    "checksums": checksums,
+                },
+                file,
+            )
+
+        try:
+            tmp_entry.rename(entry)
+        except OSError:
+            # stored concurrently by another job
+            shutil.rmtree(tmp_entry)
+        return entry
+
+    def restore_or_store_command(self, stage, inputs, config_file, source_environment, output, pending=False):
+        """
+        Restore the output of a stage run from the cache if available, otherwise compose the command storing the
+        output once produced by the job.
+        The lookup only uses the checksums of the output manifests of the inputs, so that no input is read at
+        submission.
+
+        Parameters
+        ----------
+        stage: str
+        inputs: list
+        config_file: str or None
+        source_environment: str
+        output: str or Path
+        pending: bool
+            The inputs are still being produced by jobs of this run: the files found at their paths may be stale,
+            no lookup is done and only the store command is composed
+
+        Returns
+        -------
+        restored: bool
+        store_command: str
+            Empty if restored
+        """
+        if not pending:
+            key = self.key(stage, inputs, config_file, source_environment, manifest_only=True)
+            if key is not None and self.restore(stage, key, output):
+                return True, ""
+
+        cmd = (
+            f"lstmcpipe_cache_store --cache-dir {self.directory.resolve().as_posix()} --stage {stage}"
+            f" --inputs {' '.join(Path(path).as_posix() for path in inputs)}"
+            f" --env-digest {environment_digest(source_environment)} --output {Path(output).as_posix()}"
+        )
+        if config_file is not None:
+            cmd += f" --config {Path(config_file).resolve().as_posix()}"
+        return False, cmd
+
+    def entries(self):
+        """
+        List of the complete cache entries as (entry_dir, last_used_timestamp, size_in_bytes)
+        """
+        entries = []
+        for entry_file in self.directory.glob(f"*/*/{ENTRY_FILE}"):
+            entry = entry_file.parent
+            size = sum(file.stat().st_size for file in entry.rglob("*") if file.is_file())
+            entries.append((entry, entry_file.stat().st_mtime, size))
+        return entries
+
+    def evict(self):
+        """
+        Remove the entries older than `max_age_days` then the least recently used ones until the cache
+        is smaller than `max_size_gb`.
+
+        Returns
+        -------
+        list: evicted entries
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[1])
+        evicted = []
+        if self.max_age_days is not None:
+            oldest = time.time() - self.max_age_days * 86400
+            evicted.extend(entry for entry in entries if entry[1] < oldest)
+        if self.max_size_gb is not None:
+            remaining = [entry for entry in entries if entry not in evicted]
+            total_size = sum(size for _, _, size in remaining)
+            for entry in remaining:
+                if total_size <= self.max_size_gb * 1e9:
+                    break
+                evicted.append(entry)
+                total_size -= entry[2]
+
+        for entry, _, _ in evicted:
+            log.info(f"Evicting stage cache entry {entry}")
+            shutil.rmtree(entry, ignore_errors=True)
+        return [entry for entry, _, _ in evicted]
+
+
+def get_stage_cache(batch_config, stage):
+    """
+    Stage cache configured in the `stage_cache` section of the lstmcpipe config, if enabled for `stage`.
+
+    Parameters
+    ----------
+    batch_config: dict
+    stage: str
+
+    Returns
+    -------
+    `StageCache` or None
+    """
+    config = batch_config.get("stage_cache") if batch_config else None
+    if not config:
+        return None
+    cache = StageCache(
+        config["directory"],
+        max_age_days=config.get("max_age_days"),
+        max_size_gb=config.get("max_size_gb"),
+        stages=config.get("stages"),
+    )
+    return cache if cache.enabled_for(stage) else None
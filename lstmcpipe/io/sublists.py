@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+# Build the sublists of files processed by each task of the r0_to_dl1 job arrays.
+# Files are bin-packed with the longest-processing-time-first (LPT) rule so that all the tasks of an array
+# finish at about the same time. The processing time of each file is estimated from its size and, when
+# available, from the runtimes measured by the core scripts in previous productions.
+
+import json
+import heapq
+import logging
+from glob import glob
+from math import ceil
+from pathlib import Path
+from statistics import median
+
+log = logging.getLogger(__name__)
+
+RUNTIMES_SUFFIX = ".runtimes.json"
+# default MaxArraySize of slurm is 1001, i.e. at most 1001 tasks per array
+DEFAULT_MAX_TASKS = 1000
+
+
+def runtimes_filename(sublist):
+    """
+    File where the core scripts record the runtime of each file of a sublist
+    """
+    return Path(sublist).with_name(Path(sublist).name + RUNTIMES_SUFFIX)
+
+
+def write_runtimes(sublist, runtimes):
+    """
+    Record the runtimes of the files of a sublist.
+
+    Parameters
+    ----------
+    sublist: str or Path
+    runtimes: dict
+        {input_file: {"size": bytes, "runtime": seconds, "output_size": bytes}}
+    """
+    with open(runtimes_filename(sublist), "w") as file:
+        json.dump(runtimes, file, indent=2)
+
+
+def read_runtime_history(patterns):
+    """
+    Read the runtimes recorded in previous productions.
+
+    Parameters
+    ----------
+    patterns: list of str
+        Glob patterns of directories containing `*.runtimes.json` files (e.g. the `job_logs_r0dl1` directories
+        of previous productions) or of the runtimes files themselves
+
+    Returns
+    -------
+    dict: {input_file: {"size": bytes, "runtime": seconds, "output_size": bytes}}
+        `output_size` is missing in the files written by older lstmcpipe versions
+    """
+    history = {}
+    for pattern in patterns:
+        for path in glob(str(pattern)):
+            path = Path(path)
+            files = path.glob(f"*{RUNTIMES_SUFFIX}") if path.is_dir() else [path]
+            for runtimes_file in files:
+                try:
+                    with open(runtimes_file) as file:
+                        history.update(json.load(file))
+                except ValueError:
+                    log.warning(f"Could not read runtimes file {runtimes_file}")
+    return history
+
+
+def estimate_costs(file_list, history=None):
+    """
+    Estimate the processing time of each file.
+
+    Files already processed in the history keep their measured runtime, the other ones are estimated from their
+    size with the median runtime per byte of the history. Without history, the cost is the file size.
+
+    Parameters
+    ----------
+    file_list: list of str
+    history: dict or None
+        see `read_runtime_history`
+
+    Returns
+    -------
+    costs: list of float
+    in_seconds: bool
+        Whether the costs are runtimes in seconds or only relative costs (sizes)
+    """
+    history = {} if history is None else history
+    sizes = [Path(file).stat().st_size if Path(file).exists() else 0 for file in file_list]
+    rates = [record["runtime"] / record["size"] for record in history.values() if record.get("size")]
+    if not rates:
+        return [float(size) for size in sizes], False
+
+    rate = median(rates)
+    costs = []
+    for file, size in zip(file_list, sizes):
+        record = history.get(file)
+        costs.append(float(record["runtime"]) if record is not None else size * rate)
+    return costs, True
+
+
+def pack_lpt(costs, n_bins):
+    """
+    Longest-processing-time-first bin packing: files are assigned, by decreasing cost, to the least loaded bin.
+
+    Parameters
+    ----------
+    costs: list of float
+    n_bins: int
+
+    Returns
+    -------
+    list of list: indices of the files in each bin, empty bins are dropped
+    """
+    n_bins = max(1, min(n_bins, len(costs)))
+    bins = [[] for _ in range(n_bins)]
+    loads = [(0.0, ibin) for ibin in range(n_bins)]
+    for index in sorted(range(len(costs)), key=lambda i: costs[i], reverse=True):
+        load, ibin = heapq.heappop(loads)
+        bins[ibin].append(index)
+        heapq.heappush(loads, (load + costs[index], ibin))
+    return [sorted(indices) for indices in bins if indices]
+
+
+def build_sublists(file_list, files_per_task, target_task_walltime=None, history=None, max_tasks=DEFAULT_MAX_TASKS):
+    """
+    Split the files into balanced sublists, one per array task.
+
+    The number of tasks is the one needed to reach `target_task_walltime` when the runtimes can be estimated
+    from the history, otherwise the one given by `files_per_task`. It is at most the number of files and
+    `max_tasks`.
+
+    Parameters
+    ----------
+    file_list: list of str
+    files_per_task: int
+        Average number of files per task when no runtime history is available
+    target_task_walltime: float or None
+        Targeted runtime of each task, in seconds
+    history: dict or None
+        see `read_runtime_history`
+    max_tasks: int or None
+        Maximum number of tasks, e.g. the MaxArraySize of slurm
+
+    Returns
+    -------
+    list of list of str
+    """
+    if not file_list:
+        return []
+    costs, in_seconds = estimate_costs(file_list, history)
+    if in_seconds and target_task_walltime:
+        n_tasks = ceil(sum(costs) / target_task_walltime)
+        log.info(f"{len(file_list)} files estimated to {sum(costs) / 3600:.1f} h of processing: {n_tasks} tasks")
+    else:
+        n_tasks = ceil(len(file_list) / files_per_task)
+    if max_tasks is not None and n_tasks > max_tasks:
+        log.warning(f"{n_tasks} tasks needed for {len(file_list)} files, limited to {max_tasks}")
+        n_tasks = max_tasks
+    n_tasks = min(n_tasks, len(file_list))
+    return [[file_list[i] for i in indices] for indices in pack_lpt(costs, n_tasks)]
@@ -0,0 +1,275 @@
+import os
+import pytest
+from pathlib import Path
+from lstmcpipe.io.dl1_merge import (
+    DL1_PARAMETERS_KEY,
+    EMPTY_SUFFIX,
+    SUBSAMPLING_KEY,
+    DL1SchemaError,
+    IncrementalMergeError,
+    append_dl1_files,
+    incremental_merge_dl1_files,
+    input_records,
+    is_file_list,
+    non_empty_parts,
+    read_file_lists,
+    read_merged_inputs,
+    select_group,
+    stratified_subsample,
+    subsample_dl1_files,
+    subsampled_keys,
+    virtual_merge_dl1_files,
+    write_file_list,
+    write_merged_inputs,
+    write_projected_table,
+    write_subsampling_table,
+)
+from lstmcpipe.stages.mc_merge_dl1 import compose_merge_dl1_command, estimate_n_merge_inputs, merge_tree_levels
+
+
+def test_file_lists(tmp_path):
+    write_file_list(["/dl1/a.h5", "/dl1/b.h5"], tmp_path / "train.list")
+    write_file_list(["/dl1/b.h5", "/dl1/c.h5"], tmp_path / "other" / "train.list")
+    assert read_file_lists([tmp_path / "train.list", tmp_path / "other" / "train.list"]) == [
+        "/dl1/a.h5",
+        "/dl1/b.h5",
+        "/dl1/c.h5",
+    ]
+    assert is_file_list(tmp_path / "train.list")
+    assert is_file_list(["a/train.list", "b/train.list"])
+    assert not is_file_list(tmp_path)
+    assert not is_file_list([])
+
+
+def test_compose_merge_dl1_command():
+    cmd = compose_merge_dl1_command(["/a/train.list", "/b/train.list"], "/merged.h5", "--no-image")
+    assert cmd.startswith("lstmcpipe_merge_dl1 --input-lists /a/train.list /b/train.list -o /merged.h5 --no-image &&")
+    assert compose_merge_dl1_command("/dl1", "/merged.h5").startswith("lstchain_merge_hdf5_files -d /dl1")
+    cmd = compose_merge_dl1_command("/dl1", "/merged.h5", incremental=True, virtual=True)
+    assert cmd.startswith("lstmcpipe_merge_dl1 -d /dl1 --virtual -o /merged.h5 &&")
+    with pytest.raises(ValueError):
+        compose_merge_dl1_command("/dl1", "/merged.h5", workflow_kind="ctapipe", virtual=True)
+    cmd = compose_merge_dl1_command("/dl1", "/merged.h5", "--no-image", columns_config="/lstchain.json")
+    assert cmd.startswith("lstmcpipe_merge_dl1 -d /dl1 --columns-config /lstchain.json -o /merged.h5 --no-image &&")
+    cmd = compose_merge_dl1_command("/dl1", "/merged.h5", incremental=True, max_events=1000, subsampling_seed=2)
+    assert cmd.startswith("lstmcpipe_merge_dl1 -d /dl1 --max-events 1000 --seed 2 -o /merged.h5 &&")
+
+
+def test_select_group():
+    files = [f"/dl1/run{ii:02d}.h5" for ii in range(10)]
+    groups = [select_group(files[::-1], group, 3) for group in range(3)]
+    assert sum(groups, []) == files
+    assert [len(group) for group in groups] == [3, 3, 4]
+    assert select_group(files[:1], 0, 2) == []
+
+
+def test_merge_tree(tmp_path):
+    dl1_dir = tmp_path / "DL1"
+    dl1_dir.mkdir()
+    for ii in range(5):
+        (dl1_dir / f"run{ii}.h5").touch()
+    assert estimate_n_merge_inputs(dl1_dir.as_posix()) == 5
+
+    r0_dir = tmp_path / "R0"
+    r0_dir.mkdir()
+    for ii in range(7):
+        (r0_dir / f"run{ii}.simtel.gz").touch()
+    stages = {
+        "r0_to_dl1": [{"input": r0_dir.as_posix(), "output": (tmp_path / "new" / "node_0").as_posix()}],
+        "train_test_split": [
+            {"input": (tmp_path / "new" / "node_0").as_posix(), "output": {"train": "/t/train.list", "test": "/t/x"}}
+        ],
+    }
+    assert estimate_n_merge_inputs((tmp_path / "new").as_posix(), "--pattern */*.h5", stages) == 7
+    assert estimate_n_merge_inputs("/t/train.list", None, stages) == 7
+    assert estimate_n_merge_inputs("/t/other.list", None, stages) is None
+
+    levels = merge_tree_levels(dl1_dir.as_posix(), "/out/merged.h5", "--pattern */*.h5 --no-image", 1000, 10)
+    assert [len(level) for level in levels] == [100, 10, 1]
+    assert "--group 99 --n-groups 100" in levels[0][99]["command"]
+    assert "--pattern '*/*.h5'" in levels[0][0]["command"]
+    assert levels[1][0]["input"] == [f"/out/merged.h5.merge_tree/level0_{ii}.part" for ii in range(10)]
+    assert "--pattern" not in levels[1][0]["command"]
+    assert levels[2][0]["output"] == "/out/merged.h5"
+    assert "rm -r /out/merged.h5.merge_tree" in levels[2][0]["command"]
+    # the empty groups are marked, a missing part makes the next levels fail
+    assert "--mark-empty" in levels[0][0]["command"] and "--mark-empty" in levels[1][0]["command"]
+    assert "--skip-empty" in levels[1][0]["command"] and "--mark-empty" not in levels[2][0]["command"]
+
+    parts = [(tmp_path / f"level0_{ii}.part").as_posix() for ii in range(3)]
+    Path(parts[0]).touch()
+    Path(parts[1] + EMPTY_SUFFIX).touch()
+    with pytest.raises(FileNotFoundError, match="level0_2.part"):
+        non_empty_parts(parts)
+    assert non_empty_parts(parts[:2]) == parts[:1]
+
+    levels = merge_tree_levels(dl1_dir.as_posix(), "/out/merged.h5", None, 20, 10, max_events=100)
+    assert "--max-events" not in levels[0][0]["command"]
+    assert "--max-events 100 --seed 0" in levels[1][0]["command"]
+
+
+def write_dl1(filename, n_events, fields=("obs_id", "event_id", "intensity")):
+    import numpy as np
+    import tables
+
+    parameters = np.zeros(n_events, dtype=[(field, "i8") for field in fields])
+    parameters["event_id"] = np.arange(n_events)
+    with tables.open_file(filename, "w") as file:
+        file.create_table("/dl1/event/telescope/parameters", "LST_LSTCam", parameters, createparents=True)
+        file.create_table("/configuration/instrument", "optics", parameters[:1], createparents=True)
+
+
+def test_incremental_merge(tmp_path):
+    import shutil
+    import tables
+
+    files = [(tmp_path / f"dl1_run{ii}.h5").as_posix() for ii in range(3)]
+    for file in files:
+        write_dl1(file, 10)
+    merged = tmp_path / "merged.h5"
+    shutil.copy(files[0], merged)
+    write_merged_inputs(merged, input_records(files[:1]))
+
+    assert incremental_merge_dl1_files(files, merged) == 2
+    assert incremental_merge_dl1_files(files, merged) == 0
+    with tables.open_file(merged) as file:
+        assert file.root.dl1.event.telescope.parameters.LST_LSTCam.nrows == 30
+    assert sorted(read_merged_inputs(merged)["inputs"]) == files
+
+    os.utime(files[1], (0, 0))
+    with pytest.raises(IncrementalMergeError):
+        incremental_merge_dl1_files(files, merged)
+    with pytest.raises(IncrementalMergeError):
+        incremental_merge_dl1_files([files[0], files[2]], merged)
+
+
+def test_virtual_merge(tmp_path):
+    import pandas as pd
+
+    files = [(tmp_path / f"dl1_run{ii}.h5").as_posix() for ii in range(3)]
+    for ii, file in enumerate(files):
+        write_dl1(file, 5 + ii)
+    merged = tmp_path / "merged" / "merged.h5"
+    virtual_merge_dl1_files(files, merged)
+
+    parameters = pd.read_hdf(merged, "/dl1/event/telescope/parameters/LST_LSTCam")
+    assert list(parameters.columns) == ["obs_id", "event_id", "intensity"]
+    assert list(parameters["event_id"]) == list(range(5)) + list(range(6)) + list(range(7))
+    assert len(pd.read_hdf(merged, "/configuration/instrument/optics")) == 1
+    assert merged.stat().st_size < sum(os.path.getsize(file) for file in files)
+    assert sorted(read_merged_inputs(merged)["inputs"]) == files
+
+    write_dl1(files[1], 6, fields=("obs_id", "event_id"))
+    with pytest.raises(DL1SchemaError, match="dtype"):
+        virtual_merge_dl1_files(files, merged)
+
+
+def test_write_projected_table(tmp_path):
+    import tables
+
+    files = [(tmp_path / f"dl1_run{ii}.h5").as_posix() for ii in range(3)]
+    for file in files:
+        write_dl1(file, 4)
+    merged = tmp_path / "merged.h5"
+    write_projected_table(files[:2], merged, DL1_PARAMETERS_KEY, {"event_id", "obs_id", "mc_energy"})
+    append_dl1_files(files[2:], merged)
+
+    with tables.open_file(merged) as file:
+        parameters = file.get_node(DL1_PARAMETERS_KEY)
+        assert parameters.colnames == ["obs_id", "event_id"]
+        assert list(parameters.col("event_id")) == list(range(4)) * 3
+
+    # the masks are matched to the files by position, also when a file is listed twice
+    import numpy as np
+
+    masked = tmp_path / "masked.h5"
+    masks = [np.array([True, False, False, False]), np.array([False, False, True, True])]
+    write_projected_table([files[0], files[0]], masked, DL1_PARAMETERS_KEY, masks=masks)
+    with tables.open_file(masked) as file:
+        assert list(file.get_node(DL1_PARAMETERS_KEY).col("event_id")) == [0, 2, 3]
+
+
+def mc_events(n_events, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    columns = ["obs_id", "event_id", "mc_energy", "alt_tel", "az_tel", "mc_type"]
+    events = np.zeros(n_events, dtype=[(column, "i8" if column.endswith("id") else "f8") for column in columns])
+    events["event_id"] = np.arange(n_events)
+    # power law spectrum from 10 GeV to 100 TeV
+    events["mc_energy"] = 0.01 * (1 - rng.random(n_events)) ** (-1 / 1.5)
+    events["mc_energy"] = np.minimum(events["mc_energy"], 100)
+    events["alt_tel"] = rng.choice([1.2, 1.4], n_events)
+    events["az_tel"] = 3.1
+    events["mc_type"] = rng.choice([0, 101], n_events)
+    return events
+
+
+def test_stratified_subsample():
+    import numpy as np
+
+    events = mc_events(20000)
+    mask, weights, n_strata = stratified_subsample(events, 2000, seed=1)
+    assert 2000 <= mask.sum() <= 2000 + n_strata
+    assert len(weights) == mask.sum()
+    # the weighted subsample has the size of the full sample, with all its energy bins, pointings and particles
+    assert np.isclose(weights.sum(), len(events))
+    log_energy = np.floor(np.log10(events["mc_energy"]) * 5)
+    assert set(log_energy[mask]) == set(log_energy)
+    assert set(zip(events["alt_tel"][mask], events["mc_type"][mask])) == set(zip(events["alt_tel"], events["mc_type"]))
+
+    assert np.array_equal(stratified_subsample(events, 2000, seed=1)[0], mask)
+    assert not np.array_equal(stratified_subsample(events, 2000, seed=2)[0], mask)
+    assert stratified_subsample(events, 30000)[0].all()
+
+
+def test_subsample_dl1_files(tmp_path):
+    import tables
+
+    files = [(tmp_path / f"dl1_run{ii}.h5").as_posix() for ii in range(2)]
+    for ii, file in enumerate(files):
+        with tables.open_file(file, "w") as h5file:
+            h5file.create_table(
+                "/dl1/event/telescope/parameters", "LST_LSTCam", mc_events(500, seed=ii), createparents=True
+            )
+    masks, subsampling, metadata = subsample_dl1_files(files, 100, seed=3)
+    assert [len(mask) for mask in masks] == [500, 500]
+    assert metadata["n_events"] == 1000 and metadata["n_kept"] == len(subsampling) == sum(m.sum() for m in masks)
+
+    merged = tmp_path / "merged.h5"
+    write_projected_table(files, merged, DL1_PARAMETERS_KEY, masks=masks)
+    write_subsampling_table(merged, subsampling, metadata)
+    with tables.open_file(merged) as file:
+        parameters = file.get_node(DL1_PARAMETERS_KEY).read()
+        weights = file.get_node(SUBSAMPLING_KEY)
+        assert list(parameters["event_id"]) == list(weights.col("event_id"))
+        assert weights.attrs["seed"] == 3
+
+
+def test_subsampled_keys(tmp_path):
+    import tables
+    from numpy.lib.recfunctions import repack_fields
+
+    files = [(tmp_path / f"dl1_run{ii}.h5").as_posix() for ii in range(2)]
+    for ii, file in enumerate(files):
+        events = mc_events(50 + ii, seed=ii)
+        with tables.open_file(file, "w") as h5file:
+            h5file.create_table("/dl1/event/telescope/parameters", "LST_LSTCam", events, createparents=True)
+            trigger = repack_fields(events[["obs_id", "event_id"]])
+            h5file.create_table("/dl1/event/subarray", "trigger", trigger, createparents=True)
+            h5file.create_table("/dl1/event/telescope/monitoring", "pedestal", events[:1], createparents=True)
+            h5file.create_table("/simulation", "run_config", events[:1], createparents=True)
+    keys = [
+        "dl1/event/telescope/parameters/LST_LSTCam",
+        "dl1/event/subarray/trigger",
+        "dl1/event/telescope/monitoring/pedestal",
+        "simulation/run_config",
+    ]
+    # the per-event tables are subsampled, the monitoring and per-run tables are kept whole
+    assert subsampled_keys(files, keys, [50, 51]) == ["dl1/event/subarray/trigger"]
+
+    masks, subsampling, _ = subsample_dl1_files(files, 20, seed=1)
+    merged = tmp_path / "merged.h5"
+    write_projected_table(files, merged, "dl1/event/subarray/trigger", masks=masks)
+    with tables.open_file(merged) as file:
+        assert list(file.get_node("/dl1/event/subarray/trigger").col("event_id")) == list(subsampling["event_id"])
@@ -0,0 +1,79 @@
+import os
+from lstmcpipe.io import file_catalog
+from lstmcpipe.io.data_management import get_input_filelist
+from lstmcpipe.io.file_catalog import FileCatalog, parse_mc_path, use_file_catalog
+
+
+def test_parse_mc_path():
+    path = "/fefs/aswg/data/mc/DL1/AllSky/prod/TrainingDataset/GammaDiffuse/dec_2276/node_theta_10.0_az_102.199_/f.h5"
+    assert parse_mc_path(path) == {
+        "production": "prod",
+        "particle": "GammaDiffuse",
+        "pointing": "node_theta_10.0_az_102.199_",
+        "data_level": "DL1",
+    }
+
+
+def test_file_catalog(tmp_path, monkeypatch):
+    directory = tmp_path / "DL0" / "prod" / "gamma" / "south_pointing"
+    directory.mkdir(parents=True)
+    for ii in range(3):
+        (directory / f"run{ii}.simtel.gz").write_bytes(b"0" * 10)
+    (directory / "run0.log").touch()
+    (directory / "subdir").mkdir()
+    # directories modified within a second of their listing are listed again
+    os.utime(directory, (1, 1))
+
+    catalog = FileCatalog(tmp_path / "catalog.sqlite")
+    expected = sorted(os.path.realpath(directory / f"run{ii}.simtel.gz") for ii in range(3))
+    assert catalog.list_files(directory, "*.simtel.gz") == expected
+    assert catalog.update_tree(tmp_path / "DL0") == 5
+
+    # unmodified directories are not listed again
+    listed = []
+    scandir = os.scandir
+
+    def count_scandir(path):
+        listed.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(file_catalog.os, "scandir", count_scandir)
+    assert catalog.list_files(directory, "*.simtel.gz") == expected
+    assert listed == []
+    (directory / "run1.simtel.gz").unlink()
+    os.utime(directory, (0, 0))
+    assert len(catalog.list_files(directory, "*.simtel.gz")) == 2
+    assert len(listed) == 1
+
+    records = catalog.query(pattern="*.simtel.gz", particle="gamma", data_level="DL0")
+    assert [record["pointing"] for record in records] == ["south_pointing"] * 2
+    assert catalog.query(production="other") == []
+    details = catalog.describe([records[0]["path"]], checksum=True)
+    assert details[records[0]["path"]]["checksum"] == "f1b708bba17f1ce948dc979f4d7092bc"
+
+    try:
+        use_file_catalog(tmp_path / "catalog.sqlite")
+        assert get_input_filelist(directory, glob_pattern="*.simtel.gz") == [record["path"] for record in records]
+    finally:
+        use_file_catalog(None)
+
+
+def test_file_catalog_same_second(tmp_path):
+    directory = tmp_path / "DL1"
+    directory.mkdir()
+    (directory / "dl1_0.h5").write_bytes(b"0")
+    catalog = FileCatalog(tmp_path / "catalog.sqlite")
+    assert len(catalog.list_files(directory)) == 1
+
+    # a file added within the same mtime as the listing
+    mtime = os.stat(directory).st_mtime
+    (directory / "dl1_1.h5").write_bytes(b"1")
+    os.utime(directory, (mtime, mtime))
+    assert len(catalog.list_files(directory)) == 2
+
+    # a file rewritten in place since its checksum was computed
+    path = catalog.list_files(directory, "dl1_0.h5")[0]
+    assert catalog.describe([path], events=False, checksum=True)[path]["checksum"] == file_catalog.file_checksum(path)
+    (directory / "dl1_0.h5").write_bytes(b"00")
+    details = catalog.describe([path], events=False, checksum=True)[path]
+    assert details == {"size": 2, "n_events": None, "checksum": file_catalog.file_checksum(path)}
@@ -0,0 +1,40 @@
+from lstmcpipe.io.job_store import JobStore, parse_sacct, parse_elapsed
+
+SACCT_OUTPUT = """100_0|COMPLETED|00:10:00|0:0
+100_1|FAILED|00:01:00|1:0
+100_2|RUNNING|00:05:00|0:0
+100_[3-4%100]|PENDING|00:00:00|0:0
+101|COMPLETED|1-00:00:00|0:0
+101.batch|COMPLETED|1-00:00:00|0:0
+"""
+
+
+def test_parse_sacct():
+    assert parse_elapsed("1-02:00:10") == 93610
+    assert parse_elapsed("01:30.500") == 90.5
+    records = parse_sacct(SACCT_OUTPUT)
+    assert [record[1] for record in records] == ["100_0", "100_1", "100_2", "100_3", "100_4", "101"]
+    assert records[0] == ("100", "100_0", "COMPLETED", 600, "0:0")
+
+
+def test_job_store(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite")
+    store.add_job("100", "r0_to_dl1", n_tasks=6)
+    store.add_job("101", "merge_dl1", dependencies="100")
+    assert sorted(store.jobids()) == ["100", "101"]
+
+    store.update_tasks(parse_sacct(SACCT_OUTPUT))
+    summary = store.summary()
+    assert summary["r0_to_dl1"]["tasks"] == 6
+    assert summary["r0_to_dl1"]["states"] == {"COMPLETED": 1, "FAILED": 1, "RUNNING": 1, "PENDING": 2, "UNKNOWN": 1}
+    assert summary["r0_to_dl1"]["failed"] == ["100_1"]
+    assert summary["r0_to_dl1"]["mean_runtime"] == 600
+    # 4 remaining tasks of 10 min on 1 running task
+    assert summary["r0_to_dl1"]["eta"] == 2400
+    assert summary["merge_dl1"]["eta"] == 0
+
+    # a new lstmcpipe run (e.g. --resume) only reports its own jobs by default
+    new_store = JobStore(tmp_path / "jobs.sqlite")
+    new_store.add_job("102", "dl1_to_dl2")
+    assert list(new_store.summary()) == ["dl1_to_dl2"]
+    assert len(new_store.summary(all_runs=True)) == 3
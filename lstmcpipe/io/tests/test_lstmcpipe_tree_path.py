@@ -59,9 +59,11 @@ def test_backup_log():
 
 
 def test_create_log_dir():
-    from ..lstmcpipe_tree_path import create_log_dir
+    from ..lstmcpipe_tree_path import create_log_dir, log_dir_path
 
+    assert not log_dir_path("test_prodID").exists()
     log_dirname = create_log_dir("test_prodID")
+    assert log_dirname == log_dir_path("test_prodID")
     assert log_dirname.is_dir()
     assert log_dirname.name == prod_logs.joinpath("logs_test_prodID").name
     log_dirname.rmdir()
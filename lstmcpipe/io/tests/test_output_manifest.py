@@ -0,0 +1,56 @@
+import os
+
+from lstmcpipe.io.output_manifest import (
+    manifest_path,
+    write_output_manifest,
+    verify_output_manifest,
+    is_output_complete,
+    incomplete_paths,
+    compose_output_manifest_command,
+)
+
+
+def test_output_manifest_file(tmp_path):
+    output = tmp_path / "merged.h5"
+    output.write_text("dl1")
+    assert not is_output_complete(output)
+
+    manifest = write_output_manifest(output)
+    assert manifest == manifest_path(output)
+    assert manifest.name == "merged.h5.manifest.json"
+    assert is_output_complete(output.as_posix())
+
+    # touched but same content: accepted through the checksum
+    stat = output.stat()
+    os.utime(output, (stat.st_atime, stat.st_mtime + 10))
+    assert verify_output_manifest(manifest)
+
+    output.write_text("DL1")
+    assert not is_output_complete(output)
+    output.unlink()
+    assert not is_output_complete(output)
+
+
+def test_output_manifest_directories(tmp_path):
+    train, test = tmp_path / "train", tmp_path / "test"
+    for directory in [train, test]:
+        directory.mkdir()
+        directory.joinpath("dl1_run1.h5").write_text("events")
+        write_output_manifest(directory)
+    # slurm logs are not part of the outputs
+    train.joinpath("job_1.o").write_text("log")
+    assert manifest_path(train) == train / ".lstmcpipe_manifest.json"
+    assert is_output_complete({"train": train.as_posix(), "test": test.as_posix(), "ratio": 0.5})
+
+    debug_log = {}
+    dict_paths = [{"output": {"train": train.as_posix(), "test": test.as_posix()}}, {"output": "/not/there.h5"}]
+    assert incomplete_paths(dict_paths, "train_test_split", debug_log) == [dict_paths[1]]
+    assert len(debug_log) == 1
+
+    test.joinpath("dl1_run1.h5").unlink()
+    assert not is_output_complete([train, test])
+
+
+def test_compose_output_manifest_command():
+    cmd = compose_output_manifest_command({"train": "/a/train", "test": "/a/test", "ratio": 0.5})
+    assert cmd == "lstmcpipe_write_output_manifest -o /a/train && lstmcpipe_write_output_manifest -o /a/test"
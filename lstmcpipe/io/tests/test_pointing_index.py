@@ -0,0 +1,95 @@
+import os
+from lstmcpipe.io import pointing_index
+from lstmcpipe.io.pointing_index import (
+    PointingCatalog,
+    PointingIndex,
+    find_pointing_dirs,
+    has_files,
+    pointing_alt_az,
+)
+
+
+def make_pointings(base_dir):
+    for name, n_files in [("node_theta_10.0_az_102.199_", 2), ("node_theta_32.059_az_248.1_", 0)]:
+        r0_dir = base_dir / name / "output_v1.4"
+        r0_dir.mkdir(parents=True)
+        for ii in range(n_files):
+            (r0_dir / f"run{ii}.simtel.gz").write_bytes(b"0" * 10)
+    (base_dir / "not_a_dir.txt").touch()
+
+
+def test_pointing_alt_az():
+    assert pointing_alt_az("node_corsika_theta_10.0_az_102.199_") == (80.0, 102.199)
+    assert pointing_alt_az("misc") is None
+
+
+def test_find_pointing_dirs(tmp_path, monkeypatch):
+    make_pointings(tmp_path)
+
+    def r0_dir(name):
+        return tmp_path / name / "output_v1.4"
+
+    # directories modified within a second of their scan are scanned again
+    for name in os.listdir(tmp_path):
+        if os.path.isdir(tmp_path / name):
+            os.utime(r0_dir(name), (1, 1))
+    assert has_files(r0_dir("node_theta_10.0_az_102.199_"))
+    assert find_pointing_dirs(tmp_path, r0_dir) == ["node_theta_10.0_az_102.199_"]
+
+    index = PointingIndex(tmp_path / "index.json")
+    assert find_pointing_dirs(tmp_path, r0_dir, index=index) == ["node_theta_10.0_az_102.199_"]
+    record = index.records[os.path.abspath(r0_dir("node_theta_10.0_az_102.199_"))]
+    assert (record["alt"], record["az"], record["has_files"]) == (80.0, 102.199, True)
+
+    # unmodified directories are not scanned again by the next calls
+    scanned = []
+
+    def scan_directory(path, suffix=".simtel.gz"):
+        scanned.append(path)
+        return True
+
+    monkeypatch.setattr(pointing_index, "has_files", scan_directory)
+    index = PointingIndex(tmp_path / "index.json")
+    assert find_pointing_dirs(tmp_path, r0_dir, index=index) == ["node_theta_10.0_az_102.199_"]
+    assert scanned == []
+
+    new_r0_dir = r0_dir("node_theta_32.059_az_248.1_")
+    (new_r0_dir / "run0.simtel.gz").touch()
+    os.utime(new_r0_dir, (0, 0))
+    assert len(find_pointing_dirs(tmp_path, r0_dir, index=index)) == 2
+    assert scanned == [os.path.abspath(new_r0_dir)]
+
+
+def test_pointing_index_same_second(tmp_path):
+    r0_dir = tmp_path / "node_theta_10.0_az_102.199_" / "output_v1.4"
+    r0_dir.mkdir(parents=True)
+    index = PointingIndex(tmp_path / "index.json")
+    assert not index.scan({"node": r0_dir})["node"]["has_files"]
+
+    # a simtel file added within the same mtime as the scan of the empty directory
+    mtime = os.stat(r0_dir).st_mtime
+    (r0_dir / "run0.simtel.gz").touch()
+    os.utime(r0_dir, (mtime, mtime))
+    assert PointingIndex(tmp_path / "index.json").scan({"node": r0_dir})["node"]["has_files"]
+
+
+def test_pointing_catalog(tmp_path, monkeypatch):
+    make_pointings(tmp_path)
+    scanned = []
+
+    def list_subdirs(path):
+        scanned.append(path)
+        return os.listdir(path)
+
+    monkeypatch.setattr(pointing_index, "list_subdirs", list_subdirs)
+    catalog = PointingCatalog()
+    for _ in range(3):
+        assert catalog.pointing_dirs(tmp_path, lambda name: tmp_path / name / "output_v1.4") == [
+            "node_theta_10.0_az_102.199_"
+        ]
+    assert scanned == [tmp_path]
+
+    tables = []
+    for _ in range(2):
+        tables.append(catalog.table("key", lambda: {"built": len(tables)}.copy()))
+    assert tables == [{"built": 0}, {"built": 0}]
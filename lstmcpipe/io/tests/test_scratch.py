@@ -0,0 +1,27 @@
+from lstmcpipe.io.scratch import ScratchArea
+
+
+def test_scratch_area(tmp_path):
+    inputs = []
+    for ii in range(2):
+        file = tmp_path / f"run{ii}.simtel.gz"
+        file.write_text(f"r0 {ii}")
+        inputs.append(file)
+    output_dir = tmp_path / "dl1"
+
+    with ScratchArea(base_dir=tmp_path) as scratch:
+        scratch.prefetch(inputs[1])
+        for file in inputs:
+            local_file = scratch.stage_in(file)
+            assert local_file.parent.parent == scratch.directory
+            assert local_file.read_text() == file.read_text()
+            work_dir = scratch.work_dir(file)
+            work_dir.joinpath(file.name.replace(".simtel.gz", ".h5")).write_text("dl1")
+            outputs = scratch.stage_out(work_dir, output_dir)
+            assert outputs == [output_dir / file.name.replace(".simtel.gz", ".h5")]
+            scratch.release(local_file)
+            assert not local_file.exists()
+        directory = scratch.directory
+
+    assert not directory.exists()
+    assert sorted(f.name for f in output_dir.iterdir()) == ["run0.h5", "run1.h5"]
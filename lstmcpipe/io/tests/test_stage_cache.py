@@ -0,0 +1,90 @@
+import json
+import os
+import time
+
+from lstmcpipe.io.output_manifest import write_output_manifest, is_output_complete, manifest_path, read_output_manifest
+from lstmcpipe.io.stage_cache import StageCache, get_stage_cache, path_digest
+
+
+def test_path_digest(tmp_path):
+    file_a = tmp_path / "dl1_a.h5"
+    file_b = tmp_path / "dl1_b.h5"
+    file_a.write_text("events")
+    file_b.write_text("events")
+    assert path_digest(tmp_path / "missing.h5") is None
+    # files are identified by their content only
+    assert path_digest(file_a) == path_digest(file_b)
+    write_output_manifest(file_a)
+    assert path_digest(file_a) == path_digest(file_b)
+
+
+def test_stage_cache(tmp_path):
+    cache = StageCache(tmp_path / "cache")
+    config = tmp_path / "lstchain_config.json"
+    config.write_text(json.dumps({"a": 1, "b": 2}))
+    gamma, proton = tmp_path / "gamma.h5", tmp_path / "proton.h5"
+    gamma.write_text("gamma")
+    proton.write_text("proton")
+
+    models = tmp_path / "prod1" / "models"
+    # the lookup does not read the inputs without manifest
+    assert cache.key("train_pipe", [gamma, proton], config, "env1", manifest_only=True) is None
+    write_output_manifest(gamma)
+    write_output_manifest(proton)
+    restored, store_cmd = cache.restore_or_store_command("train_pipe", [gamma, proton], config, "env1", models)
+    assert not restored
+    assert store_cmd.startswith("lstmcpipe_cache_store")
+
+    models.mkdir(parents=True)
+    models.joinpath("reg_energy.sav").write_text("model")
+    models.joinpath("train_job_1.o").write_text("log")
+    key = cache.key("train_pipe", [gamma, proton], config, "env1")
+    cache.store("train_pipe", key, models)
+
+    # same config with a different formatting
+    config.write_text(json.dumps({"b": 2, "a": 1}, indent=2))
+    new_models = tmp_path / "prod2" / "models"
+    restored, _ = cache.restore_or_store_command("train_pipe", [gamma, proton], config, "env1", new_models)
+    assert restored
+    assert new_models.joinpath("reg_energy.sav").read_text() == "model"
+    assert not new_models.joinpath("train_job_1.o").exists()
+    assert is_output_complete(new_models)
+
+    # the inputs are being produced by pending jobs: the files at their paths may be stale
+    pending_models = tmp_path / "prod3" / "models"
+    restored, store_cmd = cache.restore_or_store_command(
+        "train_pipe", [gamma, proton], config, "env1", pending_models, pending=True
+    )
+    assert not restored and store_cmd.startswith("lstmcpipe_cache_store")
+    assert not pending_models.exists()
+
+    # another environment is another entry
+    assert not cache.restore_or_store_command("train_pipe", [gamma, proton], config, "env2", new_models)[0]
+
+    dl2 = tmp_path / "dl2.h5"
+    dl2.write_text("dl2")
+    cache.store("dl1_to_dl2", cache.key("dl1_to_dl2", [gamma, models], config, "env1"), dl2)
+    assert len(cache.entries()) == 2
+
+    # the manifest of the restored models has the checksums of the entry: the next stage is found in the cache
+    assert all(record["sha256"] for record in read_output_manifest(manifest_path(new_models)).values())
+    new_dl2 = tmp_path / "prod2" / "dl2.h5"
+    assert cache.restore_or_store_command("dl1_to_dl2", [gamma, new_models], config, "env1", new_dl2)[0]
+    assert new_dl2.read_text() == "dl2"
+
+    entry = cache.entry_dir("train_pipe", key)
+    old = time.time() - 10 * 86400
+    os.utime(entry.joinpath("cache_entry.json"), (old, old))
+    cache.max_age_days = 5
+    assert cache.evict() == [entry]
+    cache.max_age_days = None
+    cache.max_size_gb = 0
+    assert len(cache.evict()) == 1
+    assert cache.entries() == []
+
+
+def test_get_stage_cache(tmp_path):
+    assert get_stage_cache({}, "train_pipe") is None
+    batch_config = {"stage_cache": {"directory": tmp_path.as_posix(), "stages": ["train_pipe"]}}
+    assert get_stage_cache(batch_config, "train_pipe").directory == tmp_path
+    assert get_stage_cache(batch_config, "dl1_to_dl2") is None
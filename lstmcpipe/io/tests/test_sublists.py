@@ -0,0 +1,45 @@
+import os
+
+from lstmcpipe.io.sublists import (
+    pack_lpt,
+    build_sublists,
+    write_runtimes,
+    read_runtime_history,
+)
+
+
+def test_pack_lpt():
+    costs = [10, 1, 1, 8, 2, 2]
+    bins = pack_lpt(costs, 2)
+    assert sorted(i for indices in bins for i in indices) == list(range(6))
+    assert [sum(costs[i] for i in indices) for indices in bins] == [12, 12]
+    # never more bins than files
+    assert len(pack_lpt([1, 2], 5)) == 2
+
+
+def test_build_sublists(tmp_path):
+    files = []
+    for ii, size in enumerate([400, 100, 100, 100, 100, 300]):
+        file = tmp_path / f"run{ii}.simtel.gz"
+        file.write_bytes(b"0" * size)
+        files.append(file.as_posix())
+
+    # without history: same number of tasks as before, balanced by size
+    sublists = build_sublists(files, files_per_task=3)
+    assert len(sublists) == 2
+    assert sorted(f for sublist in sublists for f in sublist) == sorted(files)
+    sizes = [sum(os.path.getsize(f) for f in sublist) for sublist in sublists]
+    assert sizes == [500, 600] or sizes == [600, 500]
+
+    # with history: number of tasks given by the targeted walltime
+    sublist = tmp_path / "r0_to_dl1_0.sublist"
+    write_runtimes(sublist, {files[0]: {"size": 400, "runtime": 40.0}, files[1]: {"size": 100, "runtime": 10.0}})
+    history = read_runtime_history([tmp_path.as_posix()])
+    assert len(history) == 2
+    sublists = build_sublists(files, files_per_task=3, target_task_walltime=30, history=history)
+    assert len(sublists) == 4
+    assert build_sublists([], files_per_task=3) == []
+
+    # the number of tasks is bounded by the number of files and by the maximum array size
+    assert len(build_sublists(files, files_per_task=3, target_task_walltime=1, history=history)) == 6
+    assert len(build_sublists(files, files_per_task=3, target_task_walltime=1, history=history, max_tasks=3)) == 3
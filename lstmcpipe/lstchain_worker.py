@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+# In-process execution of the lstchain steps run on every file of a sublist by the core scripts.
+# lstchain (and ctapipe, numba...) is imported once per task and the configuration is parsed once, instead of
+# paying the interpreter startup and the imports for every file with a `lstchain_*` subprocess.
+# Any failure falls back to the subprocess command through `lstmcpipe.utils.rerun_cmd`.
+
+import sys
+import shutil
+import logging
+from functools import lru_cache
+from importlib.util import find_spec
+from pathlib import Path
+
+from .utils import rerun_cmd, prod_logs
+
+log = logging.getLogger(__name__)
+
+
+class LstchainWorker:
+    """
+    Run the lstchain `r0_to_dl1` and `dl1ab` steps within the current python process.
+
+    Parameters
+    ----------
+    config_file: str or Path or None
+        lstchain configuration file
+    """
+
+    def __init__(self, config_file=None):
+        self.config_file = None if config_file is None else Path(config_file).absolute()
+        self._config = None
+
+    @property
+    def config(self):
+        if self._config is None:
+            from lstchain.io.config import read_configuration_file
+
+            self._config = {} if self.config_file is None else read_configuration_file(self.config_file)
+        return self._config
+
+    def r0_to_dl1(self, input_file, output_file):
+        """
+        Same as `lstchain_mc_r0_to_dl1 --input-file input_file --config config_file`
+        """
+        from lstchain.reco import r0_to_dl1
+
+        Path(output_file).parent.mkdir(exist_ok=True, parents=True)
+        r0_to_dl1.r0_to_dl1(Path(input_file), output_filename=Path(output_file), custom_config=self.config)
+
+    def dl1ab(self, input_file, output_file):
+        """
+        Same as `lstchain_dl1ab --no-image --input-file input_file --output-file output_file --config config_file`
+        """
+        from lstchain.scripts import lstchain_dl1ab
+
+        argv = ["lstchain_dl1ab", "--no-image", f"--input-file={input_file}", f"--output-file={output_file}"]
+        if self.config_file is not None:
+            argv.append(f"--config={self.config_file}")
+        # lstchain_dl1ab only exposes its command line interface
+        sys_argv = sys.argv
+        sys.argv = argv
+        try:
+            lstchain_dl1ab.main()
+        finally:
+            sys.argv = sys_argv
+
+    def run(self, step, input_file, output_file, cmd, max_ntry=2, failed_jobs_dir=prod_logs / "failed_outputs"):
+        """
+        Run a step in process, falling back to the subprocess `cmd` if it fails.
+
+        Parameters
+        ----------
+        step: str
+            "r0_to_dl1" or "dl1ab"
+        input_file: str or Path
+        output_file: str or Path
+        cmd: list
+            Equivalent command, run with `rerun_cmd` if the in-process execution fails
+        max_ntry: int
+            Maximum number of attempts of the subprocess command
+        failed_jobs_dir: Path or str
+            Subdirectory to move failed output files to
+
+        Returns
+        -------
+        int: number of subprocess tries, 0 if the step succeeded in process
+        """
+        try:
+            getattr(self, step)(input_file, output_file)
+            return 0
+        except (Exception, SystemExit) as e:
+            log.warning(f"In-process {step} of {input_file} failed ({e!r}), falling back to {cmd[0]}")
+
+        output_file = Path(output_file)
+        if output_file.exists():
+            failed_jobs_dir = Path(failed_jobs_dir)
+            failed_jobs_dir.mkdir(exist_ok=True)
+            shutil.move(output_file, failed_jobs_dir.joinpath(output_file.name))
+        return rerun_cmd(cmd, output_file, max_ntry=max_ntry, failed_jobs_dir=failed_jobs_dir)
+
+
+@lru_cache(maxsize=None)
+def get_lstchain_worker(in_process, config_file=None):
+    """
+    `LstchainWorker` if the in-process mode is requested and lstchain can be imported, None otherwise.
+    A single worker is created per process and configuration, so that the configuration is parsed once.
+    """
+    if not in_process:
+        return None
+    if find_spec("lstchain") is None:
+        log.warning("lstchain can not be imported, files are processed with lstchain subprocesses")
+        return None
+    return LstchainWorker(config_file)
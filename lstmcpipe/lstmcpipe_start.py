@@ -29,6 +29,15 @@ from lstmcpipe.io.lstmcpipe_tree_path import (
 from lstmcpipe.utils import (
     batch_mc_production_check,
 )
+from lstmcpipe.executors import get_executor
+from lstmcpipe.io.job_store import JobStore, job_store_filename
+from lstmcpipe.io.file_catalog import use_file_catalog
+from lstmcpipe.resource_tuning import ResourceTuner
+from lstmcpipe.controller import Controller
+from lstmcpipe.planner import ProductionPlanner, format_plan, write_plan
+from lstmcpipe.submission_queue import SubmissionQueue, queue_filename, account_job_limit, start_drainer
+from lstmcpipe.dependency_graph import DependencyGraph
+from lstmcpipe.io.stage_cache import StageCache
 from lstmcpipe.stages import (
     batch_process_dl1,
     batch_train_test_splitting,
@@ -91,6 +100,38 @@ def build_argparser():
         default=None,
     )
 
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume a production: outputs with a valid manifest from a previous run are kept and not processed "
+        "again, only the missing or stale ones are submitted.",
+    )
+
+    parser.add_argument(
+        "--plan",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="PLAN_FILE",
+        help="Do not submit anything: report the jobs, array sizes, core-hours and output volume of each stage and "
+        "write them as JSON in PLAN_FILE (default: plan_{prod_id}.json).",
+    )
+
+    parser.add_argument(
+        "--controller",
+        action="store_true",
+        help="Stay alive and submit each stage once the jobs of the previous one are over, instead of submitting "
+        "all the stages at once chained by slurm dependencies. A stage is accepted if the fraction of its "
+        "succeeded tasks is at least the `min_success_fraction` of the `controller` section of the config.",
+    )
+
+    parser.add_argument(
+        "--yes",
+        "-y",
+        action="store_true",
+        help="Do not ask for confirmation, e.g. to run lstmcpipe --controller as a batch job.",
+    )
+
     parser.add_argument("--debug", action="store_true", help="print debug messages to stderr")
     parser.add_argument(
         "--log-file",
@@ -109,6 +150,8 @@ def main():
     Main lstmcpipe script. This will launch the selected stages and start the processing.
     The jobs are submitted, but not awaited meaning that the analysis will be going on after
     the script has exited. To look at the submitted jobs, you can use e.g. `squeue -u $USER`.
+    With the `local` executor (`executor: local` in the lstmcpipe config), the jobs are run on the
+    current machine and the script only exits once all of them are over.
 
     Arguments, that can be passed via the command line:
     ---------------------------------------------------
@@ -124,6 +167,18 @@ def main():
         same for HIPERTA
     --log-file
         Optional: path to a file where lstmcpipe logging will be written to.
+    --resume
+        Resume a production after a partial failure. Outputs already produced (with a valid output manifest,
+        see `lstmcpipe.io.output_manifest`) are kept and only the missing or stale ones are reprocessed.
+    --plan
+        Only report the jobs that would be submitted with the estimated resources and output volume of each stage,
+        see `lstmcpipe.planner`, and write them as JSON.
+    --controller
+        Submit each stage only once the previous one is over, see `lstmcpipe.controller`. lstmcpipe then runs
+        until the end of the production, e.g. as a long and light batch job:
+        `sbatch -p long --mem=2G --wrap="lstmcpipe -c config.yml -conf_lst lstchain.json --controller --yes"`
+    --yes / -y
+        Do not ask for confirmation.
     --debug
         Toggle to enable debug print messages.
     """
@@ -134,17 +189,77 @@ def main():
     log.info("Starting lstmcpipe processing script")
     # Read MC production configuration file
     lstmcpipe_config = load_config(args.config_mc_prod)
-    query_continue("Are you sure ?")
+    use_file_catalog(lstmcpipe_config["batch_config"].get("file_catalog"))
+    if args.plan is not None:
+        resource_tuning = lstmcpipe_config["batch_config"].get("resource_tuning")
+        planner = ProductionPlanner(
+            lstmcpipe_config,
+            resource_tuner=ResourceTuner.from_config(resource_tuning) if resource_tuning else None,
+            output_ratios=(lstmcpipe_config.get("plan") or {}).get("output_ratios"),
+        )
+        plan = planner.plan()
+        print(format_plan(plan))
+        write_plan(plan, args.plan or f"plan_{lstmcpipe_config['prod_id']}.json")
+        return
+    if not args.yes:
+        query_continue("Are you sure ?")
 
     # Load variables
     prod_id = lstmcpipe_config["prod_id"]
     workflow_kind = lstmcpipe_config["workflow_kind"]
     batch_config = lstmcpipe_config["batch_config"]
+    # a single executor instance is shared by all the stages to keep track of the jobs dependencies
+    batch_config["executor"] = get_executor(batch_config["executor"])
+    batch_config["resume"] = args.resume
+    if batch_config.get("resource_tuning"):
+        batch_config["executor"].resource_tuner = ResourceTuner.from_config(batch_config["resource_tuning"])
+    if batch_config.get("stage_cache"):
+        cache_config = batch_config["stage_cache"]
+        StageCache(
+            cache_config["directory"],
+            max_age_days=cache_config.get("max_age_days"),
+            max_size_gb=cache_config.get("max_size_gb"),
+        ).evict()
     stages_to_run = lstmcpipe_config["stages_to_run"]
 
     # Create log files and log directory
     logs_files, scancel_file, logs_dir = create_log_files(prod_id)
+    # all the submitted jobs are recorded for `lstmcpipe_status`
+    batch_config["executor"].job_store = JobStore(job_store_filename(logs_dir, prod_id))
+    job_limit = batch_config.get("max_submitted_jobs")
+    if job_limit == "auto":
+        job_limit = account_job_limit()
+        log.info(f"Slurm job limit of the account: {job_limit}")
+    if job_limit is not None and batch_config["executor"].name == "slurm":
+        # jobs above the limit are queued and submitted as capacity frees, see `lstmcpipe.submission_queue`
+        batch_config["executor"].job_limit = int(job_limit)
+        batch_config["executor"].submission_queue = SubmissionQueue(
+            queue_filename(logs_dir, prod_id),
+            scancel_file=scancel_file,
+            job_store=job_store_filename(logs_dir, prod_id),
+        )
     all_job_ids = {}
+    # jobs only wait for the jobs producing their actual inputs
+    dependency_graph = DependencyGraph()
+
+    controller = None
+    if args.controller:
+        if batch_config["executor"].name == "slurm":
+            controller = Controller.from_config(batch_config["executor"], batch_config.get("controller"))
+        else:
+            log.warning("The controller mode is only used with the slurm executor, local jobs are already awaited")
+
+    def wait_for_stage(stage, jobids):
+        """
+        In controller mode, wait for the jobs of a stage and record them: the following stages then have no
+        dependency to wait for.
+        """
+        all_job_ids[stage] = jobids
+        if controller is None:
+            return jobids
+        all_job_ids[stage] = controller.wait_for_stage(stage, jobids)
+        dependency_graph.clear()
+        return None
 
     # 1 STAGE --> R0/1 to DL1 or reprocessing of existing dl1a files
     r0_to_dl1 = "r0_to_dl1" in stages_to_run
@@ -172,13 +287,11 @@ def main():
             workflow_kind=workflow_kind,
             new_production=r0_to_dl1,
             logs=logs_files,
+            dependency_graph=dependency_graph,
         )
 
         update_scancel_file(scancel_file, jobs_from_dl1_processing)
-        if r0_to_dl1:
-            all_job_ids.update({"r0_dl1": jobs_from_dl1_processing})
-        else:
-            all_job_ids.update({"dl1ab": jobs_from_dl1_processing})
+        jobs_from_dl1_processing = wait_for_stage("r0_dl1" if r0_to_dl1 else "dl1ab", jobs_from_dl1_processing)
     else:
         jobs_from_dl1_processing = None
 
@@ -189,10 +302,11 @@ def main():
             jobids_from_r0dl1=jobs_from_dl1_processing,
             batch_config=batch_config,
             logs=logs_files,
+            dependency_graph=dependency_graph,
         )
 
         update_scancel_file(scancel_file, jobs_from_splitting)
-        all_job_ids.update({"train_test_split": jobs_from_splitting})
+        jobs_from_splitting = wait_for_stage("train_test_split", jobs_from_splitting)
     else:
         jobs_from_splitting = None
 
@@ -209,10 +323,13 @@ def main():
             batch_config=batch_config,
             workflow_kind=workflow_kind,
             logs=logs_files,
+            dependency_graph=dependency_graph,
+            stages=lstmcpipe_config["stages"],
+            config_file=Path(args.config_file_lst).resolve().as_posix(),
         )
 
         update_scancel_file(scancel_file, jobs_from_merge)
-        all_job_ids.update({"merge_and_copy_dl1": jobs_from_merge})
+        jobs_from_merge = wait_for_stage("merge_and_copy_dl1", jobs_from_merge)
     else:
         jobs_from_merge = None
 
@@ -224,10 +341,11 @@ def main():
             config_file=Path(args.config_file_lst).resolve().as_posix(),
             batch_config=batch_config,
             logs=logs_files,
+            dependency_graph=dependency_graph,
         )
 
         update_scancel_file(scancel_file, job_from_train_pipe)
-        all_job_ids.update({"train_pipe": job_from_train_pipe})
+        job_from_train_pipe = wait_for_stage("train_pipe", job_from_train_pipe)
 
         # Plot the RF feature's importance
         job_from_plot_rf_feat = batch_plot_rf_features(
@@ -236,22 +354,20 @@ def main():
             batch_config,
             job_from_train_pipe,
             logs=logs_files,
+            dependency_graph=dependency_graph,
         )
         update_scancel_file(scancel_file, job_from_plot_rf_feat)
-        all_job_ids.update({"plot_rf_feat": job_from_plot_rf_feat})
+        job_from_plot_rf_feat = wait_for_stage("plot_rf_feat", job_from_plot_rf_feat)
 
     else:
         job_from_train_pipe = None
 
     # 4 STAGE --> DL1 to DL2 stage
     if "dl1_to_dl2" in stages_to_run:
-        jobs_dependency_for_dl1_dl2 = jobs_from_merge
-        if job_from_train_pipe is not None:
-            jobs_dependency_for_dl1_dl2 = (
-                ",".join([jobs_dependency_for_dl1_dl2, job_from_train_pipe])
-                if jobs_dependency_for_dl1_dl2 is not None
-                else job_from_train_pipe
-            )
+        # stages fully resumed from a previous run have no job to depend on
+        jobs_dependency_for_dl1_dl2 = (
+            ",".join(jobids for jobids in [jobs_from_merge, job_from_train_pipe] if jobids) or None
+        )
 
         jobs_from_dl1_dl2 = batch_dl1_to_dl2(
             lstmcpipe_config["stages"]["dl1_to_dl2"],
@@ -259,10 +375,11 @@ def main():
             jobs_dependency_for_dl1_dl2,
             batch_config=batch_config,
             logs=logs_files,
+            dependency_graph=dependency_graph,
         )
 
         update_scancel_file(scancel_file, jobs_from_dl1_dl2)
-        all_job_ids.update({"dl1_to_dl2": jobs_from_dl1_dl2})
+        jobs_from_dl1_dl2 = wait_for_stage("dl1_to_dl2", jobs_from_dl1_dl2)
     else:
         jobs_from_dl1_dl2 = None
 
@@ -274,10 +391,11 @@ def main():
             jobs_from_dl1_dl2,
             batch_config=batch_config,
             logs=logs_files,
+            dependency_graph=dependency_graph,
         )
 
         update_scancel_file(scancel_file, jobs_from_dl2_irf)
-        all_job_ids.update({"dl2_to_irfs": jobs_from_dl2_irf})
+        jobs_from_dl2_irf = wait_for_stage("dl2_to_irfs", jobs_from_dl2_irf)
 
     # 6 STAGE --> DL2 to sensitivity curves
     if "dl2_to_sensitivity" in stages_to_run:
@@ -286,23 +404,38 @@ def main():
             jobs_from_dl1_dl2,
             batch_config=batch_config,
             logs=logs_files,
+            dependency_graph=dependency_graph,
         )
 
         update_scancel_file(scancel_file, jobs_from_dl2_sensitivity)
-        all_job_ids.update({"dl2_to_sensitivity": jobs_from_dl2_sensitivity})
-
-    # Check DL2 jobs and the full workflow if it has finished correctly
-    jobid_check = batch_mc_production_check(
-        all_job_ids,
-        log_directory=logs_dir,
-        prod_id=prod_id,
-        prod_config_file=args.config_mc_prod,
-        batch_config=batch_config,
-        logs_files=logs_files,
-    )
+        jobs_from_dl2_sensitivity = wait_for_stage("dl2_to_sensitivity", jobs_from_dl2_sensitivity)
+
+    if batch_config["executor"].name == "slurm":
+        # Check DL2 jobs and the full workflow if it has finished correctly
+        jobid_check = batch_mc_production_check(
+            all_job_ids,
+            log_directory=logs_dir,
+            prod_id=prod_id,
+            prod_config_file=args.config_mc_prod,
+            batch_config=batch_config,
+            logs_files=logs_files,
+            # in controller mode, the jobs are already over and some may have failed
+            wait_for_jobs=controller is None,
+        )
 
-    update_scancel_file(scancel_file, jobid_check)
-    log.info("Finished lstmcpipe processing script. All jobs have been submitted")
+        update_scancel_file(scancel_file, jobid_check)
+        if batch_config["executor"].n_queued:
+            start_drainer(batch_config["executor"].submission_queue.filename, batch_config["executor"].job_limit)
+            log.info(
+                f"Finished lstmcpipe processing script. {batch_config['executor'].n_queued} jobs are queued in "
+                f"{batch_config['executor'].submission_queue.filename} and will be submitted in the background"
+            )
+        else:
+            log.info("Finished lstmcpipe processing script. All jobs have been submitted")
+    else:
+        log.info("All jobs have been submitted to the local executor, waiting for them to finish")
+        batch_config["executor"].wait()
+        log.info("Finished lstmcpipe processing script. All local jobs are over")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+# Dry-run planning of a production, used by `lstmcpipe --plan`.
+# The stages of the lstmcpipe config are expanded into the jobs that would be submitted, without submitting
+# anything, with an estimate of the core-hours and of the storage they need:
+#  - the r0_to_dl1 array sizes are computed with the same sublists packing as the actual submission,
+#  - the runtimes come from the `*.runtimes.json` files of previous productions (DL1 stages) and from the
+#    `check_MC_*.txt` accounting of previous productions (other stages, see `lstmcpipe.resource_tuning`),
+#  - the output volumes are the input volumes times the output/input ratio measured in previous productions, or
+#    given in the `plan` section of the config. Inputs that do not exist yet are the estimated outputs of the
+#    previous stages.
+
+import os
+import json
+import logging
+from math import ceil
+from pathlib import Path
+from statistics import median
+
+from .dependency_graph import _flatten_paths
+from .io.data_management import get_input_filelist
+from .io.dl1_merge import is_file_list, read_file_lists
+from .io.sublists import estimate_costs, read_runtime_history
+from .stages.mc_process_dl1 import _cpus_per_task, r0_to_dl1_history, r0_to_dl1_sublists
+
+log = logging.getLogger(__name__)
+
+# stages of the lstmcpipe config, in processing order, with the jobs submitted for each of their entries
+# (named as in `lstmcpipe.resource_tuning.JOB_NAME_STAGES`)
+STAGE_JOBS = {
+    "r0_to_dl1": ["r0_to_dl1"],
+    "dl1ab": ["dl1ab"],
+    "train_test_split": ["train_test_splitting"],
+    "merge_dl1": ["merge_dl1"],
+    "train_pipe": ["train_pipe", "RF_importance"],
+    "dl1_to_dl2": ["dl1_to_dl2"],
+    "dl2_to_irfs": ["dl2_to_irfs"],
+    "dl2_to_sensitivity": ["dl2_sens", "dl2_sens_plot"],
+}
+# stages submitted as a single job array with `array_submission`
+ARRAY_STAGES = ("merge_dl1", "dl1_to_dl2", "dl2_to_irfs")
+# output/input volume ratios used when no measurement is available
+DEFAULT_OUTPUT_RATIOS = {"dl1ab": 1.0, "train_test_split": 1.0, "merge_dl1": 1.0}
+# stages moving their inputs instead of writing new files
+MOVING_STAGES = ("train_test_split",)
+DL1_FILES_PER_JOB = {"r0_to_dl1": 50, "dl1ab": 50}
+
+
+def path_size(path):
+    """
+    Size in bytes of a file, of all the files of a directory or of the files listed in a `.list` manifest,
+    None if it does not exist.
+    """
+    path = Path(path)
+    if path.is_file() and is_file_list(path):
+        return sum(os.path.getsize(file) for file in read_file_lists([path]))
+    if path.is_file():
+        return path.stat().st_size
+    if not path.is_dir():
+        return None
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def measured_output_ratio(history):
+    """
+    Median output/input volume ratio of the files of a runtime history, None if not recorded.
+    """
+    ratios = [record["output_size"] / record["size"] for record in history.values() if record.get("output_size")]
+    return median(ratios) if ratios else None
+
+
+class ProductionPlanner:
+    """
+    Expand the stages of a lstmcpipe config into the jobs to be submitted.
+
+    Parameters
+    ----------
+    lstmcpipe_config: dict
+        Complete lstmcpipe config, see `lstmcpipe.config.load_config`
+    resource_tuner: `lstmcpipe.resource_tuning.ResourceTuner` or None
+        Accounting of previous productions, used for the runtimes of the non-DL1 stages
+    output_ratios: dict or None
+        {stage: output/input volume ratio}, overriding the measured and default ratios
+    """
+
+    def __init__(self, lstmcpipe_config, resource_tuner=None, output_ratios=None):
+        self.config = lstmcpipe_config
+        self.batch_config = lstmcpipe_config["batch_config"]
+        self.resource_tuner = resource_tuner
+        self.output_ratios = dict(DEFAULT_OUTPUT_RATIOS, **(output_ratios or {}))
+        # estimated sizes of the outputs of the planned stages: [(stage_index, path, bytes)]
+        self._outputs = []
+        self._stage_index = 0
+
+    def input_size(self, inputs):
+        """
+        Size of the inputs of a job: measured if they exist, otherwise estimated from the outputs of the last
+        planned stage producing them.
+        """
+        total = 0
+        for path in _flatten_paths(inputs):
+            size = path_size(path)
+            if size is None:
+                related = [
+                    (stage_index, output_size)
+                    for stage_index, output_path, output_size in self._outputs
+                    if output_path == path or path in output_path.parents or output_path in path.parents
+                ]
+                if not related:
+                    return None
+                last = max(stage_index for stage_index, _ in related)
+                sizes = [output_size for stage_index, output_size in related if stage_index == last]
+                if None in sizes:
+                    return None
+                size = sum(sizes)
+            total += size
+        return total
+
+    def _register_outputs(self, outputs, size):
+        paths = _flatten_paths(outputs)
+        for path in paths:
+            self._outputs.append((self._stage_index, path, None if size is None else size / len(paths)))
+
+    def _job_runtime(self, job_stage):
+        """
+        Median runtime of the jobs of a stage in previous productions, None if unknown.
+        """
+        if self.resource_tuner is None:
+            return None
+        times = [record["elapsed"] for record in self.resource_tuner.history.get(job_stage, []) if record["elapsed"]]
+        return median(times) if times else None
+
+    def plan_dl1_stage(self, stage, entries):
+        plan = {"jobs": 0, "array_sizes": [], "input_files": 0, "input_bytes": 0, "output_bytes": 0, "core_hours": 0}
+        history = read_runtime_history(self.batch_config.get("r0_dl1_runtime_history", []))
+        ratio = self.output_ratios.get(stage, measured_output_ratio(history) if stage == "r0_to_dl1" else None)
+        for paths in entries:
+            files = get_input_filelist(paths["input"], glob_pattern="*.simtel.gz" if stage == "r0_to_dl1" else "*.h5")
+            n_workers = _cpus_per_task(paths.get("extra_slurm_options"))
+            if stage == "r0_to_dl1":
+                # same sublists and runtimes history as the submission
+                n_tasks = len(
+                    r0_to_dl1_sublists(files, paths["output"], self.batch_config, paths.get("extra_slurm_options"))
+                )
+                entry_history = r0_to_dl1_history(paths["output"], self.batch_config)
+            else:
+                n_tasks = ceil(len(files) / (DL1_FILES_PER_JOB[stage] * n_workers))
+            if n_tasks == 0:
+                continue
+
+            size = sum(Path(file).stat().st_size for file in files)
+            costs, in_seconds = estimate_costs(files, entry_history if stage == "r0_to_dl1" else None)
+            if in_seconds:
+                core_hours = sum(costs) / 3600
+            else:
+                runtime = self._job_runtime(STAGE_JOBS[stage][0])
+                core_hours = None if runtime is None else n_tasks * runtime * n_workers / 3600
+            output_size = None if ratio is None else size * ratio
+            self._register_outputs(paths["output"], output_size)
+
+            plan["jobs"] += 1
+            plan["array_sizes"].append(n_tasks)
+            plan["input_files"] += len(files)
+            plan["input_bytes"] += size
+            plan["output_bytes"] = _add(plan["output_bytes"], output_size)
+            plan["core_hours"] = _add(plan["core_hours"], core_hours)
+        return plan
+
+    def plan_stage(self, stage, entries):
+        plan = {"jobs": 0, "array_sizes": [], "input_files": 0, "input_bytes": 0, "output_bytes": 0, "core_hours": 0}
+        ratio = self.output_ratios.get(stage)
+        for paths in entries:
+            size = self.input_size(paths.get("input"))
+            output_size = None if size is None or ratio is None else size * ratio
+            cpus = int((paths.get("extra_slurm_options") or {}).get("cpus-per-task", 1))
+            for job_stage in STAGE_JOBS[stage]:
+                runtime = self._job_runtime(job_stage)
+                plan["core_hours"] = _add(plan["core_hours"], None if runtime is None else runtime * cpus / 3600)
+            self._register_outputs(paths.get("output"), output_size)
+            plan["jobs"] += len(STAGE_JOBS[stage])
+            plan["input_files"] += len(_flatten_paths(paths.get("input")))
+            plan["input_bytes"] = _add(plan["input_bytes"], size)
+            plan["output_bytes"] = _add(plan["output_bytes"], output_size)
+        if entries and stage in ARRAY_STAGES and self.batch_config.get("array_submission", False):
+            plan["jobs"] = 1
+            plan["array_sizes"] = [len(entries)]
+        return plan
+
+    def plan(self):
+        """
+        Returns
+        -------
+        dict: {"prod_id", "stages": {stage: plan}, "total": {"jobs", "tasks", "core_hours", "output_bytes"}}
+            with, for each stage, the number of `jobs`, the `array_sizes` of the array jobs, the number of
+            `tasks` (array tasks and single jobs) and the `input_files`, `input_bytes`, `output_bytes` and
+            `core_hours`. Estimates that can not be computed are None.
+        """
+        stages_to_run = self.config["stages_to_run"]
+        plans = {}
+        for self._stage_index, stage in enumerate(STAGE_JOBS):
+            if stage not in stages_to_run:
+                continue
+            entries = self.config["stages"].get(stage) or []
+            if stage in DL1_FILES_PER_JOB:
+                plans[stage] = self.plan_dl1_stage(stage, entries)
+            else:
+                plans[stage] = self.plan_stage(stage, entries)
+            plan = plans[stage]
+            plan["tasks"] = sum(plan["array_sizes"]) + plan["jobs"] - len(plan["array_sizes"])
+            if stage in MOVING_STAGES:
+                plan["new_bytes"] = 0
+            else:
+                plan["new_bytes"] = plan["output_bytes"]
+
+        total = {"jobs": 0, "tasks": 0, "core_hours": 0, "new_bytes": 0}
+        for plan in plans.values():
+            for key in total:
+                total[key] = _add(total[key], plan[key])
+        return {"prod_id": self.config.get("prod_id"), "stages": plans, "total": total}
+
+
+def _add(total, value):
+    return None if total is None or value is None else total + value
+
+
+def format_plan(plan):
+    """
+    Format a production plan as a table, one line per stage.
+    """
+
+    def fmt(value, scale=1, unit=""):
+        return "?" if value is None else f"{value / scale:.1f}{unit}"
+
+    lines = [f"{'stage':<20}{'jobs':>7}{'tasks':>8}{'largest array':>15}{'input':>12}{'output':>12}{'core-hours':>12}"]
+    for stage, stage_plan in plan["stages"].items():
+        lines.append(
+            f"{stage:<20}{stage_plan['jobs']:>7}{stage_plan['tasks']:>8}{max(stage_plan['array_sizes'] or [0]):>15}"
+            f"{fmt(stage_plan['input_bytes'], 1e12, ' TB'):>12}{fmt(stage_plan['output_bytes'], 1e12, ' TB'):>12}"
+            f"{fmt(stage_plan['core_hours']):>12}"
+        )
+    total = plan["total"]
+    lines.append(
+        f"{'total':<20}{total['jobs']:>7}{total['tasks']:>8}{'':>15}{'':>12}{fmt(total['new_bytes'], 1e12, ' TB'):>12}"
+        f"{fmt(total['core_hours']):>12}"
+    )
+    return "\n".join(lines)
+
+
+def write_plan(plan, filename):
+    with open(filename, "w") as file:
+        json.dump(plan, file, indent=2)
+    log.info(f"Production plan written in {filename}")
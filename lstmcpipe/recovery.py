@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+# Recovery of the failed jobs of a production, used by `lstmcpipe_recover`.
+# Only the failed tasks of the array jobs (e.g. the r0_to_dl1 sublists whose files failed even after the retries of
+# `rerun_cmd`) are resubmitted, with the sbatch command recorded in the job store. The jobs waiting for the failed
+# ones (`afterok` dependencies that can no longer be satisfied) are then made to depend on the new jobs instead.
+
+import re
+import logging
+
+from .utils import run_command
+from .executors import format_array_range
+from .io.job_store import FAILED_STATES, ACTIVE_STATES
+
+log = logging.getLogger(__name__)
+
+
+def failed_task_indices(tasks):
+    """
+    Failed tasks of a recorded job.
+
+    Parameters
+    ----------
+    tasks: dict
+        {taskid: state}, see `JobStore.tasks`
+
+    Returns
+    -------
+    list: failed array task indices, `[None]` for a failed non-array job, empty if nothing failed
+    """
+    failed = []
+    for taskid, state in tasks.items():
+        if state not in FAILED_STATES:
+            continue
+        failed.append(int(taskid.split("_")[1]) if "_" in taskid else None)
+    return sorted(failed, key=lambda index: -1 if index is None else index)
+
+
+def resubmission_command(sbatch_command, indices):
+    """
+    sbatch command resubmitting only the given tasks of a job, without its dependencies (already satisfied).
+
+    Parameters
+    ----------
+    sbatch_command: str
+    indices: list
+        array task indices, `[None]` for a non-array job
+
+    Returns
+    -------
+    str
+    """
+    command = re.sub(r"--dependency=\S+\s*", "", sbatch_command)
+    if indices != [None]:
+        match = re.search(r"--array=(\S+)", command)
+        throttle = f"%{match.group(1).split('%')[1]}" if match and "%" in match.group(1) else ""
+        command = command.replace(match.group(0), f"--array={format_array_range(indices)}{throttle}")
+    return command
+
+
+def task_sublists(command, indices):
+    """
+    Sublists (`-f` arguments of the DL1 core scripts) processed by the given array tasks, for reporting.
+    """
+    match = re.search(r"-f ((?:\S+\.sublist ?)+)", command or "")
+    if match is None:
+        return []
+    sublists = match.group(1).split()
+    return [sublists[index] for index in indices if index is not None and index < len(sublists)]
+
+
+def rewire_dependencies(dependencies, replacements, resubmitted):
+    """
+    Replace the job ids of the failed jobs by the ones of their recovery jobs.
+
+    Parameters
+    ----------
+    dependencies: str
+        Comma-separated job ids
+    replacements: dict
+        {old_jobid: new_jobid}. A dependency on a whole job `old_jobid` becomes `new_jobid`.
+    resubmitted: dict
+        {old_jobid: array task indices resubmitted by the recovery job}. A dependency on a resubmitted task
+        `old_jobid_i` becomes `new_jobid_i`, a dependency on a task that completed is dropped as the recovery
+        array does not have it.
+
+    Returns
+    -------
+    str
+    """
+    rewired = []
+    for dependency in dependencies.split(","):
+        jobid, _, task = dependency.partition("_")
+        if jobid in replacements:
+            if not task:
+                dependency = replacements[jobid]
+            elif int(task) in resubmitted[jobid]:
+                dependency = f"{replacements[jobid]}_{task}"
+            else:
+                continue
+        if dependency not in rewired:
+            rewired.append(dependency)
+    return ",".join(rewired)
+
+
+def recover_production(job_store, dry_run=False, refresh=True):
+    """
+    Resubmit the failed tasks of the jobs of the last run of a production and rewire the pending jobs depending
+    on them.
+
+    Parameters
+    ----------
+    job_store: `lstmcpipe.io.job_store.JobStore`
+    dry_run: bool
+        Only log what would be done
+    refresh: bool
+        Refresh the job states with sacct first
+
+    Returns
+    -------
+    dict: {failed_jobid: new_jobid}
+    """
+    if refresh:
+        job_store.refresh()
+    jobs = job_store.jobs()
+
+    replacements = {}
+    resubmitted = {}
+    for job in jobs:
+        if job["recovered_by"]:
+            continue
+        indices = failed_task_indices(job_store.tasks(job["jobid"]))
+        if not indices:
+            continue
+        if not job["sbatch_command"]:
+            log.warning(f"No sbatch command recorded for failed job {job['jobid']} ({job['stage']}), not resubmitted")
+            continue
+
+        sublists = task_sublists(job["command"], indices)
+        tasks = "all" if indices == [None] else format_array_range(indices)
+        log.info(
+            f"{job['stage']} job {job['jobid']}: resubmitting tasks {tasks}"
+            + (f" (sublists {', '.join(sublists)})" if sublists else "")
+        )
+        command = resubmission_command(job["sbatch_command"], indices)
+        resubmitted[job["jobid"]] = [index for index in indices if index is not None]
+        if dry_run:
+            log.info(command)
+            replacements[job["jobid"]] = f"<new job for {job['jobid']}>"
+            continue
+
+        new_jobid = run_command(command)
+        log.info(f"Recovery job {new_jobid} submitted for {job['jobid']}")
+        job_store.add_job(
+            new_jobid,
+            job["stage"],
+            n_tasks=len(indices),
+            command=job["command"],
+            sbatch_command=command,
+            run=job["run"],
+        )
+        job_store.update_job(job["jobid"], recovered_by=new_jobid)
+        replacements[job["jobid"]] = new_jobid
+
+    if not replacements:
+        log.info("No failed job to recover")
+        return replacements
+
+    for job in jobs:
+        dependencies = job["dependencies"] or ""
+        new_dependencies = rewire_dependencies(dependencies, replacements, resubmitted)
+        if not dependencies or new_dependencies == dependencies:
+            continue
+        states = set(job_store.tasks(job["jobid"]).values())
+        if states and not states.issubset(ACTIVE_STATES):
+            log.warning(
+                f"{job['stage']} job {job['jobid']} is not pending anymore ({', '.join(states)}), it can not be "
+                f"rewired: run lstmcpipe --resume once the recovery jobs are over"
+            )
+            continue
+        # an empty dependency (all the tasks waited for completed) releases the job
+        new_dependency = f"afterok:{new_dependencies.replace(',', ':')}" if new_dependencies else ""
+        command = f"scontrol update JobId={job['jobid']} Dependency={new_dependency}"
+        log.info(command)
+        if not dry_run:
+            run_command(command)
+            job_store.update_job(job["jobid"], dependencies=new_dependencies)
+
+    return replacements
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+# Slurm resources of the stages predicted from the accounting of previous productions.
+# The `check_MC_{prod_id}.txt` files written by the production check job (`sacct` output of all the jobs of a
+# production) are parsed into a per-stage history of the memory and runtime actually used. New productions then
+# request a high quantile of the history times a safety margin, instead of the static defaults of
+# `lstmcpipe.utils.SbatchLstMCStage`.
+
+import logging
+from glob import glob
+from math import ceil
+from pathlib import Path
+
+from .io.job_store import JobStore
+
+log = logging.getLogger(__name__)
+
+# time limits of the partitions of the LST cluster, in seconds
+PARTITION_TIME_LIMITS = {"short": 4 * 3600, "long": 7 * 86400}
+# default job names of the stages, see `SbatchLstMCStage.stage_default_options`
+JOB_NAME_STAGES = {
+    "r0_dl1": "r0_to_dl1",
+    "r0_to_dl1": "r0_to_dl1",
+    "dl1ab": "dl1ab",
+    "merge": "merge_dl1",
+    "train_test_split": "train_test_splitting",
+    "train_pipe": "train_pipe",
+    "RF_importance": "RF_importance",
+    "dl1_dl2": "dl1_to_dl2",
+    "dl2_irfs": "dl2_to_irfs",
+    "dl2_sens": "dl2_sens",
+    "dl2_sens_plot": "dl2_sens_plot",
+}
+UNITS = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+def parse_memory(value):
+    """
+    Convert a sacct memory value (e.g. `1234K`, `12.50G`, `100Gn`) to bytes, None if empty.
+    """
+    value = value.strip().rstrip("nc")
+    if value == "":
+        return None
+    if value[-1] in UNITS:
+        return float(value[:-1]) * UNITS[value[-1]]
+    return float(value)
+
+
+def parse_duration(value):
+    """
+    Convert a sacct duration `[D-]HH:MM:SS` to seconds, None if empty.
+    """
+    value = value.strip()
+    if value == "":
+        return None
+    days = 0
+    if "-" in value:
+        days, value = value.split("-")
+    seconds = 0.0
+    for item in value.split(":"):
+        seconds = seconds * 60 + float(item)
+    return int(days) * 86400 + seconds
+
+
+def format_duration(seconds):
+    """
+    Format seconds as a slurm `--time` value `D-HH:MM:SS`.
+    """
+    seconds = int(ceil(seconds))
+    return f"{seconds // 86400}-{seconds % 86400 // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def format_memory(nbytes):
+    """
+    Format bytes as a slurm `--mem` value, rounded up to the GB.
+    """
+    return f"{max(1, ceil(nbytes / UNITS['G']))}G"
+
+
+def stage_of_job_name(job_name):
+    """
+    Stage corresponding to a job name, e.g. `LST-r0_to_dl1` -> `r0_to_dl1`. None if unknown.
+    """
+    for name in [job_name, job_name.split("-")[-1]]:
+        if name in JOB_NAME_STAGES:
+            return JOB_NAME_STAGES[name]
+    return None
+
+
+def parse_check_file(filename):
+    """
+    Parse the (fixed-width) sacct output of a `check_MC_{prod_id}.txt` file.
+    The steps of a job (`.batch`, `.extern`...) are merged into the job, keeping their maximal memory.
+
+    Returns
+    -------
+    dict: {jobid: {"jobname", "state", "elapsed", "mem", "partition"}}
+        `elapsed` in seconds (cputime if the elapsed time was not recorded), `mem` in bytes (MaxRSS, or
+        MaxVMSize if MaxRSS was not recorded)
+    """
+    with open(filename) as file:
+        lines = [line.rstrip("\n") for line in file if line.strip()]
+
+    records = {}
+    columns = None
+    for iline, line in enumerate(lines):
+        if set(line.replace(" ", "")) == {"-"} and iline > 0:
+            # the dashes line gives the width of the columns of the header above it
+            spans, start = [], 0
+            for dashes in line.split(" "):
+                if dashes:
+                    spans.append((start, start + len(dashes)))
+                start += len(dashes) + 1
+            columns = [(lines[iline - 1][begin:end].strip().lower(), begin, end) for begin, end in spans]
+            continue
+        if columns is None or iline + 1 < len(lines) and set(lines[iline + 1].replace(" ", "")) == {"-"}:
+            continue
+
+        values = {name: line[begin:end].strip() for name, begin, end in columns}
+        jobid = values.get("jobid", "").split(".")[0]
+        if not jobid:
+            continue
+        record = records.setdefault(jobid, {"jobname": "", "state": "", "elapsed": None, "mem": None, "partition": ""})
+        if "." not in values.get("jobid", ""):
+            record["jobname"] = values.get("jobname", "")
+            record["state"] = values.get("state", "").split(" ")[0]
+            record["partition"] = values.get("partition", "")
+            record["elapsed"] = parse_duration(values.get("elapsed", "")) or parse_duration(values.get("cputime", ""))
+        mem = parse_memory(values.get("maxrss", "")) or parse_memory(values.get("maxvmsize", ""))
+        if mem is not None:
+            record["mem"] = max(mem, record["mem"] or 0)
+    return records
+
+
+def job_store_stages(log_dir):
+    """
+    {jobid: stage} of the jobs recorded in the job stores of a production logs directory, more reliable than the
+    (possibly truncated) job names.
+    """
+    stages = {}
+    for filename in Path(log_dir).glob("jobs_*.sqlite"):
+        stages.update({job["jobid"]: job["stage"] for job in JobStore(filename).jobs(all_runs=True)})
+    return stages
+
+
+def quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(ceil(q * len(values))) - 1)]
+
+
+class ResourceTuner:
+    """
+    Predict the slurm resources of each stage from the accounting of previous productions.
+
+    Parameters
+    ----------
+    history: dict
+        {stage: [{"elapsed", "mem"}, ...]} of the successful jobs
+    margin: float
+        Safety factor applied to the predicted memory and time
+    quantile: float
+        Quantile of the history used as prediction
+    min_samples: int
+        Minimal number of jobs of a stage to predict its resources
+    """
+
+    def __init__(self, history, margin=1.3, quantile=0.95, min_samples=5):
+        self.history = history
+        self.margin = margin
+        self.quantile = quantile
+        self.min_samples = min_samples
+
+    @classmethod
+    def from_check_files(cls, patterns, **kwargs):
+        """
+        Build the history from the check files matching the glob `patterns`.
+        Only the COMPLETED jobs are used, so that OOM or timeout kills do not bias the predictions.
+        """
+        history = {}
+        for pattern in patterns:
+            for filename in glob(str(pattern)):
+                stages = job_store_stages(Path(filename).parent)
+                for jobid, record in parse_check_file(filename).items():
+                    stage = stages.get(jobid.split("_")[0]) or stage_of_job_name(record["jobname"])
+                    if stage is not None and record["state"] == "COMPLETED":
+                        history.setdefault(stage, []).append(record)
+        log.info(f"Resource history: {', '.join(f'{k}: {len(v)} jobs' for k, v in history.items()) or 'empty'}")
+        return cls(history, **kwargs)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Parameters
+        ----------
+        config: dict
+            `resource_tuning` section of the lstmcpipe config, with the `history` glob patterns of check files and
+            optionally `margin`, `quantile` and `min_samples`
+        """
+        config = dict(config)
+        patterns = config.pop("history")
+        return cls.from_check_files([patterns] if isinstance(patterns, (str, Path)) else patterns, **config)
+
+    def options(self, stage, default_partition=None):
+        """
+        Predicted slurm options of a stage.
+
+        Parameters
+        ----------
+        stage: str
+        default_partition: str or None
+            Partition of the stage defaults, replaced by the shortest partition fitting the predicted time
+            if it is one of `PARTITION_TIME_LIMITS`
+
+        Returns
+        -------
+        dict: `mem`, `time` and `partition` options, empty if the history of the stage is too small
+        """
+        records = self.history.get(stage, [])
+        options = {}
+        mems = [record["mem"] for record in records if record["mem"]]
+        if len(mems) >= self.min_samples:
+            options["mem"] = format_memory(quantile(mems, self.quantile) * self.margin)
+        times = [record["elapsed"] for record in records if record["elapsed"]]
+        if len(times) >= self.min_samples:
+            time = quantile(times, self.quantile) * self.margin
+            options["time"] = format_duration(time)
+            if default_partition in PARTITION_TIME_LIMITS:
+                fitting = [name for name, limit in PARTITION_TIME_LIMITS.items() if time <= limit]
+                if fitting:
+                    options["partition"] = min(fitting, key=PARTITION_TIME_LIMITS.get)
+        return options
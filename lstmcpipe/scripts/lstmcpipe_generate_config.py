@@ -39,7 +39,12 @@ def list_config_classes():
 
 
 def build_argparser():
-    parser = argparse.ArgumentParser(description="Generate a lstmcpipe config.")
+    parser = argparse.ArgumentParser(
+        description="Generate a lstmcpipe config.",
+        epilog="The pointing directories of the AllSky productions are scanned once and indexed in "
+        "$XDG_CACHE_HOME/lstmcpipe/pointing_index.json. The index only records whether each pointing has simtel "
+        "files (not their number nor size) and is refreshed when a directory is modified.",
+    )
 
     # Required arguments
     parser.add_argument(
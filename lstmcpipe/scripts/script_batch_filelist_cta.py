@@ -1,9 +1,40 @@
 #!/usr/bin/env python
 
+import time
 import argparse
-from os.path import join, basename
+from os.path import join, basename, getsize
 from os import environ
-from lstmcpipe.utils import rerun_cmd
+from functools import partial
+from contextlib import nullcontext
+from lstmcpipe.utils import rerun_cmd, process_files, default_n_workers
+from lstmcpipe.io.output_manifest import write_output_manifest, manifest_path
+from lstmcpipe.io.sublists import write_runtimes
+from lstmcpipe.io.scratch import ScratchArea
+
+
+def process_file(file, output_dir, config_file, scratch=None):
+    """
+    Process a single file, returns the output file and the runtime record of the input file
+    """
+    start = time.time()
+    input_file = file if scratch is None else scratch.stage_in(file)
+    work_dir = output_dir if scratch is None else scratch.work_dir(file)
+    # ctapipe takes the output filename
+    # so we need to construct it first
+    output_name = basename(file.replace(".simtel.gz", ".dl1.h5"))
+    output = join(work_dir, output_name)
+
+    cmd = ["ctapipe-stage1", f"--input={input_file}", f"--output={output}"]
+    if config_file:
+        cmd.append("--config={}".format(config_file))
+
+    rerun_cmd(cmd, output, max_ntry=2)
+    if scratch is not None:
+        scratch.stage_out(work_dir, output_dir)
+        scratch.release(input_file)
+    runtime = time.time() - start
+    output = join(output_dir, output_name)
+    return output, {"size": getsize(file), "runtime": runtime, "output_size": getsize(output)}
 
 
 def main():
@@ -33,6 +64,21 @@ def main():
         help="ctapipe-stage1 configuration file argument.",
         required=True,
     )
+    parser.add_argument(
+        "--n_workers",
+        "-n",
+        type=int,
+        dest="n_workers",
+        help="Number of files processed in parallel. Default: SLURM_CPUS_PER_TASK (1 outside of slurm).",
+        default=None,
+    )
+    parser.add_argument(
+        "--scratch",
+        action="store_true",
+        dest="scratch",
+        help="Stage the inputs and outputs on the node-local scratch ($TMPDIR) "
+        "and move each finished output to the output directory.",
+    )
     args = parser.parse_args()
 
     task_id = int(environ.get("SLURM_ARRAY_TASK_ID", -1))
@@ -44,15 +90,21 @@ def main():
     print("Processing files in: ", file_for_this_job)
 
     with open(file_for_this_job, "r") as filelist:
-        for file in filelist:
-            file = file.strip("\n")
+        files = [file.strip("\n") for file in filelist]
 
-            # ctapipe takes the output filename
-            # so we need to construct it first
-            output = join(args.output_dir, basename(file.replace(".simtel.gz", ".dl1.h5")))
+    n_workers = default_n_workers() if args.n_workers is None else args.n_workers
+    with ScratchArea() if args.scratch else nullcontext() as scratch:
+        results = process_files(
+            partial(process_file, output_dir=args.output_dir, config_file=args.config_file, scratch=scratch),
+            files,
+            n_workers=n_workers,
+            prefetch=None if scratch is None else scratch.prefetch,
+        )
+    outfiles = [output for output, _ in results]
+    runtimes = {file: runtime for file, (_, runtime) in zip(files, results)}
 
-            cmd = ["ctapipe-stage1", f"--input={file}", f"--output={output}"]
-            if args.config_file:
-                cmd.append("--config={}".format(args.config_file))
+    # used to balance the sublists of the next productions
+    write_runtimes(file_for_this_job, runtimes)
 
-            rerun_cmd(cmd, output, max_ntry=2)
+    # all the files of the sublist were processed, used to resume the production
+    write_output_manifest(outfiles, manifest_file=manifest_path(file_for_this_job))
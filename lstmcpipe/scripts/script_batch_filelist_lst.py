@@ -1,9 +1,49 @@
 #!/usr/bin/env python
 
+import time
 import argparse
 from os import environ
 from pathlib import Path
-from lstmcpipe.utils import rerun_cmd
+from functools import partial
+from contextlib import nullcontext
+from lstmcpipe.utils import rerun_cmd, process_files, default_n_workers
+from lstmcpipe.lstchain_worker import get_lstchain_worker
+from lstmcpipe.io.output_manifest import write_output_manifest, manifest_path
+from lstmcpipe.io.sublists import write_runtimes
+from lstmcpipe.io.scratch import ScratchArea
+
+
+def process_file(file, output_dir, config_file, in_process=False, scratch=None):
+    """
+    Process a single file, returns the output file and the runtime record of the input file
+    """
+    file = Path(file)
+    start = time.time()
+    input_file = file if scratch is None else scratch.stage_in(file)
+    work_dir = output_dir if scratch is None else scratch.work_dir(file)
+    cmd = [
+        "lstchain_mc_r0_to_dl1",
+        f"--input-file={input_file}",
+        f"--output-dir={work_dir}",
+    ]
+    if config_file:
+        cmd.append("--config={}".format(config_file))
+
+    # lstchain takes the output dir and constructs filenanmes itself
+    outfile_name = 'dl1_' + file.name.replace('.simtel.gz', '.h5')
+    outfile = work_dir.joinpath(outfile_name).as_posix()
+    worker = get_lstchain_worker(in_process, config_file)
+    if worker is not None:
+        worker.run("r0_to_dl1", input_file, outfile, cmd, max_ntry=2)
+    else:
+        rerun_cmd(cmd, outfile, max_ntry=2)
+    if scratch is not None:
+        scratch.stage_out(work_dir, output_dir)
+        scratch.release(input_file)
+    runtime = time.time() - start
+    output = output_dir.joinpath(outfile_name)
+    return output.as_posix(), {"size": file.stat().st_size, "runtime": runtime, "output_size": output.stat().st_size}
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -34,6 +74,28 @@ def main():
         help="lstchain_mc_r0_to_dl1 configuration file argument.",
         required=True,
     )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        dest="in_process",
+        help="Import lstchain once and process all the files within this process, "
+        "falling back to one lstchain subprocess per file on failure.",
+    )
+    parser.add_argument(
+        "--n_workers",
+        "-n",
+        type=int,
+        dest="n_workers",
+        help="Number of files processed in parallel. Default: SLURM_CPUS_PER_TASK (1 outside of slurm).",
+        default=None,
+    )
+    parser.add_argument(
+        "--scratch",
+        action="store_true",
+        dest="scratch",
+        help="Stage the inputs and outputs on the node-local scratch ($TMPDIR) "
+        "and move each finished output to the output directory.",
+    )
     args = parser.parse_args()
 
     task_id = int(environ.get("SLURM_ARRAY_TASK_ID", -1))
@@ -44,21 +106,31 @@ def main():
         file_for_this_job = args.file_list[task_id]
     print("Processing files in: ", file_for_this_job)
 
-    # lstchain takes the output dir and constructs filenanmes itself
     with open(file_for_this_job, "r") as filelist:
-        for file in filelist:
-            file = Path(file.strip("\n"))
+        files = [Path(file.strip("\n")) for file in filelist]
+
+    n_workers = default_n_workers() if args.n_workers is None else args.n_workers
+    with ScratchArea() if args.scratch else nullcontext() as scratch:
+        results = process_files(
+            partial(
+                process_file,
+                output_dir=args.output_dir,
+                config_file=args.config_file,
+                in_process=args.in_process,
+                scratch=scratch,
+            ),
+            files,
+            n_workers=n_workers,
+            prefetch=None if scratch is None else scratch.prefetch,
+        )
+    outfiles = [outfile for outfile, _ in results]
+    runtimes = {file.as_posix(): runtime for file, (_, runtime) in zip(files, results)}
 
-            cmd = [
-                "lstchain_mc_r0_to_dl1",
-                f"--input-file={file}",
-                f"--output-dir={args.output_dir}",
-            ]
-            if args.config_file:
-                cmd.append("--config={}".format(args.config_file))
+    # used to balance the sublists of the next productions
+    write_runtimes(file_for_this_job, runtimes)
 
-            outfile = args.output_dir.joinpath('dl1_' + file.name.replace('.simtel.gz', '.h5')).as_posix()
-            rerun_cmd(cmd, outfile, max_ntry=2)
+    # all the files of the sublist were processed, used to resume the production
+    write_output_manifest(outfiles, manifest_file=manifest_path(file_for_this_job))
 
 
 if __name__ == "__main__":
@@ -4,7 +4,39 @@ import argparse
 from os import environ
 from os.path import basename
 from pathlib import Path
-from lstmcpipe.utils import rerun_cmd
+from functools import partial
+from contextlib import nullcontext
+from lstmcpipe.utils import rerun_cmd, process_files, default_n_workers
+from lstmcpipe.lstchain_worker import get_lstchain_worker
+from lstmcpipe.io.output_manifest import write_output_manifest, manifest_path
+from lstmcpipe.io.scratch import ScratchArea
+
+
+def process_file(file, output_dir, config_file, in_process=False, scratch=None):
+    """
+    Process a single file, returns the output file
+    """
+    input_file = file if scratch is None else scratch.stage_in(file)
+    work_dir = output_dir if scratch is None else scratch.work_dir(file)
+    output = work_dir.joinpath(basename(file))
+    cmd = [
+        "lstchain_dl1ab",
+        "--no-image",
+        f"--input-file={input_file}",
+        f"--output-file={output}",
+    ]
+    if config_file:
+        cmd.append("--config={}".format(config_file))
+
+    worker = get_lstchain_worker(in_process, config_file)
+    if worker is not None:
+        worker.run("dl1ab", input_file, output, cmd, max_ntry=2)
+    else:
+        rerun_cmd(cmd, output, max_ntry=2)
+    if scratch is not None:
+        scratch.stage_out(work_dir, output_dir)
+        scratch.release(input_file)
+    return output_dir.joinpath(basename(file))
 
 
 def main():
@@ -36,6 +68,28 @@ def main():
         help="lstchain_mc_r0_to_dl1 configuration file argument.",
         required=True,
     )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        dest="in_process",
+        help="Import lstchain once and process all the files within this process, "
+        "falling back to one lstchain subprocess per file on failure.",
+    )
+    parser.add_argument(
+        "--n_workers",
+        "-n",
+        type=int,
+        dest="n_workers",
+        help="Number of files processed in parallel. Default: SLURM_CPUS_PER_TASK (1 outside of slurm).",
+        default=None,
+    )
+    parser.add_argument(
+        "--scratch",
+        action="store_true",
+        dest="scratch",
+        help="Stage the inputs and outputs on the node-local scratch ($TMPDIR) "
+        "and move each finished output to the output directory.",
+    )
     args = parser.parse_args()
 
     task_id = int(environ.get("SLURM_ARRAY_TASK_ID", -1))
@@ -46,21 +100,26 @@ def main():
         file_for_this_job = args.file_list[task_id]
     print("Processing files in: ", file_for_this_job)
 
-    # lstchain takes the output dir and constructs filenanmes itself
     with open(file_for_this_job, "r") as filelist:
-        for file in filelist:
-            file = file.strip("\n")
-            output = args.output_dir.joinpath(basename(file))
-            cmd = [
-                "lstchain_dl1ab",
-                "--no-image",
-                f"--input-file={file}",
-                f"--output-file={output}",
-            ]
-            if args.config_file:
-                cmd.append("--config={}".format(args.config_file))
+        files = [file.strip("\n") for file in filelist]
+
+    n_workers = default_n_workers() if args.n_workers is None else args.n_workers
+    with ScratchArea() if args.scratch else nullcontext() as scratch:
+        outfiles = process_files(
+            partial(
+                process_file,
+                output_dir=args.output_dir,
+                config_file=args.config_file,
+                in_process=args.in_process,
+                scratch=scratch,
+            ),
+            files,
+            n_workers=n_workers,
+            prefetch=None if scratch is None else scratch.prefetch,
+        )
 
-            rerun_cmd(cmd, output, max_ntry=2)
+    # all the files of the sublist were processed, used to resume the production
+    write_output_manifest(outfiles, manifest_file=manifest_path(file_for_this_job))
 
 
 if __name__ == "__main__":
@@ -3,6 +3,34 @@
 import argparse
 import subprocess
 from os import environ
+from functools import partial
+from contextlib import nullcontext
+from lstmcpipe.utils import process_files, default_n_workers
+from lstmcpipe.io.scratch import ScratchArea
+
+
+def process_file(file, output_dir, config_file, keep_file=False, debug_mode=False, scratch=None):
+    """
+    Process a single file with hiperta
+    """
+    input_file = file if scratch is None else scratch.stage_in(file)
+    work_dir = output_dir if scratch is None else scratch.work_dir(file)
+    cmd = [
+        "lstmcpipe_hiperta_r0_to_dl1lstchain",
+        f"--infile={input_file}",
+        f"--outdir={work_dir}",
+        f"--config={config_file}",
+    ]
+
+    if keep_file:
+        cmd.append("--keep_file")
+    if debug_mode:
+        cmd.append("--debug_mode")
+
+    subprocess.run(cmd)
+    if scratch is not None:
+        scratch.stage_out(work_dir, output_dir)
+        scratch.release(input_file)
 
 
 def main():
@@ -48,6 +76,21 @@ def main():
         dest="debug_mode",
         help="Activate debug mode (add cleaned mask in the output hdf5). Set by default to False",
     )
+    parser.add_argument(
+        "--n_workers",
+        "-n",
+        type=int,
+        dest="n_workers",
+        help="Number of files processed in parallel. Default: SLURM_CPUS_PER_TASK (1 outside of slurm).",
+        default=None,
+    )
+    parser.add_argument(
+        "--scratch",
+        action="store_true",
+        dest="scratch",
+        help="Stage the inputs and outputs on the node-local scratch ($TMPDIR) "
+        "and move each finished output to the output directory.",
+    )
     args = parser.parse_args()
 
     task_id = int(environ.get("SLURM_ARRAY_TASK_ID", -1))
@@ -59,22 +102,23 @@ def main():
     print("Processing files in: ", file_for_this_job)
 
     with open(file_for_this_job, "r") as filelist:
-        for file in filelist:
-            file = file.strip("\n")
-
-            cmd = [
-                "lstmcpipe_hiperta_r0_to_dl1lstchain",
-                f"--infile={file}",
-                f"--outdir={args.output_dir}",
-                f"--config={args.config_file}",
-            ]
-
-            if args.keep_file:
-                cmd.append("--keep_file")
-            if args.debug_mode:
-                cmd.append("--debug_mode")
+        files = [file.strip("\n") for file in filelist]
 
-            subprocess.run(cmd)
+    n_workers = default_n_workers() if args.n_workers is None else args.n_workers
+    with ScratchArea() if args.scratch else nullcontext() as scratch:
+        process_files(
+            partial(
+                process_file,
+                output_dir=args.output_dir,
+                config_file=args.config_file,
+                keep_file=args.keep_file,
+                debug_mode=args.debug_mode,
+                scratch=scratch,
+            ),
+            files,
+            n_workers=n_workers,
+            prefetch=None if scratch is None else scratch.prefetch,
+        )
 
 
 if __name__ == "__main__":
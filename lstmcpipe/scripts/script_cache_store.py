@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+import argparse
+from lstmcpipe.io.stage_cache import StageCache
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Store the output of a stage job in the lstmcpipe stage cache, keyed by the digests of its "
+        "inputs, its configuration and its source environment."
+    )
+    parser.add_argument("--cache-dir", type=str, dest="cache_dir", help="Root directory of the cache.", required=True)
+    parser.add_argument("--stage", type=str, dest="stage", help="Stage name.", required=True)
+    parser.add_argument(
+        "--inputs", type=str, dest="inputs", help="Input files or directories of the job.", required=True, nargs="+"
+    )
+    parser.add_argument("--config", type=str, dest="config", help="Configuration file of the job.", default=None)
+    parser.add_argument(
+        "--env-digest", type=str, dest="env_digest", help="Digest of the source environment.", required=True
+    )
+    parser.add_argument("--output", type=str, dest="output", help="Output file or directory to store.", required=True)
+    args = parser.parse_args()
+
+    cache = StageCache(args.cache_dir)
+    key = cache.compute_key(args.stage, args.inputs, args.config, args.env_digest)
+    if key is None:
+        raise FileNotFoundError(f"Inputs of {args.output} not found, it can not be cached")
+    entry = cache.store(args.stage, key, args.output)
+    print(f"{args.output} stored in the stage cache: {entry}")
+
+
+if __name__ == "__main__":
+    main()
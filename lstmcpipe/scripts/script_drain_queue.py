@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import argparse
+import logging
+from pathlib import Path
+from lstmcpipe.submission_queue import SubmissionQueue, drain, account_job_limit
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Submit the jobs queued by lstmcpipe once the slurm job limit was reached, as running jobs "
+        "leave the slurm queue. Started in the background by lstmcpipe, it can be restarted (e.g. after a reboot of "
+        "the login node) with the same queue file."
+    )
+    parser.add_argument(
+        "--queue",
+        type=Path,
+        dest="queue",
+        help="Path to the submission queue (`submission_queue_{prod_id}.json` in the production logs directory).",
+        required=True,
+    )
+    parser.add_argument(
+        "--job_limit",
+        type=int,
+        dest="job_limit",
+        help="Maximal number of jobs of the user in the slurm queue. Default: MaxSubmitJobs of the account.",
+        default=None,
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=float,
+        dest="poll_interval",
+        help="Seconds between two checks of the slurm queue.",
+        default=60,
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if not args.queue.exists():
+        parser.error(f"No submission queue found at {args.queue}")
+    job_limit = args.job_limit or account_job_limit()
+    if job_limit is None:
+        parser.error("No job limit given and no MaxSubmitJobs found for the account")
+
+    drain(SubmissionQueue(args.queue), job_limit, poll_interval=args.poll_interval)
+
+
+if __name__ == "__main__":
+    main()
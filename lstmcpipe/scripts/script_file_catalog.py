@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import argparse
+import logging
+from pathlib import Path
+from lstmcpipe.io.file_catalog import DEFAULT_CATALOG_FILE, FileCatalog, QUERY_FIELDS
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build and query the catalog of MC files used by lstmcpipe instead of listing the directories, "
+        "see `lstmcpipe.io.file_catalog`. Only the directories modified since the last update are listed again."
+    )
+    parser.add_argument(
+        "--catalog",
+        type=Path,
+        dest="catalog",
+        help=f"Path to the SQLite catalog. Default: {DEFAULT_CATALOG_FILE}",
+        default=DEFAULT_CATALOG_FILE,
+    )
+    parser.add_argument(
+        "--update",
+        type=Path,
+        nargs="+",
+        dest="update",
+        help="Directories to catalog, with all their sub-directories.",
+        default=[],
+    )
+    for field in QUERY_FIELDS:
+        parser.add_argument(f"--{field}", dest=field, help=f"Only list the files of this {field}.", default=None)
+    parser.add_argument("--directory", dest="directory", help="Only list the files of this directory tree.")
+    parser.add_argument("--pattern", dest="pattern", help="Only list the files matching this glob pattern.")
+    parser.add_argument(
+        "--events", action="store_true", dest="events", help="Count the events of the listed DL1 files."
+    )
+    parser.add_argument("--checksum", action="store_true", dest="checksum", help="Checksum the listed files.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    catalog = FileCatalog(args.catalog)
+    for directory in args.update:
+        logging.info(f"{catalog.update_tree(directory)} directories catalogued in {directory}")
+
+    fields = {field: getattr(args, field) for field in QUERY_FIELDS if getattr(args, field) is not None}
+    if not (fields or args.directory or args.pattern):
+        return
+    records = catalog.query(pattern=args.pattern, directory=args.directory, **fields)
+    if args.events or args.checksum:
+        details = catalog.describe([record["path"] for record in records], events=args.events, checksum=args.checksum)
+        for record in records:
+            record.update(details.get(record["path"], {}))
+    for record in records:
+        print(f"{record['path']}\t{record['size']}\t{record['n_events']}\t{record['checksum']}")
+    logging.info(f"{len(records)} files, {sum(record['size'] for record in records) / 1e9:.1f} GB")
+
+
+if __name__ == "__main__":
+    main()
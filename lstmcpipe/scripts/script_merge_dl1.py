@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+import argparse
+import logging
+from pathlib import Path
+from lstmcpipe.io.data_management import get_input_filelist
+from lstmcpipe.io.dl1_merge import (
+    read_file_lists,
+    merge_dl1_files,
+    incremental_merge_dl1_files,
+    virtual_merge_dl1_files,
+    select_group,
+    non_empty_parts,
+    EMPTY_SUFFIX,
+    training_columns,
+)
+
+
+def build_argparser():
+    parser = argparse.ArgumentParser(
+        description="Merge DL1 files listed in `.list` manifests (e.g. written by the metadata-only train/test "
+        "split) or found in a directory."
+    )
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument(
+        "--input-lists",
+        type=Path,
+        nargs="+",
+        dest="input_lists",
+        help="`.list` manifests of the files to merge, one path per line.",
+    )
+    inputs.add_argument("--input-dir", "-d", type=Path, dest="input_dir", help="Directory of the files to merge.")
+    inputs.add_argument("--input-files", type=Path, nargs="+", dest="input_files", help="Files to merge.")
+    parser.add_argument(
+        "--pattern",
+        "-p",
+        dest="pattern",
+        help="Glob pattern of the files to merge in `--input-dir`.",
+        default="*.h5",
+    )
+    parser.add_argument("--output-file", "-o", type=Path, dest="output_file", help="Merged file", required=True)
+    parser.add_argument("--no-image", action="store_true", dest="no_image", help="Do not merge the images.")
+    parser.add_argument("--no-progress", action="store_true", dest="no_progress", help="Hide the progress bar.")
+    parser.add_argument(
+        "--group",
+        type=int,
+        dest="group",
+        help="Only merge this group of the input files, see `lstmcpipe.io.dl1_merge.select_group`. "
+        "Nothing is written if the group is empty.",
+    )
+    parser.add_argument("--n-groups", type=int, dest="n_groups", help="Number of groups of the input files.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        dest="incremental",
+        help="Only append to the existing output file the inputs not merged yet. Fails if an input already merged "
+        "was modified or removed.",
+    )
+    parser.add_argument(
+        "--virtual",
+        action="store_true",
+        dest="virtual",
+        help="Write HDF5 virtual datasets over the input files instead of copying them, after checking that their "
+        "datasets are compatible. The input files must be kept.",
+    )
+    parser.add_argument(
+        "--columns-config",
+        type=Path,
+        dest="columns_config",
+        help="lstchain config: only the parameters used by the training with this config (features, events filters "
+        "and MC truth) are merged. Ignored by `--virtual`.",
+    )
+    parser.add_argument(
+        "--max-events",
+        type=int,
+        dest="max_events",
+        help="Only merge a subsample of about this number of events, stratified by true energy, pointing node and "
+        "particle type. The weights of the events kept are written in the output. Ignored by `--virtual`.",
+    )
+    parser.add_argument("--seed", type=int, dest="seed", help="Seed of the subsampling.", default=0)
+    parser.add_argument(
+        "--skip-empty",
+        action="store_true",
+        dest="skip_empty",
+        help="Ignore the input files of the empty groups of the previous level of a merge tree (see `--mark-empty`). "
+        "Fails if another input file is missing.",
+    )
+    parser.add_argument(
+        "--mark-empty",
+        action="store_true",
+        dest="mark_empty",
+        help=f"Write an empty `{{output_file}}{EMPTY_SUFFIX}` marker if there is nothing to merge.",
+    )
+    return parser
+
+
+def main():
+    parser = build_argparser()
+    args = parser.parse_args()
+    if args.incremental and args.max_events is not None:
+        parser.error("--max-events can not be used with --incremental")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.input_lists:
+        files = read_file_lists(args.input_lists)
+    elif args.input_files:
+        files = [file.as_posix() for file in args.input_files]
+    else:
+        files = sorted(get_input_filelist(args.input_dir, glob_pattern=args.pattern))
+    if args.skip_empty:
+        files = non_empty_parts(files)
+    if args.group is not None:
+        files = select_group(files, args.group, args.n_groups)
+    if not files:
+        if not args.mark_empty and args.group is None:
+            parser.error("No input file to merge")
+        group = f" in group {args.group} of {args.n_groups}" if args.group is not None else ""
+        logging.info(f"Nothing to merge{group}")
+        if args.mark_empty:
+            Path(f"{args.output_file}{EMPTY_SUFFIX}").touch()
+        return
+    columns = None
+    if args.columns_config is not None and not args.virtual:
+        columns = training_columns(args.columns_config)
+    options = dict(no_image=args.no_image, progress_bar=not args.no_progress, columns=columns)
+    if args.virtual:
+        if args.columns_config is not None or args.max_events is not None:
+            logging.warning("The virtual merge keeps all the events, --columns-config and --max-events are ignored")
+        virtual_merge_dl1_files(files, args.output_file, no_image=args.no_image)
+    elif args.incremental:
+        incremental_merge_dl1_files(files, args.output_file, **options)
+    else:
+        merge_dl1_files(files, args.output_file, max_events=args.max_events, seed=args.seed, **options)
+
+
+if __name__ == "__main__":
+    main()
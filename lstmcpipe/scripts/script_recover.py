@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import argparse
+import logging
+from pathlib import Path
+from lstmcpipe.recovery import recover_production
+from lstmcpipe.io.job_store import JobStore, job_store_filename
+from lstmcpipe.io.lstmcpipe_tree_path import log_dir_path, update_scancel_file
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Resubmit only the failed (array) tasks of a production and make the pending jobs waiting "
+        "for them depend on the resubmitted jobs instead."
+    )
+    parser.add_argument(
+        "--prod_id",
+        "-p",
+        type=str,
+        dest="prod_id",
+        help="Production identifier (`prod_id` of the lstmcpipe config).",
+        required=True,
+    )
+    parser.add_argument(
+        "--job_store",
+        type=Path,
+        dest="job_store",
+        help="Path to the job store of the production. Default: in the production logs directory.",
+        default=None,
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        dest="dry_run",
+        help="Only print the commands that would be run.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    log_dir = log_dir_path(args.prod_id)
+    filename = args.job_store or job_store_filename(log_dir, args.prod_id)
+    if not filename.exists():
+        parser.error(f"No job store found at {filename}")
+
+    replacements = recover_production(JobStore(filename), dry_run=args.dry_run)
+    if replacements and not args.dry_run:
+        scancel_file = log_dir.joinpath(f"scancel_{args.prod_id}.sh")
+        if scancel_file.exists():
+            update_scancel_file(scancel_file, ",".join(replacements.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+import subprocess
+from os import environ
+
+
+def read_task(tasks_file, task_id):
+    """
+    Read the command of a task in a tasks file (one command per line, line number = task index).
+    Blank lines are tasks too, so that the indices match the line numbers.
+
+    Parameters
+    ----------
+    tasks_file: str or Path
+    task_id: int
+
+    Returns
+    -------
+    str: command of the task
+    """
+    with open(tasks_file, "r") as file:
+        commands = [line.rstrip("\n") for line in file]
+    if not 0 <= task_id < len(commands):
+        raise IndexError(f"Task {task_id} not found in {tasks_file} ({len(commands)} tasks)")
+    if commands[task_id].strip() == "":
+        raise ValueError(f"Task {task_id} of {tasks_file} is empty")
+    return commands[task_id]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the task of a slurm job array listed in a tasks file "
+        "(one command per line, the line number being the array task index)."
+    )
+    parser.add_argument(
+        "--tasks",
+        "-t",
+        type=str,
+        dest="tasks_file",
+        help="Path to the tasks file.",
+        required=True,
+    )
+    parser.add_argument(
+        "--task-id",
+        type=int,
+        dest="task_id",
+        help="Index of the task to run. Default: SLURM_ARRAY_TASK_ID.",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    if args.task_id is not None:
+        task_id = args.task_id
+    elif "SLURM_ARRAY_TASK_ID" in environ:
+        task_id = int(environ["SLURM_ARRAY_TASK_ID"])
+    else:
+        parser.error("No task id: use --task-id or run in a slurm job array")
+    command = read_task(args.tasks_file, task_id)
+    print(f"Running task {task_id}: {command}", flush=True)
+
+    result = subprocess.run(command, shell=True, executable="/bin/bash")
+    sys.exit(result.returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import argparse
+from datetime import timedelta
+from pathlib import Path
+from lstmcpipe.io.lstmcpipe_tree_path import log_dir_path
+from lstmcpipe.io.job_store import JobStore, job_store_filename
+
+
+def format_duration(seconds):
+    return "-" if seconds is None else str(timedelta(seconds=int(seconds)))
+
+
+def format_summary(summary, max_failed=10):
+    """
+    Format the `JobStore.summary` of a production as a table, one line per stage.
+    """
+    header = (
+        f"{'stage':<22}{'jobs':>6}{'tasks':>7}{'done':>7}{'running':>9}{'pending':>9}{'failed':>8}"
+        f"{'mean runtime':>14}{'ETA':>12}"
+    )
+    lines = [header]
+    for stage, stage_summary in summary.items():
+        states = stage_summary["states"]
+        lines.append(
+            f"{stage:<22}{stage_summary['jobs']:>6}{stage_summary['tasks']:>7}{states.get('COMPLETED', 0):>7}"
+            f"{states.get('RUNNING', 0):>9}{states.get('PENDING', 0) + states.get('UNKNOWN', 0):>9}"
+            f"{len(stage_summary['failed']):>8}{format_duration(stage_summary['mean_runtime']):>14}"
+            f"{format_duration(stage_summary['eta']):>12}"
+        )
+    for stage, stage_summary in summary.items():
+        failed = stage_summary["failed"]
+        if failed:
+            more = f" (+{len(failed) - max_failed} more)" if len(failed) > max_failed else ""
+            lines.append(f"Failed {stage} jobs: {', '.join(failed[:max_failed])}{more}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report the progress of a production: number of jobs per stage and state, runtimes, failures "
+        "and estimated completion. The state of the jobs is refreshed with a single bulk sacct query."
+    )
+    parser.add_argument(
+        "--prod_id",
+        "-p",
+        type=str,
+        dest="prod_id",
+        help="Production identifier (`prod_id` of the lstmcpipe config).",
+        default=None,
+    )
+    parser.add_argument(
+        "--job_store",
+        type=Path,
+        dest="job_store",
+        help="Path to the job store of the production. Default: in the production logs directory.",
+        default=None,
+    )
+    parser.add_argument(
+        "--no-refresh",
+        action="store_false",
+        dest="refresh",
+        help="Report the states recorded by the previous query without calling sacct.",
+    )
+    parser.add_argument(
+        "--all-runs",
+        action="store_true",
+        dest="all_runs",
+        help="Include the jobs submitted by previous runs of the production (e.g. before a --resume).",
+    )
+    args = parser.parse_args()
+
+    if args.job_store is None and args.prod_id is None:
+        parser.error("One of --prod_id or --job_store is required")
+    filename = args.job_store or job_store_filename(log_dir_path(args.prod_id), args.prod_id)
+    if not filename.exists():
+        parser.error(f"No job store found at {filename}")
+
+    store = JobStore(filename)
+    if args.refresh:
+        store.refresh(all_runs=args.all_runs)
+    print(format_summary(store.summary(all_runs=args.all_runs)))
+
+
+if __name__ == "__main__":
+    main()
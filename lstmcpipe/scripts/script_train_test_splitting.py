@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 
 import shutil
+import hashlib
 import argparse
 from pathlib import Path
 from sklearn.model_selection import train_test_split
+from lstmcpipe.io.data_management import get_input_filelist
+from lstmcpipe.io.dl1_merge import write_file_list
 
 parser = argparse.ArgumentParser(
     description="Script to move a directory and its content after creating the destination" " directory."
@@ -39,6 +42,20 @@ parser.add_argument(
     "--log_dir", "-l", type=Path, dest="log_dir", help="Directory to store training and testing filelists"
 )
 
+parser.add_argument(
+    "--train_list",
+    type=Path,
+    dest="train_list",
+    help="Only write the training files in this `.list` manifest, without moving them. Requires --test_list.",
+)
+
+parser.add_argument(
+    "--test_list",
+    type=Path,
+    dest="test_list",
+    help="Only write the testing files in this `.list` manifest, without moving them. Requires --train_list.",
+)
+
 
 def write_filelist(filelist, outdir, dataset=""):
     """
@@ -59,6 +76,32 @@ def write_filelist(filelist, outdir, dataset=""):
             newfile.write("\n")
 
 
+def split_by_hash(filelist, test_size):
+    """
+    Deterministic train/test split based on a hash of the file names: a file always goes to the same dataset,
+    whatever the other files, so that the split is stable when files are added.
+
+    Parameters
+    ----------
+    filelist : list
+        list of files to be split
+    test_size : float
+        expected fraction of testing files
+
+    Returns
+    -------
+    tuple: (training files, testing files)
+    """
+    train, test = [], []
+    for file in filelist:
+        digest = hashlib.sha1(Path(file).name.encode()).hexdigest()
+        if int(digest[:15], 16) / 16**15 < test_size:
+            test.append(file)
+        else:
+            train.append(file)
+    return train, test
+
+
 def move_files(filelist, outdir):
     """
     Move all files within filelist to outdir
@@ -77,11 +120,15 @@ def move_files(filelist, outdir):
 def main():
     args = parser.parse_args()
 
-    file_list = [
-        file.resolve().as_posix()
-        for file in Path(args.input_dir).iterdir()
-        if file.is_file() and file.name.endswith(".h5")
-    ]
+    file_list = [file for file in get_input_filelist(args.input_dir, glob_pattern="*.h5") if Path(file).is_file()]
+
+    if args.train_list or args.test_list:
+        if not (args.train_list and args.test_list):
+            parser.error("--train_list and --test_list must be given together")
+        train, test = split_by_hash(sorted(file_list), float(args.ratio))
+        write_file_list(train, args.train_list)
+        write_file_list(test, args.test_list)
+        return
 
     train, test = train_test_split(file_list, random_state=42, test_size=float(args.ratio), shuffle=True)
 
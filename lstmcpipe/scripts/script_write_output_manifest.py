@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+import argparse
+from lstmcpipe.io.output_manifest import write_output_manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write the manifest (size, modification time and checksum of every file) of the outputs "
+        "of a job. Used by `lstmcpipe --resume` to find the outputs that are already complete."
+    )
+    parser.add_argument(
+        "--outputs",
+        "-o",
+        type=str,
+        dest="outputs",
+        help="Output files or directories of the job.",
+        required=True,
+        nargs="+",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        dest="manifest",
+        help="Path to the manifest file. Default: next to (or inside for a directory) the first output.",
+        default=None,
+    )
+    parser.add_argument(
+        "--no-checksum",
+        action="store_false",
+        dest="checksum",
+        help="Do not compute the sha256 of the files.",
+    )
+    args = parser.parse_args()
+
+    manifest = write_output_manifest(args.outputs, manifest_file=args.manifest, checksum=args.checksum)
+    print(f"Output manifest written to {manifest}")
+
+
+if __name__ == "__main__":
+    main()
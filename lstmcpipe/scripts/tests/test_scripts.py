@@ -30,3 +30,59 @@ def run_script(*args):
 def test_all_help(script):
     """Test for all scripts if at least the help works."""
     run_script(script, "--help")
+
+
+def test_run_task_manifest(tmp_path):
+    from lstmcpipe.scripts.script_run_task_manifest import read_task
+
+    tasks_file = tmp_path / "stage.tasks"
+    tasks_file.write_text("echo first\n\necho third\n")
+    assert read_task(tasks_file, 2) == "echo third"
+    with pytest.raises(ValueError):
+        read_task(tasks_file, 1)
+    with pytest.raises(IndexError):
+        read_task(tasks_file, 3)
+
+
+def test_status_format_summary():
+    from lstmcpipe.scripts.script_status import format_summary
+
+    summary = {
+        "r0_to_dl1": {
+            "jobs": 1,
+            "tasks": 3,
+            "states": {"COMPLETED": 1, "FAILED": 1, "PENDING": 1},
+            "failed": ["100_1"],
+            "mean_runtime": 600,
+            "eta": None,
+        }
+    }
+    table = format_summary(summary)
+    assert "0:10:00" in table
+    assert "Failed r0_to_dl1 jobs: 100_1" in table
+
+
+@pytest.mark.parametrize("module", ["script_status", "script_recover"])
+def test_missing_job_store(module, monkeypatch):
+    import importlib
+    from lstmcpipe.io.lstmcpipe_tree_path import log_dir_path
+
+    script = importlib.import_module(f"lstmcpipe.scripts.{module}")
+    monkeypatch.setattr("sys.argv", [module, "--prod_id", "mistyped_prod_id"])
+    with pytest.raises(SystemExit):
+        script.main()
+    # the query does not create the log directory of an unknown production
+    assert not log_dir_path("mistyped_prod_id").exists()
+
+
+def test_split_by_hash():
+    from lstmcpipe.scripts.script_train_test_splitting import split_by_hash
+
+    files = [f"/dl1/dl1_run{ii}.h5" for ii in range(1000)]
+    train, test = split_by_hash(files, 0.3)
+    assert sorted(train + test) == sorted(files)
+    assert 250 < len(test) < 350
+    # the files already split stay in the same dataset when files are added
+    new_train, new_test = split_by_hash(files + [f"/dl1/dl1_run{ii}.h5" for ii in range(1000, 1100)], 0.3)
+    assert set(train) <= set(new_train)
+    assert set(test) <= set(new_test)
@@ -3,13 +3,15 @@
 import shutil
 import logging
 from pathlib import Path
-from ..utils import save_log_to_file, SbatchLstMCStage
+from ..utils import save_log_to_file, SbatchLstMCStage, submit_stage_as_job_arrays, submit_concurrently
 from ..io.data_management import check_and_make_dir_without_verification
+from ..io.output_manifest import incomplete_paths, compose_output_manifest_command
+from ..io.stage_cache import get_stage_cache
 
 log = logging.getLogger(__name__)
 
 
-def batch_dl1_to_dl2(dict_paths, config_file, jobid_from_training, batch_config, logs):
+def batch_dl1_to_dl2(dict_paths, config_file, jobid_from_training, batch_config, logs, dependency_graph=None):
     """
     Function to batch the dl1_to_dl2 stage once the lstchain train_pipe batched jobs have finished.
 
@@ -25,8 +27,16 @@ def batch_dl1_to_dl2(dict_paths, config_file, jobid_from_training, batch_config,
     batch_config : dict
         Dictionary containing the (full) source_environment and the slurm_account strings to be passed to
         dl1_dl2 function
+        If `array_submission` is set, the jobs are submitted as a single slurm job array (one per set of
+        `extra_slurm_options`) instead of one job per path.
+        If `resume` is set, the DL2 files with a valid output manifest are not reprocessed.
+        If the `stage_cache` is enabled, DL2 files already produced with the same inputs and config are restored
+        from it, unless the inputs are still being produced by jobs of this run.
     logs: dict
         Dictionary with logs files
+    dependency_graph: `lstmcpipe.dependency_graph.DependencyGraph` or None
+        If provided, each job only depends on the jobs producing its DL1 file and its models and its output
+        directory is registered in the graph. Otherwise, all jobs depend on `jobid_from_training`.
 
     Returns
     -------
@@ -38,20 +48,90 @@ def batch_dl1_to_dl2(dict_paths, config_file, jobid_from_training, batch_config,
     jobid_for_dl2_to_dl3 = []
     debug_log = {}
     log.info("==== START batch dl1_to_dl2_workflow ==== \n")
-    for paths in dict_paths:
-        job_logs, jobid = dl1_to_dl2(
-            paths["input"],
-            paths["output"],
-            path_models=paths["path_model"],
-            config_file=config_file,
-            wait_jobid_train_pipe=jobid_from_training,
-            batch_configuration=batch_config,
-            extra_slurm_options=paths.get("extra_slurm_options", None),
+    resume = batch_config.get("resume", False)
+    if resume:
+        dict_paths = incomplete_paths(
+            dict_paths, "dl1_to_dl2", debug_log, get_output=lambda paths: dl2_filename(paths["input"], paths["output"])
         )
 
-        log_dl1_to_dl2.update(job_logs)
-        jobid_for_dl2_to_dl3.append(jobid)
-        debug_log[jobid] = f"dl1_to_dl2 jobid that depends on : {jobid_from_training} training job"
+    if batch_config.get("array_submission", False):
+        tasks = []
+        for paths in dict_paths:
+            check_and_make_dir_without_verification(paths["output"], keep_content=resume)
+            if config_file is not None:
+                shutil.copyfile(config_file, Path(paths["output"]).joinpath(Path(config_file).name))
+            if dependency_graph is not None:
+                wait_jobs = dependency_graph.dependencies([paths["input"], paths["path_model"]])
+            else:
+                wait_jobs = jobid_from_training
+            restored, store_cmd = _restore_or_store_command(
+                paths["input"], paths["output"], paths["path_model"], config_file, batch_config, wait_jobs
+            )
+            if restored:
+                debug_log[f"**CACHED** {paths['input']}"] = "DL2 file restored from the stage cache"
+                continue
+            tasks.append(
+                {
+                    "command": compose_dl1_to_dl2_command(
+                        paths["input"], paths["output"], paths["path_model"], config_file
+                    )
+                    + store_cmd,
+                    "input": [paths["input"], paths["path_model"]],
+                    "output": paths["output"],
+                    "extra_slurm_options": paths.get("extra_slurm_options", None),
+                }
+            )
+        log_dl1_to_dl2, array_debug_log, jobid_for_dl2_to_dl3 = submit_stage_as_job_arrays(
+            "dl1_to_dl2",
+            tasks,
+            batch_config,
+            tasks_dir=Path(logs["log_file"]).parent.joinpath("job_arrays"),
+            dependency_graph=dependency_graph,
+            stage_dependencies=jobid_from_training,
+        )
+        debug_log.update(array_debug_log)
+    else:
+        calls = []
+        all_wait_jobs = []
+        for paths in dict_paths:
+            if dependency_graph is not None:
+                wait_jobs = dependency_graph.dependencies([paths["input"], paths["path_model"]])
+            else:
+                wait_jobs = jobid_from_training
+            calls.append(
+                dict(
+                    input_file=paths["input"],
+                    output_dir=paths["output"],
+                    path_models=paths["path_model"],
+                    config_file=config_file,
+                    wait_jobid_train_pipe=wait_jobs,
+                    batch_configuration=batch_config,
+                    extra_slurm_options=paths.get("extra_slurm_options", None),
+                )
+            )
+            all_wait_jobs.append(wait_jobs)
+
+        # jobs writing in the same output directory are submitted sequentially as the directory is cleaned up
+        results = submit_concurrently(
+            dl1_to_dl2,
+            calls,
+            max_workers=batch_config.get("submission_threads", 1),
+            keys=[paths["output"] for paths in dict_paths],
+        )
+
+        produced_outputs = []
+        for paths, wait_jobs, (job_logs, jobid) in zip(dict_paths, all_wait_jobs, results):
+            if jobid is None:
+                debug_log[f"**CACHED** {paths['input']}"] = "DL2 file restored from the stage cache"
+                continue
+            log_dl1_to_dl2.update(job_logs)
+            jobid_for_dl2_to_dl3.append(jobid)
+            produced_outputs.append((jobid, paths["output"]))
+            debug_log[jobid] = f"dl1_to_dl2 jobid that depends on : {wait_jobs} training job"
+
+        if dependency_graph is not None:
+            for jobid, output in produced_outputs:
+                dependency_graph.add(jobid, output)
 
     jobid_for_dl2_to_dl3 = ",".join(jobid_for_dl2_to_dl3)
     save_log_to_file(log_dl1_to_dl2, logs["log_file"], workflow_step="dl1_to_dl2")
@@ -98,15 +178,21 @@ def dl1_to_dl2(
         log dictionary containing {jobid: batch_cmd} information
 
     jobid_dl1_to_dl2 : str
-        batched job_id to be passed to later stages
+        batched job_id to be passed to later stages, None if the DL2 file was restored from the stage cache
 
     """
     log.info(f"Working on DL1 files in {Path(input_file).parent.as_posix()}")
-    check_and_make_dir_without_verification(output_dir)
+    check_and_make_dir_without_verification(output_dir, keep_content=batch_configuration.get("resume", False))
     log.info(f"Output dir: {output_dir}")
-    cmd = f"lstchain_dl1_to_dl2 -f {input_file} -p {path_models} -o {output_dir}"
-    if config_file is not None:
-        cmd += f" -c {Path(config_file).resolve().as_posix()}"
+    cmd = compose_dl1_to_dl2_command(input_file, output_dir, path_models, config_file)
+    restored, store_cmd = _restore_or_store_command(
+        input_file, output_dir, path_models, config_file, batch_configuration, wait_jobid_train_pipe
+    )
+    if restored:
+        if config_file is not None:
+            shutil.copyfile(config_file, Path(output_dir).joinpath(Path(config_file).name))
+        return {}, None
+    cmd += store_cmd
     sbatch_dl1_dl2 = SbatchLstMCStage(
         "dl1_to_dl2",
         wrap_command=cmd,
@@ -116,6 +202,7 @@ def dl1_to_dl2(
         extra_slurm_options=extra_slurm_options,
         slurm_account=batch_configuration["slurm_account"],
         source_environment=batch_configuration["source_environment"],
+        executor=batch_configuration.get("executor"),
     )
 
     jobid_dl1_to_dl2 = sbatch_dl1_dl2.submit()
@@ -124,3 +211,70 @@ def dl1_to_dl2(
     if config_file is not None:
         shutil.copyfile(config_file, Path(output_dir).joinpath(Path(config_file).name))
     return log_dl1_to_dl2, jobid_dl1_to_dl2
+
+
+def compose_dl1_to_dl2_command(input_file, output_dir, path_models, config_file=None):
+    """
+    Compose the `lstchain_dl1_to_dl2` command line, followed by the writing of the DL2 file manifest
+
+    Parameters
+    ----------
+    input_file : str
+        FILE DL1 path
+    output_dir : str
+        DIR Dl2 path
+    path_models : str
+        DIR trained models path
+    config_file : str or None
+        Path to a configuration file
+
+    Returns
+    -------
+    cmd: str
+    """
+    cmd = f"lstchain_dl1_to_dl2 -f {input_file} -p {path_models} -o {output_dir}"
+    if config_file is not None:
+        cmd += f" -c {Path(config_file).resolve().as_posix()}"
+    cmd += f" && {compose_output_manifest_command(dl2_filename(input_file, output_dir))}"
+    return cmd
+
+
+def dl2_filename(input_file, output_dir):
+    """
+    Name of the DL2 file written by `lstchain_dl1_to_dl2` in `output_dir` for a DL1 `input_file`.
+
+    Parameters
+    ----------
+    input_file : str
+    output_dir : str
+
+    Returns
+    -------
+    str
+    """
+    return Path(output_dir).joinpath(Path(input_file).name.replace("dl1", "dl2", 1)).as_posix()
+
+
+def _restore_or_store_command(input_file, output_dir, path_models, config_file, batch_configuration, wait_jobs=None):
+    """
+    Restore the DL2 file from the stage cache if enabled and available, and if its inputs are not being produced
+    by the jobs `wait_jobs`.
+
+    Returns
+    -------
+    restored: bool
+    store_cmd: str
+        Command to chain to the job to store its DL2 file in the cache, empty if not needed
+    """
+    cache = get_stage_cache(batch_configuration, "dl1_to_dl2")
+    if cache is None:
+        return False, ""
+    restored, store_cmd = cache.restore_or_store_command(
+        "dl1_to_dl2",
+        [input_file, path_models],
+        config_file,
+        batch_configuration["source_environment"],
+        dl2_filename(input_file, output_dir),
+        pending=bool(wait_jobs),
+    )
+    return restored, "" if restored else f" && {store_cmd}"
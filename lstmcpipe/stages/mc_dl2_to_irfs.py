@@ -6,14 +6,15 @@
 import shutil
 import logging
 from pathlib import Path
-from ..utils import save_log_to_file, SbatchLstMCStage
+from ..utils import save_log_to_file, SbatchLstMCStage, submit_stage_as_job_arrays, submit_concurrently
 from ..io.data_management import check_and_make_dir_without_verification
+from ..io.output_manifest import incomplete_paths, compose_output_manifest_command
 
 
 log = logging.getLogger(__name__)
 
 
-def batch_dl2_to_irfs(dict_paths, config_file, job_ids_from_dl1_dl2, batch_config, logs):
+def batch_dl2_to_irfs(dict_paths, config_file, job_ids_from_dl1_dl2, batch_config, logs, dependency_graph=None):
     """
     Batches the dl2_to_irfs stage (lstchain lstchain_create_irf_files script) once the dl1_to_dl2 stage had finished.
 
@@ -29,8 +30,14 @@ def batch_dl2_to_irfs(dict_paths, config_file, job_ids_from_dl1_dl2, batch_confi
     batch_config : dict
         Dictionary containing the (full) source_environment and the slurm_account strings to be passed to
         dl2_to_irfs function
+        If `array_submission` is set, the jobs are submitted as a single slurm job array (one per set of
+        `extra_slurm_options`) instead of one job per path.
+        If `resume` is set, the IRF files with a valid output manifest are not produced again.
     logs: dict
         Dictionary with logs files
+    dependency_graph: `lstmcpipe.dependency_graph.DependencyGraph` or None
+        If provided, each job only depends on the jobs producing its DL2 files and its output is registered
+        in the graph. Otherwise, all jobs depend on `job_ids_from_dl1_dl2`.
 
     Returns
     -------
@@ -42,26 +49,86 @@ def batch_dl2_to_irfs(dict_paths, config_file, job_ids_from_dl1_dl2, batch_confi
     log_dl2_to_irfs = {}
     jobid_for_check = []
     debug_log = {}
-
-    for paths in dict_paths:
-        job_logs, jobid = dl2_to_irfs(
-            paths["input"]["gamma_file"],  # gamma_file must always be provided
-            paths["input"].get("electron_file", None),  # electron_file might be missing in case of point-like IRFs
-            paths["input"].get("proton_file", None),  # proton_file might be missing in case of point-like IRFs
-            paths["output"],
-            config_file=config_file,
-            options=paths.get("options", None),
-            batch_configuration=batch_config,
-            wait_jobs_dl1dl2=job_ids_from_dl1_dl2,
-            extra_slurm_options=paths.get("extra_slurm_options", None),
+    resume = batch_config.get("resume", False)
+    if resume:
+        dict_paths = incomplete_paths(dict_paths, "dl2_to_irfs", debug_log)
+
+    if batch_config.get("array_submission", False):
+        tasks = []
+        for paths in dict_paths:
+            output_dir = Path(paths["output"]).parent
+            check_and_make_dir_without_verification(output_dir, keep_content=resume)
+            if config_file:
+                shutil.copyfile(config_file, output_dir.joinpath(Path(config_file).name))
+            tasks.append(
+                {
+                    "command": compose_dl2_to_irfs_command(
+                        paths["input"]["gamma_file"],
+                        paths["input"].get("electron_file", None),
+                        paths["input"].get("proton_file", None),
+                        paths["output"],
+                        config_file=config_file,
+                        options=paths.get("options", None),
+                    ),
+                    "input": paths["input"],
+                    "output": paths["output"],
+                    "extra_slurm_options": paths.get("extra_slurm_options", None),
+                }
+            )
+        log_dl2_to_irfs, array_debug_log, jobid_for_check = submit_stage_as_job_arrays(
+            "dl2_to_irfs",
+            tasks,
+            batch_config,
+            tasks_dir=Path(logs["log_file"]).parent.joinpath("job_arrays"),
+            dependency_graph=dependency_graph,
+            stage_dependencies=job_ids_from_dl1_dl2,
         )
-
-        log_dl2_to_irfs.update(log_dl2_to_irfs)
-        jobid_for_check.append(jobid)
-        debug_log[jobid] = (
-            f"jobid from dl2_to_irfs stage that depends of the dl1_to_dl2 stage " f"job_ids; {job_ids_from_dl1_dl2}"
+        debug_log.update(array_debug_log)
+    else:
+        calls = []
+        all_wait_jobs = []
+        for paths in dict_paths:
+            if dependency_graph is not None:
+                wait_jobs = dependency_graph.dependencies(paths["input"])
+            else:
+                wait_jobs = job_ids_from_dl1_dl2
+            calls.append(
+                dict(
+                    gamma_file=paths["input"]["gamma_file"],  # gamma_file must always be provided
+                    # electron_file and proton_file might be missing in case of point-like IRFs
+                    electron_file=paths["input"].get("electron_file", None),
+                    proton_file=paths["input"].get("proton_file", None),
+                    outfile=paths["output"],
+                    config_file=config_file,
+                    options=paths.get("options", None),
+                    batch_configuration=batch_config,
+                    wait_jobs_dl1dl2=wait_jobs,
+                    extra_slurm_options=paths.get("extra_slurm_options", None),
+                )
+            )
+            all_wait_jobs.append(wait_jobs)
+
+        # jobs writing in the same output directory are submitted sequentially as the directory is cleaned up
+        results = submit_concurrently(
+            dl2_to_irfs,
+            calls,
+            max_workers=batch_config.get("submission_threads", 1),
+            keys=[Path(paths["output"]).parent for paths in dict_paths],
         )
 
+        produced_outputs = []
+        for paths, wait_jobs, (job_logs, jobid) in zip(dict_paths, all_wait_jobs, results):
+            log_dl2_to_irfs.update(job_logs)
+            jobid_for_check.append(jobid)
+            produced_outputs.append((jobid, paths["output"]))
+            debug_log[jobid] = (
+                f"jobid from dl2_to_irfs stage that depends of the dl1_to_dl2 stage " f"job_ids; {wait_jobs}"
+            )
+
+        if dependency_graph is not None:
+            for jobid, output in produced_outputs:
+                dependency_graph.add(jobid, output)
+
     jobid_for_check = ",".join(jobid_for_check)
 
     save_log_to_file(log_dl2_to_irfs, logs["log_file"], workflow_step="dl2_to_irfs")
@@ -116,16 +183,9 @@ def dl2_to_irfs(
     output_dir = Path(outfile).parent
     log_dl2_to_irfs = {}
 
-    check_and_make_dir_without_verification(output_dir)
+    check_and_make_dir_without_verification(output_dir, keep_content=batch_configuration.get("resume", False))
 
-    options = '' if options is None else options
-    cmd = f"lstchain_create_irf_files {options} -g {gamma_file} -o {outfile} "
-    if proton_file is not None:
-        cmd += f" -p {proton_file}"
-    if electron_file is not None:
-        cmd += f" -e {electron_file}"
-    if config_file:
-        cmd += f" --config={config_file}"
+    cmd = compose_dl2_to_irfs_command(gamma_file, electron_file, proton_file, outfile, config_file, options)
 
     log.info(f"Output dir IRF of {gamma_file}: {output_dir}")
 
@@ -138,6 +198,7 @@ def dl2_to_irfs(
         extra_slurm_options=extra_slurm_options,
         slurm_account=batch_configuration["slurm_account"],
         source_environment=batch_configuration["source_environment"],
+        executor=batch_configuration.get("executor"),
     )
 
     job_id_dl2_irfs = sbatch_dl2_irfs.submit()
@@ -150,3 +211,33 @@ def dl2_to_irfs(
         shutil.copyfile(config_file, Path(output_dir).joinpath(Path(config_file).name))
 
     return log_dl2_to_irfs, job_id_dl2_irfs
+
+
+def compose_dl2_to_irfs_command(gamma_file, electron_file, proton_file, outfile, config_file=None, options=None):
+    """
+    Compose the `lstchain_create_irf_files` command line, followed by the writing of the output manifest
+
+    Parameters
+    ----------
+    gamma_file: str
+    electron_file: str or None
+    proton_file: str or None
+    outfile: str
+    config_file: str or None
+    options: str or None
+        options to pass to lstchain_create_irf_files as a string
+
+    Returns
+    -------
+    cmd: str
+    """
+    options = '' if options is None else options
+    cmd = f"lstchain_create_irf_files {options} -g {gamma_file} -o {outfile} "
+    if proton_file is not None:
+        cmd += f" -p {proton_file}"
+    if electron_file is not None:
+        cmd += f" -e {electron_file}"
+    if config_file:
+        cmd += f" --config={config_file}"
+    cmd += f" && {compose_output_manifest_command(outfile)}"
+    return cmd
@@ -2,12 +2,13 @@
 
 import logging
 from pathlib import Path
-from ..utils import save_log_to_file, SbatchLstMCStage
+from ..utils import save_log_to_file, SbatchLstMCStage, submit_concurrently
+from ..io.output_manifest import incomplete_paths, compose_output_manifest_command
 
 log = logging.getLogger(__name__)
 
 
-def batch_dl2_to_sensitivity(dict_paths, job_ids_from_dl1_dl2, batch_config, logs):
+def batch_dl2_to_sensitivity(dict_paths, job_ids_from_dl1_dl2, batch_config, logs, dependency_graph=None):
     """
     Batches the dl2_to_sensitivity stage (`stages.script_dl2_to_sensitivity` based in the pyIRF iib) once the
     dl1_to_dl2 stage had finished.
@@ -24,6 +25,11 @@ def batch_dl2_to_sensitivity(dict_paths, job_ids_from_dl1_dl2, batch_config, log
         dl2_to_sensitivity function
     logs: dict
         Dictionary with logs files
+    dependency_graph: `lstmcpipe.dependency_graph.DependencyGraph` or None
+        If provided, each job only depends on the jobs producing its DL2 files.
+        Otherwise, all jobs depend on `job_ids_from_dl1_dl2`.
+
+    If `batch_config["resume"]` is set, the sensitivity files with a valid output manifest are not produced again.
 
     Returns
     -------
@@ -34,20 +40,35 @@ def batch_dl2_to_sensitivity(dict_paths, job_ids_from_dl1_dl2, batch_config, log
     log_dl2_to_sensitivity = {}
     jobid_for_check = []
     debug_log = {}
+    if batch_config.get("resume", False):
+        dict_paths = incomplete_paths(dict_paths, "dl2_to_sensitivity", debug_log)
+
+    calls = []
+    all_wait_jobs = []
     for paths in dict_paths:
-        job_logs, jobid = dl2_to_sensitivity(
-            paths["input"],
-            paths["output"],
-            batch_configuration=batch_config,
-            wait_jobs_dl1_dl2=job_ids_from_dl1_dl2,
-            extra_slurm_options=paths.get("extra_slurm_options", None),
+        if dependency_graph is not None:
+            wait_jobs = dependency_graph.dependencies(paths["input"])
+        else:
+            wait_jobs = job_ids_from_dl1_dl2
+        calls.append(
+            dict(
+                input_paths=paths["input"],
+                output=paths["output"],
+                batch_configuration=batch_config,
+                wait_jobs_dl1_dl2=wait_jobs,
+                extra_slurm_options=paths.get("extra_slurm_options", None),
+            )
         )
+        all_wait_jobs.append(wait_jobs)
+
+    results = submit_concurrently(dl2_to_sensitivity, calls, max_workers=batch_config.get("submission_threads", 1))
 
+    for wait_jobs, (job_logs, jobid) in zip(all_wait_jobs, results):
         jobid_for_check.append(jobid)
         log_dl2_to_sensitivity.update(job_logs)
         debug_log[jobid] = (
             f"Job_ids from the dl2_to_sensitivity stage and the plot_irfs script that depends on the "
-            f"dl1_to_dl2 stage job_ids; {job_ids_from_dl1_dl2} "
+            f"dl1_to_dl2 stage job_ids; {wait_jobs} "
         )
 
     jobid_for_check = ",".join(jobid_for_check)
@@ -88,6 +109,7 @@ def dl2_to_sensitivity(input_paths, output, batch_configuration, wait_jobs_dl1_d
     p_file = input_paths["proton_file"]
     e_file = input_paths["electron_file"]
     cmd_sens = f"lstmcpipe_dl2_to_sensitivity -g {g_file} -p {p_file} -e {e_file} -o {output}"
+    cmd_sens += f" && {compose_output_manifest_command(output)}"
 
     sbatch_dl2_sens = SbatchLstMCStage(
         "dl2_sens",
@@ -98,6 +120,7 @@ def dl2_to_sensitivity(input_paths, output, batch_configuration, wait_jobs_dl1_d
         extra_slurm_options=extra_slurm_options,
         slurm_account=batch_configuration["slurm_account"],
         source_environment=batch_configuration["source_environment"],
+        executor=batch_configuration.get("executor"),
     )
 
     job_id_dl2_sens = sbatch_dl2_sens.submit()
@@ -116,6 +139,7 @@ def dl2_to_sensitivity(input_paths, output, batch_configuration, wait_jobs_dl1_d
         extra_slurm_options=extra_slurm_options,
         slurm_account=batch_configuration["slurm_account"],
         source_environment=batch_configuration["source_environment"],
+        executor=batch_configuration.get("executor"),
         backend="export MPLBACKEND=Agg; ",
     )
 
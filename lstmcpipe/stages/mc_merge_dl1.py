@@ -1,18 +1,47 @@
 #!/usr//bin/env python3
 
+import os
+import shlex
 import logging
+from math import ceil
 from pathlib import Path
-from ..utils import save_log_to_file, SbatchLstMCStage
+from ..utils import save_log_to_file, SbatchLstMCStage, submit_stage_as_job_arrays, submit_concurrently
+from ..io.output_manifest import incomplete_paths, compose_output_manifest_command
+from ..io.data_management import get_input_filelist
+from ..io.dl1_merge import is_file_list, read_file_lists
 
 log = logging.getLogger(__name__)
 
 
-def batch_merge_dl1(dict_paths, batch_config, logs, jobid_from_splitting, workflow_kind="lstchain"):
+def batch_merge_dl1(
+    dict_paths,
+    batch_config,
+    logs,
+    jobid_from_splitting,
+    workflow_kind="lstchain",
+    dependency_graph=None,
+    stages=None,
+    config_file=None,
+):
     """
     Function to batch the onsite_mc_merge_and_copy function once the all the r0_to_dl1 jobs (batched by particle type)
     have finished.
 
     Batch 8 merge_and_copy_dl1 jobs ([train, test] x particle) + the move_dl1 and move_dir jobs (2 per particle).
+    If `batch_config["array_submission"]` is set, the jobs are submitted as a single slurm job array
+    (one per set of `extra_slurm_options`) instead of one job per path.
+    If `batch_config["resume"]` is set, the merged files with a valid output manifest are not merged again.
+    If `batch_config["merge_fan_in"]` is set, the outputs with more input files are merged as a tree, see
+    `batch_merge_dl1_tree`.
+    If `batch_config["merge_incremental"]` is set, only the input files not merged yet are appended to the existing
+    outputs, see `lstmcpipe.io.dl1_merge.incremental_merge_dl1_files`.
+    If `batch_config["merge_virtual"]` is set, the outputs are HDF5 virtual datasets over the input files, see
+    `lstmcpipe.io.dl1_merge.virtual_merge_dl1_files`, and are never merged as a tree.
+    If `batch_config["merge_training_columns"]` is set, the outputs used by the train_pipe stage only keep the
+    parameters used by the training with `config_file`, see `lstmcpipe.io.dl1_merge.training_columns`.
+    If `batch_config["merge_training_max_events"]` is set, the outputs used by the train_pipe stage only keep a
+    stratified subsample of about this number of events, drawn with the seed `batch_config["merge_subsampling_seed"]`,
+    see `lstmcpipe.io.dl1_merge.stratified_subsample`.
 
     Parameters
     ----------
@@ -26,6 +55,14 @@ def batch_merge_dl1(dict_paths, batch_config, logs, jobid_from_splitting, workfl
     logs: dict
         Dictionary with logs files
     jobid_from_splitting: str
+    dependency_graph: `lstmcpipe.dependency_graph.DependencyGraph` or None
+        If provided, each job only depends on the jobs producing its input and its output is registered
+        in the graph. Otherwise, all jobs depend on `jobid_from_splitting`.
+    stages: dict or None
+        Paths of all the stages of the production, used to estimate the number of files to merge when they are
+        not produced yet and to find the outputs used by the training
+    config_file: str or None
+        lstchain config of the training
 
     Returns
     -------
@@ -38,19 +75,117 @@ def batch_merge_dl1(dict_paths, batch_config, logs, jobid_from_splitting, workfl
     all_jobs_merge_stage = []
     debug_log = {}
     log.info('==== START batch merge_and_copy_dl1_workflow ====')
-    for paths in dict_paths:
-        job_logs, jobid_debug = merge_dl1(
-            paths["input"],
-            paths["output"],
-            merging_options=paths.get('options', None),
-            batch_configuration=batch_config,
-            wait_jobs_split=jobid_from_splitting,
-            workflow_kind=workflow_kind,
-            extra_slurm_options=paths.get("extra_slurm_options", None),
+    if batch_config.get("resume", False):
+        dict_paths = incomplete_paths(dict_paths, "merge_dl1", debug_log)
+
+    training_options = {}
+    if batch_config.get("merge_training_columns", False) and config_file is not None:
+        training_options["columns_config"] = config_file
+    if batch_config.get("merge_training_max_events"):
+        training_options["max_events"] = batch_config["merge_training_max_events"]
+        training_options["subsampling_seed"] = batch_config.get("merge_subsampling_seed", 0)
+    if training_options:
+        training_outputs = _training_outputs(stages)
+        dict_paths = [
+            dict(paths, **training_options) if os.path.abspath(paths["output"]) in training_outputs else paths
+            for paths in dict_paths
+        ]
+
+    fan_in = batch_config.get("merge_fan_in")
+    if fan_in and not batch_config.get("merge_virtual", False) and workflow_kind in ["lstchain", "hiperta"]:
+        tree_paths = []
+        single_paths = []
+        for paths in dict_paths:
+            n_files = estimate_n_merge_inputs(paths["input"], paths.get("options"), stages)
+            if n_files is None:
+                log.warning(f"Unknown number of files to merge into {paths['output']}, merged by a single job")
+            # new files are appended to the existing outputs by a single job
+            appended = batch_config.get("merge_incremental", False) and Path(paths["output"]).exists()
+            if n_files is not None and n_files > fan_in and not appended:
+                tree_paths.append(dict(paths, n_files=n_files))
+            else:
+                single_paths.append(paths)
+        dict_paths = single_paths
+        if tree_paths:
+            tree_log, tree_debug_log, all_jobs_merge_stage = batch_merge_dl1_tree(
+                tree_paths,
+                batch_config,
+                fan_in,
+                tasks_dir=Path(logs["log_file"]).parent.joinpath("job_arrays"),
+                dependency_graph=dependency_graph,
+                stage_dependencies=jobid_from_splitting,
+            )
+            log_merge.update(tree_log)
+            debug_log.update(tree_debug_log)
+
+    if batch_config.get("array_submission", False):
+        tasks = []
+        for paths in dict_paths:
+            tasks.append(
+                {
+                    "command": compose_merge_dl1_command(
+                        paths["input"],
+                        paths["output"],
+                        paths.get('options', None),
+                        workflow_kind,
+                        incremental=batch_config.get("merge_incremental", False),
+                        virtual=batch_config.get("merge_virtual", False),
+                        columns_config=paths.get("columns_config"),
+                        max_events=paths.get("max_events"),
+                        subsampling_seed=paths.get("subsampling_seed", 0),
+                    ),
+                    "input": paths["input"],
+                    "output": paths["output"],
+                    "extra_slurm_options": paths.get("extra_slurm_options", None),
+                }
+            )
+        array_log, array_debug_log, array_jobids = submit_stage_as_job_arrays(
+            "merge_dl1",
+            tasks,
+            batch_config,
+            tasks_dir=Path(logs["log_file"]).parent.joinpath("job_arrays"),
+            dependency_graph=dependency_graph,
+            stage_dependencies=jobid_from_splitting,
         )
+        log_merge.update(array_log)
+        debug_log.update(array_debug_log)
+        all_jobs_merge_stage.extend(array_jobids)
+    else:
+        calls = []
+        all_wait_jobs = []
+        for paths in dict_paths:
+            if dependency_graph is not None:
+                wait_jobs = dependency_graph.dependencies(paths["input"])
+            else:
+                wait_jobs = jobid_from_splitting
+            calls.append(
+                dict(
+                    input_dir=paths["input"],
+                    output_file=paths["output"],
+                    merging_options=paths.get('options', None),
+                    batch_configuration=batch_config,
+                    wait_jobs_split=wait_jobs,
+                    workflow_kind=workflow_kind,
+                    extra_slurm_options=paths.get("extra_slurm_options", None),
+                    columns_config=paths.get("columns_config"),
+                    max_events=paths.get("max_events"),
+                    subsampling_seed=paths.get("subsampling_seed", 0),
+                )
+            )
+            all_wait_jobs.append(wait_jobs)
+
+        results = submit_concurrently(merge_dl1, calls, max_workers=batch_config.get("submission_threads", 1))
 
-        log_merge.update(job_logs)
-        all_jobs_merge_stage.append(jobid_debug)
+        produced_outputs = []
+        for paths, wait_jobs, (job_logs, jobid_debug) in zip(dict_paths, all_wait_jobs, results):
+            log_merge.update(job_logs)
+            all_jobs_merge_stage.append(jobid_debug)
+            produced_outputs.append((jobid_debug, paths["output"]))
+            debug_log[jobid_debug] = f"merge_dl1 jobid that depends on : {wait_jobs}"
+
+        if dependency_graph is not None:
+            for jobid, output in produced_outputs:
+                dependency_graph.add(jobid, output)
     save_log_to_file(log_merge, logs["log_file"], "merge_dl1")
     save_log_to_file(debug_log, logs["debug_file"], workflow_step="merge_dl1")
     log.info('==== END batch merge_and_copy_dl1_workflow ====')
@@ -65,6 +200,9 @@ def merge_dl1(
     merging_options=None,
     workflow_kind="lstchain",
     extra_slurm_options=None,
+    columns_config=None,
+    max_events=None,
+    subsampling_seed=0,
 ):
     """
 
@@ -78,6 +216,11 @@ def merge_dl1(
     workflow_kind: str
     extra_slurm_options: dict
         Extra slurm options to be passed to the sbatch command
+    columns_config: str or None
+        lstchain config whose training parameters are the only ones merged
+    max_events: int or None
+        Number of events of the stratified subsample merged
+    subsampling_seed: int
 
     Returns
     -------
@@ -85,12 +228,17 @@ def merge_dl1(
     jobid_merge: str
 
     """
-    merging_options = "" if merging_options is None else merging_options
-    if workflow_kind in ["lstchain", "hiperta"]:
-        cmd = f'lstchain_merge_hdf5_files -d {input_dir} -o {output_file} {merging_options}'
-
-    else:
-        cmd = f'ctapipe-merge --input-dir {input_dir} --output {output_file} {merging_options}'
+    cmd = compose_merge_dl1_command(
+        input_dir,
+        output_file,
+        merging_options,
+        workflow_kind,
+        incremental=batch_configuration.get("merge_incremental", False),
+        virtual=batch_configuration.get("merge_virtual", False),
+        columns_config=columns_config,
+        max_events=max_events,
+        subsampling_seed=subsampling_seed,
+    )
 
     sbatch_merge_dl1 = SbatchLstMCStage(
         "merge_dl1",
@@ -101,6 +249,7 @@ def merge_dl1(
         extra_slurm_options=extra_slurm_options,
         slurm_account=batch_configuration["slurm_account"],
         source_environment=batch_configuration["source_environment"],
+        executor=batch_configuration.get("executor"),
     )
 
     jobid_merge = sbatch_merge_dl1.submit()
@@ -108,3 +257,327 @@ def merge_dl1(
     log.info(f"\nMerging DL1 file from {input_dir} dir into {output_file} file.")
     log.info(f"Submitted batch job {jobid_merge}")
     return log_merge, jobid_merge
+
+
+def compose_merge_dl1_command(
+    input_dir,
+    output_file,
+    merging_options=None,
+    workflow_kind="lstchain",
+    incremental=False,
+    virtual=False,
+    columns_config=None,
+    max_events=None,
+    subsampling_seed=0,
+):
+    """
+    Compose the merging command line of the `workflow_kind`, followed by the writing of the output manifest
+
+    Parameters
+    ----------
+    input_dir: str or list of str
+        Directory of the files to merge, or `.list` manifest(s) written by the metadata-only train/test split
+    output_file: str
+    merging_options: str or None
+    workflow_kind: str
+    incremental: bool
+        Only append to an existing output the input files not merged yet, see
+        `lstmcpipe.io.dl1_merge.incremental_merge_dl1_files`
+    virtual: bool
+        Write HDF5 virtual datasets over the input files instead of copying them, see
+        `lstmcpipe.io.dl1_merge.virtual_merge_dl1_files`. The whole output is written again, so `incremental`
+        is ignored.
+    columns_config: str or None
+        lstchain config: only the parameters used by the training with it are merged, see
+        `lstmcpipe.io.dl1_merge.training_columns`. Ignored by the virtual merge.
+    max_events: int or None
+        Only merge a stratified subsample of about `max_events` events, see
+        `lstmcpipe.io.dl1_merge.stratified_subsample`. Ignored by the virtual merge. The subsampled outputs are
+        merged from scratch, so `incremental` is ignored.
+    subsampling_seed: int
+
+    Returns
+    -------
+    cmd: str
+    """
+    merging_options = "" if merging_options is None else merging_options
+    if virtual:
+        merge_option = " --virtual"
+    elif incremental and max_events is None:
+        merge_option = " --incremental"
+    else:
+        merge_option = ""
+    if not virtual:
+        merge_option += _training_merge_options(columns_config, max_events, subsampling_seed)
+    if (is_file_list(input_dir) or merge_option) and workflow_kind not in ["lstchain", "hiperta"]:
+        raise ValueError(
+            f"Merging `.list` manifests, incrementally, virtually, a subset of the columns or a subsample of the "
+            f"events is not supported for {workflow_kind}"
+        )
+    if is_file_list(input_dir):
+        input_lists = [input_dir] if isinstance(input_dir, (str, Path)) else input_dir
+        input_lists = " ".join(Path(path).as_posix() for path in input_lists)
+        cmd = f'lstmcpipe_merge_dl1 --input-lists {input_lists}{merge_option} -o {output_file} {merging_options}'
+    elif merge_option:
+        cmd = f'lstmcpipe_merge_dl1 -d {input_dir}{merge_option} -o {output_file} {merging_options}'
+    elif workflow_kind in ["lstchain", "hiperta"]:
+        cmd = f'lstchain_merge_hdf5_files -d {input_dir} -o {output_file} {merging_options}'
+
+    else:
+        cmd = f'ctapipe-merge --input-dir {input_dir} --output {output_file} {merging_options}'
+    return f"{cmd.strip()} && {compose_output_manifest_command(output_file)}"
+
+
+def _split_pattern(merging_options):
+    """
+    Split the `--pattern` of the merging options from the other options.
+
+    Returns
+    -------
+    tuple: (pattern, other options as a str)
+    """
+    args = shlex.split(merging_options or "")
+    pattern = "*.h5"
+    for flag in ("--pattern", "-p"):
+        if flag in args:
+            index = args.index(flag)
+            pattern = args.pop(index + 1)
+            args.pop(index)
+    return pattern, " ".join(args)
+
+
+def _training_merge_options(columns_config=None, max_events=None, subsampling_seed=0):
+    """
+    Options of `lstmcpipe_merge_dl1` keeping only the training columns and a subsample of the events.
+    """
+    options = ""
+    if columns_config is not None:
+        options += f" --columns-config {columns_config}"
+    if max_events is not None:
+        options += f" --max-events {max_events} --seed {subsampling_seed}"
+    return options
+
+
+def _training_outputs(stages):
+    """
+    Absolute paths of the merged files used by the train_pipe entries.
+    """
+    outputs = set()
+    for entry in (stages or {}).get("train_pipe") or []:
+        inputs = entry["input"].values() if isinstance(entry["input"], dict) else [entry["input"]]
+        outputs.update(os.path.abspath(path) for path in inputs)
+    return outputs
+
+
+def _n_produced_files(paths, stages):
+    """
+    Number of files processed by the r0_to_dl1 or dl1ab entries writing in the directories `paths`, or in the
+    inputs of the train_test_split entries writing `paths`. None if no entry produces them.
+    """
+    if not stages:
+        return None
+    n_files = None
+    for path in paths:
+        dl1_dirs = [os.path.abspath(path)]
+        for split in stages.get("train_test_split") or []:
+            if dl1_dirs[0] in [os.path.abspath(split["output"][key]) for key in ("train", "test")]:
+                dl1_dirs = [os.path.abspath(split["input"])]
+        for stage, pattern in (("r0_to_dl1", "*.simtel.gz"), ("dl1ab", "*.h5")):
+            for entry in stages.get(stage) or []:
+                output = os.path.abspath(entry["output"])
+                if any(output == directory or output.startswith(directory + os.sep) for directory in dl1_dirs):
+                    n_files = (n_files or 0) + len(get_input_filelist(entry["input"], glob_pattern=pattern))
+    return n_files
+
+
+def estimate_n_merge_inputs(input_dir, merging_options=None, stages=None):
+    """
+    Number of files to merge: counted if they exist, otherwise the number of files processed by the stages
+    producing them (an upper bound when the files are split into train and test datasets).
+
+    Parameters
+    ----------
+    input_dir: str or list of str
+        Directory of the files to merge, or `.list` manifest(s)
+    merging_options: str or None
+        Merging options, with the glob `--pattern` of the files in `input_dir`
+    stages: dict or None
+        Paths of all the stages of the production
+
+    Returns
+    -------
+    int or None: None if the number can not be estimated
+    """
+    if is_file_list(input_dir):
+        lists = [input_dir] if isinstance(input_dir, (str, Path)) else input_dir
+        if all(Path(path).exists() for path in lists):
+            return len(read_file_lists(lists))
+        return _n_produced_files(lists, stages)
+    pattern, _ = _split_pattern(merging_options)
+    if Path(input_dir).exists():
+        n_files = len(get_input_filelist(input_dir, glob_pattern=pattern))
+        if n_files > 0:
+            return n_files
+    return _n_produced_files([input_dir], stages)
+
+
+def merge_tree_levels(
+    input_dir,
+    output_file,
+    merging_options,
+    n_files,
+    fan_in,
+    columns_config=None,
+    max_events=None,
+    subsampling_seed=0,
+):
+    """
+    Tasks of the merge tree of one output. The input files are split into groups of about `fan_in` files merged
+    concurrently (the groups are made at run time, see `lstmcpipe.io.dl1_merge.select_group`), then the partial
+    files are merged by groups of `fan_in` until a single file remains.
+    The partial files are written in `{output_file}.merge_tree` with a `.part` extension, so that they never match
+    the glob pattern of the inputs, and are removed by the final merge.
+    A task with nothing to merge (e.g. the number of files was overestimated) writes a `.part.empty` marker instead
+    of its partial file, ignored by the next level. A partial file missing without marker (failed task) makes the
+    next level fail, so that the final merge is never written without the files of a group.
+
+    Parameters
+    ----------
+    input_dir: str or list of str
+        Directory of the files to merge, or `.list` manifest(s)
+    output_file: str
+    merging_options: str or None
+    n_files: int
+        Estimated number of files to merge
+    fan_in: int
+        Number of files merged by each task
+    columns_config: str or None
+        lstchain config whose training parameters are the only ones merged by the first level
+    max_events: int or None
+        Number of events of the stratified subsample merged by the final level
+    subsampling_seed: int
+
+    Returns
+    -------
+    list of list of dict: tasks of each level, with keys `command`, `input` and `output`.
+    The last level is a single task writing `output_file` and its output manifest.
+    """
+    output_file = Path(output_file)
+    tree_dir = output_file.with_name(f"{output_file.name}.merge_tree")
+    pattern, options = _split_pattern(merging_options)
+    if is_file_list(input_dir):
+        lists = [input_dir] if isinstance(input_dir, (str, Path)) else input_dir
+        input_args = "--input-lists " + " ".join(Path(path).as_posix() for path in lists)
+    else:
+        input_args = f"-d {Path(input_dir).as_posix()} --pattern '{pattern}'"
+    input_args += _training_merge_options(columns_config)
+
+    n_groups = ceil(n_files / fan_in)
+    levels = [[]]
+    for group in range(n_groups):
+        part = tree_dir.joinpath(f"level0_{group}.part").as_posix()
+        levels[0].append(
+            {
+                "command": f"mkdir -p {tree_dir.as_posix()} && lstmcpipe_merge_dl1 {input_args} --group {group} "
+                f"--n-groups {n_groups} -o {part} --mark-empty --no-progress {options}".strip(),
+                "input": input_dir,
+                "output": part,
+            }
+        )
+    while True:
+        parts = [task["output"] for task in levels[-1]]
+        if len(parts) <= fan_in:
+            command = (
+                f"lstmcpipe_merge_dl1 --input-files {' '.join(parts)} --skip-empty -o {output_file.as_posix()}"
+                f"{_training_merge_options(max_events=max_events, subsampling_seed=subsampling_seed)}"
+                f" --no-progress {options}".strip()
+            )
+            levels.append(
+                [
+                    {
+                        "command": f"{command} && rm -r {tree_dir.as_posix()}"
+                        f" && {compose_output_manifest_command(output_file.as_posix())}",
+                        "input": parts,
+                        "output": output_file.as_posix(),
+                    }
+                ]
+            )
+            return levels
+        level = len(levels)
+        levels.append([])
+        for group in range(ceil(len(parts) / fan_in)):
+            part = tree_dir.joinpath(f"level{level}_{group}.part").as_posix()
+            start, stop = group * fan_in, (group + 1) * fan_in
+            group_parts = " ".join(parts[start:stop])
+            levels[-1].append(
+                {
+                    "command": f"lstmcpipe_merge_dl1 --input-files {group_parts} --skip-empty -o {part}"
+                    f" --mark-empty --no-progress {options}".strip(),
+                    "input": parts[start:stop],
+                    "output": part,
+                }
+            )
+
+
+def batch_merge_dl1_tree(dict_paths, batch_config, fan_in, tasks_dir, dependency_graph=None, stage_dependencies=None):
+    """
+    Submit the merge trees of several outputs, see `merge_tree_levels`. The tasks of the same level of all the
+    trees are submitted as job arrays, each level depending on the previous one.
+
+    Parameters
+    ----------
+    dict_paths: list of dict
+        merge_dl1 paths, with the estimated number of input files `n_files`
+    batch_config: dict
+    fan_in: int
+        Number of files merged by each task
+    tasks_dir: Path
+        Directory where the tasks files and the slurm logs of the arrays are written
+    dependency_graph: `lstmcpipe.dependency_graph.DependencyGraph` or None
+    stage_dependencies: str or None
+        Comma-separated job ids the first level depends on when no dependency graph is provided
+
+    Returns
+    -------
+    jobid2log: dict
+    debug_log: dict
+    jobids: list
+        job ids of the arrays of all the levels
+    """
+    trees = []
+    for paths in dict_paths:
+        levels = merge_tree_levels(
+            paths["input"],
+            paths["output"],
+            paths.get("options"),
+            paths["n_files"],
+            fan_in,
+            columns_config=paths.get("columns_config"),
+            max_events=paths.get("max_events"),
+            subsampling_seed=paths.get("subsampling_seed", 0),
+        )
+        # the final merge keeps the resources of the output, the smaller merges get the ones of the stage
+        levels[-1][0]["extra_slurm_options"] = paths.get("extra_slurm_options", None)
+        log.info(f"Merging about {paths['n_files']} files into {paths['output']} with a tree of {len(levels)} levels")
+        trees.append(levels)
+
+    jobid2log = {}
+    debug_log = {}
+    jobids = []
+    wait_jobs = stage_dependencies
+    for ilevel in range(max(len(levels) for levels in trees)):
+        tasks = [task for levels in trees if ilevel < len(levels) for task in levels[ilevel]]
+        level_log, level_debug_log, level_jobids = submit_stage_as_job_arrays(
+            "merge_dl1",
+            tasks,
+            batch_config,
+            tasks_dir=tasks_dir,
+            dependency_graph=dependency_graph,
+            stage_dependencies=wait_jobs,
+            tasks_name=f"merge_dl1_tree_level{ilevel}",
+        )
+        jobid2log.update(level_log)
+        debug_log.update(level_debug_log)
+        jobids.extend(level_jobids)
+        wait_jobs = ",".join(level_jobids)
+    return jobid2log, debug_log, jobids
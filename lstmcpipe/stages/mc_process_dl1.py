@@ -6,12 +6,23 @@ import shutil
 import logging
 from pathlib import Path
 from ..utils import save_log_to_file, SbatchLstMCStage
+from ..executors import format_array_range
 from ..io.data_management import check_data_path, get_input_filelist
+from ..io.output_manifest import verify_output_manifest, manifest_path, is_output_complete
+from ..io.sublists import build_sublists, read_runtime_history, DEFAULT_MAX_TASKS
 
 log = logging.getLogger(__name__)
 
 
-def batch_process_dl1(dict_paths, conf_file, batch_config, logs, workflow_kind="lstchain", new_production=True):
+def batch_process_dl1(
+    dict_paths,
+    conf_file,
+    batch_config,
+    logs,
+    workflow_kind="lstchain",
+    new_production=True,
+    dependency_graph=None,
+):
     """
     Batch the dl1 processing jobs by particle type.
 
@@ -30,6 +41,11 @@ def batch_process_dl1(dict_paths, conf_file, batch_config, logs, workflow_kind="
         Whether to analysis simtel or reprocess existing dl1 files.
     logs: dict
         Dictionary con logs files
+    dependency_graph: `lstmcpipe.dependency_graph.DependencyGraph` or None
+        If provided, the output directory of each job is registered in the graph
+
+    If `batch_config["resume"]` is set, only the sublists of files without a valid output manifest are processed.
+    DL1 directories already split into complete train and test directories are not processed again.
 
     Returns
     -------
@@ -42,6 +58,9 @@ def batch_process_dl1(dict_paths, conf_file, batch_config, logs, workflow_kind="
     log.info(f"==== START {workflow_kind} dl1 processing ====")
     if new_production:
         for paths in dict_paths["r0_to_dl1"]:
+            if batch_config.get("resume", False) and _is_split_complete(paths["output"], dict_paths):
+                debug_log[f'**COMPLETE** {paths["output"]}'] = 'r0_dl1 outputs already split, nothing to resume'
+                continue
             try:
                 check_data_path(paths["input"], glob="*.simtel.gz")
             except ValueError:
@@ -56,10 +75,15 @@ def batch_process_dl1(dict_paths, conf_file, batch_config, logs, workflow_kind="
                 workflow_kind=workflow_kind,
                 extra_slurm_options=paths.get("extra_slurm_options", None),
             )
+            if jobid is None:
+                debug_log[f'**COMPLETE** {paths["output"]}'] = 'r0_dl1 outputs already complete, nothing to resume'
+                continue
 
             log_process_dl1.update(job_logs)
             jobids_dl1_processing_stage.append(jobid)
             debug_log[jobid] = f'r0_dl1 job from input dir: {paths["input"]}'
+            if dependency_graph is not None:
+                dependency_graph.add(jobid, paths["output"])
     else:
         for paths in dict_paths["dl1ab"]:
             job_logs, jobid = reprocess_dl1(
@@ -70,10 +94,15 @@ def batch_process_dl1(dict_paths, conf_file, batch_config, logs, workflow_kind="
                 workflow_kind=workflow_kind,
                 extra_slurm_options=paths.get("extra_slurm_options", None),
             )
+            if jobid is None:
+                debug_log[f'**COMPLETE** {paths["output"]}'] = 'dl1ab outputs already complete, nothing to resume'
+                continue
 
             log_process_dl1.update(job_logs)
             jobids_dl1_processing_stage.append(jobid)
             debug_log[jobid] = f'dl1ab job from input dir: {paths["input"]}'
+            if dependency_graph is not None:
+                dependency_graph.add(jobid, paths["output"])
     jobids_dl1_processing_stage = ",".join(jobids_dl1_processing_stage)
     if new_production:
         save_log_to_file(log_process_dl1, logs["log_file"], "r0_to_dl1")
@@ -85,6 +114,66 @@ def batch_process_dl1(dict_paths, conf_file, batch_config, logs, workflow_kind="
     return jobids_dl1_processing_stage
 
 
+def _is_split_complete(dl1_dir, dict_paths):
+    """
+    Whether the DL1 files of `dl1_dir` were already moved into complete train and test directories
+    by the train_test_split stage.
+    """
+    for paths in dict_paths.get("train_test_split") or []:
+        if Path(paths["input"]).resolve() == Path(dl1_dir).resolve() and is_output_complete(paths["output"]):
+            return True
+    return False
+
+
+def _cpus_per_task(extra_slurm_options):
+    """
+    Number of cpus requested for each task of the DL1 job arrays, used by the core scripts as number of workers.
+    """
+    return max(1, int((extra_slurm_options or {}).get("cpus-per-task", 1)))
+
+
+def _r0_to_dl1_files_per_job(n_files, extra_slurm_options):
+    # the files of a task are processed in parallel on the cpus allocated to it
+    return (20 if n_files < 50 else 50) * _cpus_per_task(extra_slurm_options)
+
+
+def r0_to_dl1_history(output_dir, batch_config):
+    """
+    Runtimes measured by previous productions, including a previous run of this one in `output_dir`.
+    """
+    return read_runtime_history(
+        list(batch_config.get("r0_dl1_runtime_history", [])) + [Path(output_dir).joinpath("job_logs_r0dl1").as_posix()]
+    )
+
+
+def r0_to_dl1_sublists(raw_files_list, output_dir, batch_config, extra_slurm_options=None):
+    """
+    Sublists of the files processed by each task of the r0_to_dl1 array writing in `output_dir`, see
+    `lstmcpipe.io.sublists.build_sublists`. Also used to plan the production.
+
+    Parameters
+    ----------
+    raw_files_list: list of str
+    output_dir: str or Path
+    batch_config: dict
+    extra_slurm_options: dict or None
+
+    Returns
+    -------
+    list of list of str
+    """
+    n_workers = _cpus_per_task(extra_slurm_options)
+    dl1_files_per_job = _r0_to_dl1_files_per_job(len(raw_files_list), extra_slurm_options)
+    target_task_walltime = batch_config.get("r0_dl1_task_walltime")
+    return build_sublists(
+        raw_files_list,
+        dl1_files_per_job,
+        target_task_walltime=None if target_task_walltime is None else target_task_walltime * n_workers,
+        history=r0_to_dl1_history(output_dir, batch_config),
+        max_tasks=batch_config.get("r0_dl1_max_array_size", DEFAULT_MAX_TASKS),
+    )
+
+
 def r0_to_dl1(
     input_dir,
     output_dir,
@@ -130,11 +219,13 @@ def r0_to_dl1(
     jobid2log : dict
         dictionary log containing {jobid: batch_cmd} information
     jobids_r0_dl1
-        A list of all the jobs sent for input dir
+        A list of all the jobs sent for input dir, None if all the outputs are already complete in resume mode
     """
     log.info(f'\nStarting R0 to DL1 processing for files in dir : {input_dir}')
     if workflow_kind == "lstchain":
         base_cmd = f"lstmcpipe_lst_core_r0_dl1 -c {config_file} "
+        if batch_config is not None and batch_config.get("lstchain_in_process", False):
+            base_cmd += "--in-process "
         jobtype_id = "LST"
     elif workflow_kind == "ctapipe":
         base_cmd = f"lstmcpipe_cta_core_r0_dl1 -c {config_file} "
@@ -151,15 +242,19 @@ def r0_to_dl1(
         jobtype_id = ''
         log.critical("Please, select an allowed workflow kind.")
         exit(-1)
+    if batch_config is not None and batch_config.get("dl1_scratch_staging", False):
+        base_cmd += " --scratch "
     raw_files_list = get_input_filelist(input_dir, glob_pattern="*.simtel.gz")
-    dl1_files_per_job = 20 if len(raw_files_list) < 50 else 50
+    batch_config = {} if batch_config is None else batch_config
+    sublists = r0_to_dl1_sublists(raw_files_list, output_dir, batch_config, extra_slurm_options)
     with open("r0_to_dl1.list", "w+") as newfile:
         for f in raw_files_list:
             newfile.write(f)
             newfile.write("\n")
     log.info(f"{len(raw_files_list)} raw R0 files")
     output_dir = Path(output_dir)
-    if output_dir.exists() and any(output_dir.iterdir()):
+    resume = batch_config.get("resume", False)
+    if output_dir.exists() and any(output_dir.iterdir()) and not resume:
         shutil.rmtree(output_dir)
     job_logs_dir = output_dir.joinpath("job_logs_r0dl1")
     Path(job_logs_dir).mkdir(exist_ok=True, parents=True)
@@ -170,16 +265,18 @@ def r0_to_dl1(
         base_cmd=base_cmd,
         file_list=raw_files_list,
         job_type_id=jobtype_id,
-        dl1_files_per_batched_job=dl1_files_per_job,
+        dl1_files_per_batched_job=_r0_to_dl1_files_per_job(len(raw_files_list), extra_slurm_options),
+        sublists=sublists,
         job_logs_dir=job_logs_dir,
         batch_config=batch_config,
         dl1_processing_type="r0_to_dl1",
         extra_slurm_options=extra_slurm_options,
+        resume=resume,
     )
 
     if config_file is not None:
         shutil.copyfile(config_file, job_logs_dir.joinpath(Path(config_file).name))
-    shutil.move("r0_to_dl1.list", job_logs_dir)
+    shutil.move("r0_to_dl1.list", job_logs_dir.joinpath("r0_to_dl1.list"))
     return jobid2log, jobids_r0_dl1
 
 
@@ -221,11 +318,13 @@ def reprocess_dl1(
     jobid2log : dict
         dictionary log containing {jobid: batch_cmd} information
     jobids_dl1_dl1
-        A list of all the jobs sent for input dir
+        A list of all the jobs sent for input dir, None if all the outputs are already complete in resume mode
     """
     log.info(f"Applying DL1ab on DL1 files in {input_dir}")
     if workflow_kind == "lstchain":
         base_cmd = f"lstmcpipe_lst_core_dl1ab -c {config_file} "
+        if batch_config is not None and batch_config.get("lstchain_in_process", False):
+            base_cmd += "--in-process "
         jobtype_id = "LST"
     elif workflow_kind == "ctapipe":
         base_cmd = f"lstmcpipe_cta_core_r0_dl1 -c {config_file} "
@@ -235,8 +334,10 @@ def reprocess_dl1(
         jobtype_id = ""
         log.critical(f"Unknown workflow {workflow_kind}")
         exit(-1)
+    if batch_config is not None and batch_config.get("dl1_scratch_staging", False):
+        base_cmd += " --scratch "
     check_data_path(input_dir)
-    dl1ab_filelist = [file.resolve().as_posix() for file in Path(input_dir).glob("*.h5")]
+    dl1ab_filelist = get_input_filelist(input_dir, glob_pattern="*.h5")
 
     log.info(f"{len(dl1ab_filelist)} DL1 files")
     with open("dl1ab.list", "w+") as newfile:
@@ -253,16 +354,17 @@ def reprocess_dl1(
         base_cmd=base_cmd,
         file_list=dl1ab_filelist,
         job_type_id=jobtype_id,
-        dl1_files_per_batched_job=dl1_files_per_job,
+        dl1_files_per_batched_job=dl1_files_per_job * _cpus_per_task(extra_slurm_options),
         job_logs_dir=job_logs_dir,
         batch_config=batch_config,
         dl1_processing_type="dl1ab",
         extra_slurm_options=extra_slurm_options,
+        resume=batch_config is not None and batch_config.get("resume", False),
     )
 
     if config_file is not None:
         shutil.copyfile(config_file, job_logs_dir.joinpath(Path(config_file).name))
-    shutil.move("dl1ab.list", job_logs_dir)
+    shutil.move("dl1ab.list", job_logs_dir.joinpath("dl1ab.list"))
     return jobid2log, jobids_dl1_dl1
 
 
@@ -278,6 +380,8 @@ def submit_dl1_jobs(
     n_jobs_parallel=100,
     dl1_processing_type="r0_to_dl1",
     extra_slurm_options=None,
+    resume=False,
+    sublists=None,
 ):
     """
     Compose sbatch command and batches it
@@ -309,29 +413,47 @@ def submit_dl1_jobs(
         String for job and filelist naming
     extra_slurm_options: dict
         Extra slurm options to be passed
+    resume: bool
+        Reuse the sublists of a previous run found in `job_logs_dir` and only process the ones
+        without a valid output manifest
+    sublists: list of list or None
+        Files processed by each array task, e.g. balanced with `lstmcpipe.io.sublists.build_sublists`.
+        Default: consecutive slices of `dl1_files_per_batched_job` files
 
     Returns
     -------
     jobid2log: dict
     jobid: str
+        None if all the sublists are already processed in resume mode
 
     """
-    number_of_sublists = len(file_list) // dl1_files_per_batched_job + int(
-        len(file_list) % dl1_files_per_batched_job > 0
-    )
+    previous_sublists = list(Path(job_logs_dir).glob("*.sublist"))
+    if resume and previous_sublists:
+        log.info(f"Resuming with the {len(previous_sublists)} sublists found in {job_logs_dir}")
+    else:
+        if sublists is None:
+            bounds = range(0, len(file_list) + dl1_files_per_batched_job, dl1_files_per_batched_job)
+            sublists = [file_list[start:stop] for start, stop in zip(bounds, bounds[1:])]
 
-    for i in range(number_of_sublists):
-        output_file = job_logs_dir.joinpath(f"{dl1_processing_type}_{i}.sublist").resolve().as_posix()
+        for i, sublist in enumerate(sublists):
+            output_file = job_logs_dir.joinpath(f"{dl1_processing_type}_{i}.sublist").resolve().as_posix()
 
-        with open(output_file, "w+") as out:
-            for line in file_list[i * dl1_files_per_batched_job:dl1_files_per_batched_job * (i + 1)]:
-                out.write(line)
-                out.write("\n")
-    log.info(f"{number_of_sublists} files generated for list of files at {input_dir}")
+            with open(output_file, "w+") as out:
+                for line in sublist:
+                    out.write(line)
+                    out.write("\n")
+        log.info(f"{len(sublists)} files generated for list of files at {input_dir}")
 
     sublist_names = [f.as_posix() for f in Path(job_logs_dir).glob("*.sublist")]
     cmd = f'{base_cmd} -f {" ".join(sublist_names)} --output_dir {output_dir}'
-    extra_slurm_default_options = {'partition': 'long', 'array': f"0-{len(sublist_names) - 1}%{n_jobs_parallel}"}
+    array_indices = f"0-{len(sublist_names) - 1}"
+    if resume:
+        missing = [i for i, sublist in enumerate(sublist_names) if not verify_output_manifest(manifest_path(sublist))]
+        log.info(f"{len(sublist_names) - len(missing)}/{len(sublist_names)} sublists already processed")
+        if not missing:
+            return {}, None
+        array_indices = format_array_range(missing)
+    extra_slurm_default_options = {'partition': 'long', 'array': f"{array_indices}%{n_jobs_parallel}"}
 
     if extra_slurm_options is not None:
         extra_slurm_default_options.update(extra_slurm_options)
@@ -343,6 +465,7 @@ def submit_dl1_jobs(
         slurm_output=job_logs_dir.joinpath("job_%A_%a.o").as_posix(),
         slurm_account=batch_config["slurm_account"],
         source_environment=batch_config["source_environment"],
+        executor=batch_config.get("executor"),
         extra_slurm_options=extra_slurm_default_options,
     )
 
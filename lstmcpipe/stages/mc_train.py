@@ -3,14 +3,16 @@
 import shutil
 import logging
 from pathlib import Path
-from ..utils import save_log_to_file, SbatchLstMCStage
+from ..utils import save_log_to_file, SbatchLstMCStage, submit_concurrently
 from ..io.data_management import check_and_make_dir_without_verification
+from ..io.output_manifest import incomplete_paths, compose_output_manifest_command
+from ..io.stage_cache import get_stage_cache
 
 
 log = logging.getLogger(__name__)
 
 
-def batch_train_pipe(dict_paths, jobids_from_merge, config_file, batch_config, logs):
+def batch_train_pipe(dict_paths, jobids_from_merge, config_file, batch_config, logs, dependency_graph=None):
     """
     Function to batch the lstchain train_pipe once the proton and gamma-diffuse merge_and_copy_dl1 batched jobs have
     finished.
@@ -29,6 +31,13 @@ def batch_train_pipe(dict_paths, jobids_from_merge, config_file, batch_config, l
         the `train_pipe` function.
     logs: dict
         Dictionary with logs files
+    dependency_graph: `lstmcpipe.dependency_graph.DependencyGraph` or None
+        If provided, each job only depends on the jobs producing its gamma and proton files and its models
+        directory is registered in the graph. Otherwise, all jobs depend on `jobids_from_merge`.
+
+    If `batch_config["resume"]` is set, the models directories with a valid output manifest are not trained again.
+    If the `stage_cache` is enabled, models already trained with the same inputs and config are restored from it,
+    unless the inputs are still being produced by jobs of this run.
 
     Returns
     -------
@@ -41,29 +50,56 @@ def batch_train_pipe(dict_paths, jobids_from_merge, config_file, batch_config, l
     jobid_for_dl1_to_dl2 = []
 
     log.info("==== START {} ====".format("batch mc_train_workflow"))
+    if batch_config.get("resume", False):
+        dict_paths = incomplete_paths(dict_paths, "train_pipe", debug_train)
 
+    calls = []
+    all_wait_jobs = []
     for paths in dict_paths:
 
         gamma_dl1_train_file = paths["input"]["gamma"]
         proton_dl1_train_file = paths["input"]["proton"]
         models_dir = paths["output"]
 
-        job_logs, jobid = train_pipe(
-            gamma_dl1_train_file,
-            proton_dl1_train_file,
-            models_dir,
-            config_file=config_file,
-            batch_configuration=batch_config,
-            wait_jobs_dl1=jobids_from_merge,
-            extra_slurm_options=paths.get("extra_slurm_options", None),
+        if dependency_graph is not None:
+            wait_jobs = dependency_graph.dependencies(paths["input"])
+        else:
+            wait_jobs = jobids_from_merge
+
+        calls.append(
+            dict(
+                gamma_dl1_train_file=gamma_dl1_train_file,
+                proton_dl1_train_file=proton_dl1_train_file,
+                models_dir=models_dir,
+                config_file=config_file,
+                batch_configuration=batch_config,
+                wait_jobs_dl1=wait_jobs,
+                extra_slurm_options=paths.get("extra_slurm_options", None),
+            )
         )
+        all_wait_jobs.append(wait_jobs)
+
+    results = submit_concurrently(
+        train_pipe,
+        calls,
+        max_workers=batch_config.get("submission_threads", 1),
+        keys=[paths["output"] for paths in dict_paths],
+    )
 
+    produced_outputs = []
+    for paths, wait_jobs, (job_logs, jobid) in zip(dict_paths, all_wait_jobs, results):
+        if jobid is None:
+            debug_train[f"**CACHED** {paths['output']}"] = "models restored from the stage cache"
+            continue
         log_train.update(job_logs)
         jobid_for_dl1_to_dl2.append(jobid)
+        produced_outputs.append((jobid, paths["output"]))
 
-        debug_train[jobid] = (
-            f"The single jobid from train_pipe that depends of {jobids_from_merge} - merge" f"_and_copy jobids"
-        )
+        debug_train[jobid] = f"The single jobid from train_pipe that depends of {wait_jobs} - merge" f"_and_copy jobids"
+
+    if dependency_graph is not None:
+        for jobid, output in produced_outputs:
+            dependency_graph.add(jobid, output)
 
     jobid_for_dl1_to_dl2 = ",".join(jobid_for_dl1_to_dl2)
 
@@ -81,6 +117,7 @@ def batch_plot_rf_features(
     batch_configuration,
     train_jobid,
     logs,
+    dependency_graph=None,
 ):
     """
     Batches the plot_model_importance.py script that creates a .png with the RF feature's importance models
@@ -99,6 +136,8 @@ def batch_plot_rf_features(
         Single jobid from training stage.
     logs: dict
         Dictionary with logs files
+    dependency_graph: `lstmcpipe.dependency_graph.DependencyGraph` or None
+        If provided, each job only depends on the training job producing its models directory.
 
     Returns
     -------
@@ -115,15 +154,17 @@ def batch_plot_rf_features(
         models_dir = path["output"]
 
         cmd = f"lstmcpipe_plot_models_importance {models_dir} -cf {config_file}"
+        wait_jobs = dependency_graph.dependencies(models_dir) if dependency_graph is not None else train_jobid
 
         sbatch_rf_feat = SbatchLstMCStage(
             "RF_importance",
             wrap_command=cmd,
             slurm_error=Path(models_dir).joinpath("job_plot_rf_feat_importance_%j.e").resolve().as_posix(),
             slurm_output=Path(models_dir).joinpath(models_dir, "job_plot_rf_feat_importance_%j.o").resolve().as_posix(),
-            slurm_dependencies=train_jobid,
+            slurm_dependencies=wait_jobs,
             slurm_account=batch_configuration["slurm_account"],
             source_environment=batch_configuration["source_environment"],
+            executor=batch_configuration.get("executor"),
             backend="export MPLBACKEND=Agg;",
         )
 
@@ -184,7 +225,7 @@ def train_pipe(
 
     jobid_train : str
         jobid of the batched job to be send (for dependencies purposes) to the next stage of the
-        workflow (onsite_mc_dl1_to_dl2)
+        workflow (onsite_mc_dl1_to_dl2). None if the models were restored from the stage cache.
     """
     log_train = {}
 
@@ -194,6 +235,23 @@ def train_pipe(
     cmd = f"lstchain_mc_trainpipe --fg {gamma_dl1_train_file} --fp {proton_dl1_train_file} -o {models_dir}"
     if config_file is not None:
         cmd = cmd + " -c {}".format(config_file)
+    cmd += f" && {compose_output_manifest_command(models_dir)}"
+
+    cache = get_stage_cache(batch_configuration, "train_pipe")
+    if cache is not None:
+        restored, store_cmd = cache.restore_or_store_command(
+            "train_pipe",
+            [gamma_dl1_train_file, proton_dl1_train_file],
+            config_file,
+            batch_configuration["source_environment"],
+            models_dir,
+            pending=bool(wait_jobs_dl1),
+        )
+        if restored:
+            if config_file is not None:
+                shutil.copyfile(config_file, Path(models_dir).joinpath(Path(config_file).name))
+            return log_train, None
+        cmd += f" && {store_cmd}"
 
     sbatch_train_pipe = SbatchLstMCStage(
         "train_pipe",
@@ -204,6 +262,7 @@ def train_pipe(
         extra_slurm_options=extra_slurm_options,
         slurm_account=batch_configuration["slurm_account"],
         source_environment=batch_configuration["source_environment"],
+        executor=batch_configuration.get("executor"),
     )
 
     jobid_train = sbatch_train_pipe.submit()
@@ -3,7 +3,9 @@
 import shutil
 import logging
 from pathlib import Path
-from ..utils import save_log_to_file, SbatchLstMCStage
+from ..utils import save_log_to_file, SbatchLstMCStage, submit_concurrently
+from ..io.output_manifest import incomplete_paths, compose_output_manifest_command
+from ..io.dl1_merge import is_file_list
 
 log = logging.getLogger(__name__)
 
@@ -13,6 +15,7 @@ def batch_train_test_splitting(
     jobids_from_r0dl1,
     batch_config,
     logs,
+    dependency_graph=None,
 ):
     """
 
@@ -25,6 +28,12 @@ def batch_train_test_splitting(
         to `merge_dl1` and `compose_batch_command_of_script` functions.
     logs: dict
         Dictionary with logs files
+    dependency_graph: `lstmcpipe.dependency_graph.DependencyGraph` or None
+        If provided, each job only depends on the jobs producing its input and its outputs are registered
+        in the graph. Otherwise, all jobs depend on `jobids_from_r0dl1`.
+
+    If `batch_config["resume"]` is set, the splits whose train and test directories have a valid output manifest
+    are not done again.
 
     Returns
     -------
@@ -35,19 +44,45 @@ def batch_train_test_splitting(
     jobids_for_merging = []
 
     log.info("==== START {} ====".format("batch train_test_splitting"))
+    if batch_config.get("resume", False):
+        dict_paths = incomplete_paths(dict_paths, "train_test_split", debug_log)
 
+    calls = []
+    all_wait_jobs = []
     for paths in dict_paths:
-        job_logs, jobid = train_test_split(
-            paths["input"],
-            paths["output"],
-            wait_jobid_r0_dl1=jobids_from_r0dl1,
-            batch_configuration=batch_config,
-            extra_slurm_options=paths.get("extra_slurm_options", None),
+        if dependency_graph is not None:
+            wait_jobs = dependency_graph.dependencies(paths["input"])
+        else:
+            wait_jobs = jobids_from_r0dl1
+        calls.append(
+            dict(
+                input_dir=paths["input"],
+                output_dirs=paths["output"],
+                wait_jobid_r0_dl1=wait_jobs,
+                batch_configuration=batch_config,
+                extra_slurm_options=paths.get("extra_slurm_options", None),
+            )
         )
+        all_wait_jobs.append(wait_jobs)
+
+    # splits sharing an input directory (where their slurm logs are written) are submitted sequentially
+    results = submit_concurrently(
+        train_test_split,
+        calls,
+        max_workers=batch_config.get("submission_threads", 1),
+        keys=[paths["input"] for paths in dict_paths],
+    )
 
+    produced_outputs = []
+    for paths, wait_jobs, (job_logs, jobid) in zip(dict_paths, all_wait_jobs, results):
         log_splitting.update(job_logs)
         jobids_for_merging.append(jobid)
-        debug_log[jobid] = f"Train test splitting jobid that depends on : {jobids_from_r0dl1}"
+        produced_outputs.append((jobid, paths["output"]))
+        debug_log[jobid] = f"Train test splitting jobid that depends on : {wait_jobs}"
+
+    if dependency_graph is not None:
+        for jobid, outputs in produced_outputs:
+            dependency_graph.add(jobid, outputs)
 
     jobids_for_merging = ",".join(jobids_for_merging)
 
@@ -72,6 +107,8 @@ def train_test_split(
     ----------
     input_dir: str
     output_dirs: dict
+        `train` and `test` directories where the files are moved, or `.list` manifests where the files are only
+        listed (deterministic split on the file names, stable when files are added), and the `ratio` of test files
     batch_configuration: dict
     wait_jobid_r0_dl1: str
     extra_slurm_options: dict
@@ -87,14 +124,8 @@ def train_test_split(
 
     log.info("\nSplitting files within the {} dir".format(input_dir.as_posix()))
 
-    # create train, test output directories
     test_dir = Path(output_dirs["test"]).resolve()
     train_dir = Path(output_dirs["train"]).resolve()
-    for direct in [test_dir, train_dir]:
-        if direct.exists() and any(direct.iterdir()):
-            shutil.rmtree(direct)
-    train_dir.mkdir(exist_ok=True, parents=True)
-    test_dir.mkdir(exist_ok=True, parents=True)
 
     # tt ratio
     if "ratio" not in output_dirs:
@@ -102,10 +133,27 @@ def train_test_split(
     else:
         ratio = output_dirs["ratio"]
 
-    cmd = (
-        f"lstmcpipe_train_test_split -i {input_dir} --otest {test_dir}"
-        f" --otrain {train_dir} -r {ratio} -l {test_dir.parent}"
-    )
+    if is_file_list([output_dirs["train"], output_dirs["test"]]):
+        # metadata-only split: the files are not moved, the train and test outputs are `.list` manifests
+        cmd = (
+            f"lstmcpipe_train_test_split -i {input_dir} --train_list {train_dir}"
+            f" --test_list {test_dir} -r {ratio}"
+            f" && {compose_output_manifest_command([train_dir, test_dir])}"
+        )
+    else:
+        # create train, test output directories
+        for direct in [test_dir, train_dir]:
+            # files already moved by an interrupted split are kept when resuming
+            if direct.exists() and any(direct.iterdir()) and not batch_configuration.get("resume", False):
+                shutil.rmtree(direct)
+        train_dir.mkdir(exist_ok=True, parents=True)
+        test_dir.mkdir(exist_ok=True, parents=True)
+
+        cmd = (
+            f"lstmcpipe_train_test_split -i {input_dir} --otest {test_dir}"
+            f" --otrain {train_dir} -r {ratio} -l {test_dir.parent}"
+            f" && {compose_output_manifest_command([train_dir, test_dir])}"
+        )
 
     sbatch_tt_splitting = SbatchLstMCStage(
         "train_test_splitting",
@@ -116,6 +164,7 @@ def train_test_split(
         extra_slurm_options=extra_slurm_options,
         slurm_account=batch_configuration["slurm_account"],
         source_environment=batch_configuration["source_environment"],
+        executor=batch_configuration.get("executor"),
     )
 
     jobid_split = sbatch_tt_splitting.submit()
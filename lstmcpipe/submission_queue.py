@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+# Client-side queue of sbatch submissions, keeping a production below the per-user job limits of Slurm
+# (`MaxSubmitJobs`). When the limit is reached, the sbatch commands are queued in a JSON file with a placeholder
+# job id (`Q{n}`) that the following stages use as dependency. The `lstmcpipe_drain_queue` process, detached from
+# the terminal so that it survives the logout, then submits them in order as running jobs leave the queue,
+# replacing the placeholders by the actual job ids.
+
+import os
+import re
+import json
+import time
+import fcntl
+import logging
+import subprocess as sp
+from pathlib import Path
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# placeholder job ids, possibly followed by an array task (`Q3_5`), but not part of a path or of a word
+PLACEHOLDER_PATTERN = re.compile(r"(?<![\w./-])Q\d+(?!\d)")
+
+
+def is_placeholder(jobid):
+    return PLACEHOLDER_PATTERN.fullmatch(str(jobid).split("_")[0]) is not None
+
+
+def queue_filename(log_dir, prod_id):
+    return Path(log_dir).joinpath(f"submission_queue_{prod_id}.json")
+
+
+def current_job_count():
+    """
+    Number of jobs (counting each array task) of the user in the slurm queue.
+    """
+    result = sp.run(["squeue", "--me", "--noheader", "--array", "--format=%i"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"squeue failed: {result.stderr}")
+    return len([line for line in result.stdout.splitlines() if line.strip()])
+
+
+def account_job_limit():
+    """
+    Smallest `MaxSubmitJobs` of the associations of the user (`sacctmgr`), None if unlimited.
+    """
+    user = os.environ.get("USER", "")
+    result = sp.run(
+        ["sacctmgr", "show", "assoc", f"user={user}", "format=MaxSubmitJobs", "--noheader", "--parsable2"],
+        capture_output=True,
+        text=True,
+    )
+    limits = [int(line) for line in result.stdout.split() if line.strip().isdigit()]
+    return min(limits) if limits else None
+
+
+def resolve_placeholders(command, submitted):
+    """
+    Replace the placeholder job ids of an sbatch command (in its `--dependency` option, or e.g. in the sacct call
+    of the production check job) by the submitted job ids.
+
+    Parameters
+    ----------
+    command: str
+    submitted: dict
+        {placeholder: jobid}
+
+    Returns
+    -------
+    str or None: None if a placeholder has not been submitted yet
+    """
+    if any(placeholder not in submitted for placeholder in PLACEHOLDER_PATTERN.findall(command)):
+        return None
+    return PLACEHOLDER_PATTERN.sub(lambda match: submitted[match.group(0)], command)
+
+
+class SubmissionQueue:
+    """
+    Persisted queue of sbatch commands.
+
+    The JSON file contains the `pending` submissions (placeholder, command, number of tasks), the `submitted`
+    {placeholder: jobid} mapping and the files to update once a job is submitted (`scancel_file`, `job_store`).
+    It is locked while modified, as it is shared by lstmcpipe and the drainer process.
+
+    Parameters
+    ----------
+    filename: str or Path
+    scancel_file: str or Path or None
+        scancel file of the production, completed with the job ids once submitted
+    job_store: str or Path or None
+        `lstmcpipe.io.job_store.JobStore` file in which the placeholders are replaced once submitted
+    """
+
+    def __init__(self, filename, scancel_file=None, job_store=None):
+        self.filename = Path(filename)
+        self.files = {"scancel_file": scancel_file, "job_store": job_store}
+
+    @contextmanager
+    def _locked(self):
+        self.filename.parent.mkdir(exist_ok=True, parents=True)
+        with open(self.filename.with_name(self.filename.name + ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self.filename.exists():
+                    with open(self.filename) as file:
+                        state = json.load(file)
+                else:
+                    state = {"next_id": 1, "pending": [], "submitted": {}}
+                yield state
+                tmp_file = self.filename.with_name(self.filename.name + ".tmp")
+                with open(tmp_file, "w") as file:
+                    json.dump(state, file, indent=2)
+                os.replace(tmp_file, self.filename)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def push(self, command, n_tasks=1):
+        """
+        Queue an sbatch command.
+
+        Parameters
+        ----------
+        command: str
+            sbatch command, possibly depending on placeholder job ids
+        n_tasks: int
+            Number of jobs counted by slurm (array tasks)
+
+        Returns
+        -------
+        str: placeholder job id
+        """
+        with self._locked() as state:
+            placeholder = f"Q{state['next_id']}"
+            state["next_id"] += 1
+            state["pending"].append({"placeholder": placeholder, "command": command, "n_tasks": n_tasks})
+            state.update({key: str(value) for key, value in self.files.items() if value is not None})
+        return placeholder
+
+    def pending(self):
+        with self._locked() as state:
+            return list(state["pending"])
+
+    def submitted(self):
+        """
+        {placeholder: jobid} of the queued jobs already submitted.
+        """
+        with self._locked() as state:
+            return dict(state["submitted"])
+
+    def submit_next(self, capacity, run_command, idle=False):
+        """
+        Submit the queued commands, in order, as long as they fit in `capacity`.
+
+        Parameters
+        ----------
+        capacity: int
+            Number of jobs that can be submitted
+        run_command: callable
+            Run an sbatch command and return the job id
+        idle: bool
+            No job of the user is in the slurm queue: the first queued job is submitted even if its array is
+            larger than `capacity`, slurm then rejects it with an explicit error rather than waiting forever
+
+        Returns
+        -------
+        list of (placeholder, jobid)
+        """
+        done = []
+        with self._locked() as state:
+            while state["pending"]:
+                entry = state["pending"][0]
+                if entry["n_tasks"] > capacity and not (idle and not done):
+                    break
+                command = resolve_placeholders(entry["command"], state["submitted"])
+                if command is None:
+                    raise RuntimeError(f"Dependencies of {entry['placeholder']} were never submitted")
+                jobid = run_command(command)
+                state["submitted"][entry["placeholder"]] = jobid
+                state["pending"].pop(0)
+                capacity -= entry["n_tasks"]
+                done.append((entry["placeholder"], jobid))
+                log.info(f"Queued job {entry['placeholder']} submitted as {jobid}")
+            files = {key: state.get(key) for key in ["scancel_file", "job_store"]}
+
+        if done:
+            self._update_files(done, **files)
+        return done
+
+    @staticmethod
+    def _update_files(done, scancel_file=None, job_store=None):
+        if scancel_file is not None:
+            from .io.lstmcpipe_tree_path import update_scancel_file
+
+            update_scancel_file(Path(scancel_file), ",".join(jobid for _, jobid in done))
+        if job_store is not None:
+            from .io.job_store import JobStore
+
+            store = JobStore(job_store)
+            for placeholder, jobid in done:
+                store.rename_job(placeholder, jobid)
+
+
+def drain(queue, job_limit, poll_interval=60, job_count=current_job_count, run_command=None):
+    """
+    Submit all the queued jobs, waiting for capacity under `job_limit`.
+
+    Parameters
+    ----------
+    queue: `SubmissionQueue`
+    job_limit: int
+    poll_interval: float
+        Seconds between two checks of the slurm queue
+    job_count: callable
+        Current number of jobs of the user
+    run_command: callable or None
+        Default: `lstmcpipe.utils.run_command`
+    """
+    if run_command is None:
+        from .utils import run_command
+    while queue.pending():
+        n_jobs = job_count()
+        queue.submit_next(job_limit - n_jobs, run_command, idle=n_jobs == 0)
+        if queue.pending():
+            time.sleep(poll_interval)
+    log.info(f"All the jobs of {queue.filename} have been submitted")
+
+
+def start_drainer(queue_file, job_limit, poll_interval=60):
+    """
+    Start `lstmcpipe_drain_queue` in a new session, so that it keeps running after the logout.
+    """
+    log_file = Path(queue_file).with_suffix(".log")
+    with open(log_file, "a") as out:
+        process = sp.Popen(
+            [
+                "lstmcpipe_drain_queue",
+                "--queue",
+                str(queue_file),
+                "--job_limit",
+                str(job_limit),
+                "--poll_interval",
+                str(poll_interval),
+            ],
+            stdout=out,
+            stderr=sp.STDOUT,
+            stdin=sp.DEVNULL,
+            start_new_session=True,
+        )
+    log.info(f"Queued jobs will be submitted by process {process.pid} as slots free up, see {log_file}")
+    return process
@@ -0,0 +1,40 @@
+import pytest
+from lstmcpipe.controller import Controller, StageFailedError
+from lstmcpipe.executors import SlurmExecutor
+from lstmcpipe.io.job_store import JobStore, parse_sacct
+
+
+@pytest.fixture
+def executor(tmp_path, monkeypatch):
+    executor = SlurmExecutor()
+    executor.job_store = JobStore(tmp_path / "jobs.sqlite")
+    executor.job_store.add_job("100", "r0_to_dl1", n_tasks=4)
+    executor.job_store.add_job("101", "merge_dl1")
+    sacct = [
+        "100_0|COMPLETED|00:10:00|0:0\n100_1|RUNNING|00:05:00|0:0\n100_[2-3]|PENDING|00:00:00|0:0\n",
+        "100_0|COMPLETED|00:10:00|0:0\n100_1|COMPLETED|00:10:00|0:0\n100_2|FAILED|00:01:00|1:0\n"
+        "100_3|COMPLETED|00:10:00|0:0\n101|FAILED|00:01:00|1:0\n",
+    ]
+
+    def refresh():
+        # the last state is kept once all the jobs are over
+        executor.job_store.update_tasks(parse_sacct(sacct.pop(0) if len(sacct) > 1 else sacct[0]))
+
+    monkeypatch.setattr(executor.job_store, "refresh", refresh)
+    return executor
+
+
+def test_stage_status(executor):
+    executor.job_store.refresh()
+    assert Controller(executor).stage_status(["100", "101"]) == {"done": 1, "failed": 0, "active": 4}
+    executor.job_store.refresh()
+    assert Controller(executor).stage_status(["100"]) == {"done": 3, "failed": 1, "active": 0}
+    assert Controller(executor).stage_status(["100_0", "100_2"]) == {"done": 1, "failed": 1, "active": 0}
+
+
+def test_wait_for_stage(executor):
+    controller = Controller(executor, min_success_fraction={"r0_to_dl1": 0.7}, poll_interval=0)
+    assert controller.wait_for_stage("r0_to_dl1", "100") == "100"
+    with pytest.raises(StageFailedError):
+        controller.wait_for_stage("merge_dl1", "101")
+    assert controller.wait_for_stage("dl1_to_dl2", None) is None
@@ -0,0 +1,28 @@
+from lstmcpipe.dependency_graph import DependencyGraph
+
+
+def test_dependency_graph():
+    graph = DependencyGraph()
+    base = "/fefs/DL1/AllSky/prod/TrainingDataset"
+    graph.add("1", f"{base}/GammaDiffuse/dec_2276/node_a")
+    graph.add("2", f"{base}/GammaDiffuse/dec_2276/node_b")
+    graph.add("3", f"{base}/Protons/dec_2276/node_a")
+    graph.add("4", f"{base}/GammaDiffuse/dec_931/node_a")
+    graph.add(None, "/not/registered")
+
+    # merge input dir containing the nodes of a single declination
+    assert graph.dependencies(f"{base}/GammaDiffuse/dec_2276") == "1,2"
+    assert graph.dependencies(f"{base}/Protons/dec_2276") == "3"
+
+    graph.add("5", f"{base}/GammaDiffuse/dec_2276/merged.h5")
+    graph.add("6", f"{base}/Protons/dec_2276/merged.h5")
+    graph.add("7", "/fefs/models/dec_2276")
+    inputs = {"gamma": f"{base}/GammaDiffuse/dec_2276/merged.h5", "proton": f"{base}/Protons/dec_2276/merged.h5"}
+    assert graph.dependencies(inputs) == "5,6"
+
+    # DL2 file inside a dl1_to_dl2 output dir and dict with None values
+    graph.add("8", {"train": "/fefs/DL2/dec_2276", "ratio": 0.5})
+    assert graph.dependencies({"gamma_file": "/fefs/DL2/dec_2276/dl2.h5", "proton_file": None}) == "8"
+    assert graph.dependencies(["/fefs/models/dec_2276", "/fefs/DL2/other"]) == "7"
+    assert graph.dependencies("/fefs/nothing") is None
+    assert len(graph) == 8
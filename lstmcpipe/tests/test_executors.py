@@ -0,0 +1,84 @@
+import pytest
+from lstmcpipe.utils import SbatchLstMCStage
+from lstmcpipe.executors import parse_array_range, format_array_range, get_executor, LocalExecutor, SlurmExecutor
+
+
+def test_parse_array_range():
+    assert parse_array_range(None) == [None]
+    assert parse_array_range("0-3%100") == [0, 1, 2, 3]
+    assert parse_array_range("0,4-5") == [0, 4, 5]
+    assert parse_array_range("1-7:3") == [1, 4, 7]
+
+
+def test_format_array_range():
+    assert format_array_range([0, 1, 2, 3, 7, 9, 10]) == "0-3,7,9-10"
+    assert format_array_range([5]) == "5"
+    assert parse_array_range(format_array_range([9, 2, 3, 4])) == [2, 3, 4, 9]
+
+
+def test_get_executor():
+    assert isinstance(get_executor(), SlurmExecutor)
+    assert isinstance(get_executor("slurm"), SlurmExecutor)
+    local = get_executor({"name": "local", "max_workers": 2})
+    assert isinstance(local, LocalExecutor)
+    assert local.max_workers == 2
+    assert get_executor(local) is local
+    local.wait()
+    with pytest.raises(ValueError):
+        get_executor("condor")
+
+
+def test_local_executor(tmp_path):
+    executor = LocalExecutor(max_workers=2)
+    outfile = tmp_path / "out.txt"
+
+    first = SbatchLstMCStage(
+        "r0_to_dl1",
+        wrap_command=f"echo task_$SLURM_ARRAY_TASK_ID >> {outfile}",
+        slurm_output=(tmp_path / "job_%A_%a.o").as_posix(),
+        slurm_error=(tmp_path / "job_%A_%a.e").as_posix(),
+        extra_slurm_options={"array": "0-2%100"},
+        executor=executor,
+    )
+    jobid_first = first.submit()
+
+    second = SbatchLstMCStage(
+        "merge_dl1",
+        wrap_command=f"echo merged >> {outfile}",
+        slurm_output=(tmp_path / "merge_%j.o").as_posix(),
+        slurm_error=(tmp_path / "merge_%j.e").as_posix(),
+        slurm_dependencies=jobid_first,
+        executor=executor,
+    )
+    jobid_second = second.submit()
+
+    failing = SbatchLstMCStage(
+        "train_pipe",
+        wrap_command="exit 3",
+        slurm_dependencies=f"{jobid_first}_1",
+        slurm_output=(tmp_path / "train_%j.o").as_posix(),
+        slurm_error=(tmp_path / "train_%j.e").as_posix(),
+        executor=executor,
+    )
+    jobid_failing = failing.submit()
+
+    never_run = SbatchLstMCStage(
+        "dl1_to_dl2",
+        wrap_command=f"echo never >> {outfile}",
+        slurm_dependencies=f"{jobid_second},{jobid_failing}",
+        slurm_output=(tmp_path / "dl2_%j.o").as_posix(),
+        slurm_error=(tmp_path / "dl2_%j.e").as_posix(),
+        executor=executor,
+    )
+    jobid_never = never_run.submit()
+
+    status = executor.wait()
+    assert status[jobid_first] and status[f"{jobid_first}_2"]
+    assert status[jobid_second]
+    assert not status[jobid_failing]
+    assert not status[jobid_never]
+
+    lines = outfile.read_text().split()
+    assert sorted(lines[:3]) == ["task_0", "task_1", "task_2"]
+    assert lines[3:] == ["merged"]
+    assert (tmp_path / f"job_{jobid_first}_1.o").exists()
@@ -0,0 +1,19 @@
+from lstmcpipe.lstchain_worker import LstchainWorker
+
+
+def test_lstchain_worker_fallback(tmp_path):
+    input_file = tmp_path / "run1.simtel.gz"
+    input_file.write_text("r0")
+    output_file = tmp_path / "dl1_run1.h5"
+
+    class FailingWorker(LstchainWorker):
+        def r0_to_dl1(self, input_file, output_file):
+            output_file.write_text("partial")
+            raise RuntimeError("in-process failure")
+
+    worker = FailingWorker()
+    cmd = ["cp", input_file.as_posix(), output_file.as_posix()]
+    ntry = worker.run("r0_to_dl1", input_file, output_file, cmd, failed_jobs_dir=tmp_path / "failed")
+    assert ntry == 1
+    assert output_file.read_text() == "r0"
+    assert (tmp_path / "failed" / "dl1_run1.h5").read_text() == "partial"
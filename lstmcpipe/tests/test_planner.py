@@ -0,0 +1,63 @@
+import json
+from lstmcpipe.io.sublists import write_runtimes
+from lstmcpipe.planner import ProductionPlanner, format_plan, write_plan
+
+
+def test_production_plan(tmp_path):
+    r0_dir = tmp_path / "R0"
+    r0_dir.mkdir()
+    files = []
+    for ii in range(30):
+        file = r0_dir / f"run{ii}.simtel.gz"
+        file.write_bytes(b"0" * 1000)
+        files.append(file.resolve().as_posix())
+    history_dir = tmp_path / "history"
+    history_dir.mkdir()
+    write_runtimes(
+        history_dir / "r0_to_dl1_0.sublist",
+        {file: {"size": 1000, "runtime": 360.0, "output_size": 100} for file in files},
+    )
+
+    dl1_dir = tmp_path / "DL1"
+    config = {
+        "prod_id": "test",
+        "stages_to_run": ["r0_to_dl1", "train_test_split", "merge_dl1"],
+        "stages": {
+            "r0_to_dl1": [{"input": r0_dir.as_posix(), "output": dl1_dir.as_posix()}],
+            "train_test_split": [
+                {
+                    "input": dl1_dir.as_posix(),
+                    "output": {"train": (dl1_dir / "train").as_posix(), "test": (dl1_dir / "test").as_posix()},
+                }
+            ],
+            "merge_dl1": [
+                {"input": (dl1_dir / "train").as_posix(), "output": (tmp_path / "train.h5").as_posix()},
+                {"input": (dl1_dir / "test").as_posix(), "output": (tmp_path / "test.h5").as_posix()},
+            ],
+        },
+        "batch_config": {
+            "r0_dl1_runtime_history": [history_dir.as_posix()],
+            "r0_dl1_task_walltime": 3600,
+            "array_submission": True,
+        },
+    }
+    plan = ProductionPlanner(config).plan()
+
+    r0_dl1 = plan["stages"]["r0_to_dl1"]
+    assert r0_dl1["jobs"] == 1
+    # 30 files of 6 minutes in tasks of one hour
+    assert r0_dl1["array_sizes"] == [3]
+    assert r0_dl1["input_bytes"] == 30000
+    assert r0_dl1["output_bytes"] == 3000
+    assert r0_dl1["core_hours"] == 3
+    # the DL1 files are moved and merged: same volume
+    assert plan["stages"]["train_test_split"]["new_bytes"] == 0
+    assert plan["stages"]["merge_dl1"]["input_bytes"] == 3000
+    assert plan["stages"]["merge_dl1"]["array_sizes"] == [2]
+    # no accounting history for the split and merge jobs
+    assert plan["stages"]["merge_dl1"]["core_hours"] is None
+    assert plan["total"] == {"jobs": 3, "tasks": 6, "core_hours": None, "new_bytes": 6000}
+
+    assert "r0_to_dl1" in format_plan(plan)
+    write_plan(plan, tmp_path / "plan.json")
+    assert json.loads((tmp_path / "plan.json").read_text()) == plan
@@ -0,0 +1,52 @@
+from lstmcpipe import recovery
+from lstmcpipe.recovery import resubmission_command, rewire_dependencies, task_sublists, recover_production
+from lstmcpipe.io.job_store import JobStore, parse_sacct
+
+
+def test_resubmission_command():
+    sbatch = 'sbatch --parsable --array=0-9%100 --dependency=afterok:12:13 --wrap="cmd || exit \\$?"'
+    assert resubmission_command(sbatch, [2, 3, 7]) == 'sbatch --parsable --array=2-3,7%100 --wrap="cmd || exit \\$?"'
+    assert resubmission_command("sbatch --parsable --wrap=cmd", [None]) == "sbatch --parsable --wrap=cmd"
+
+
+def test_rewire_dependencies():
+    assert rewire_dependencies("100,101", {"100": "200"}, {"100": []}) == "200,101"
+    assert rewire_dependencies("100_3,100_4,101", {"100": "200"}, {"100": [3, 4]}) == "200_3,200_4,101"
+    # only task 7 was resubmitted, task 3 completed
+    assert rewire_dependencies("100_3,100_7", {"100": "200"}, {"100": [7]}) == "200_7"
+    assert rewire_dependencies("100_3", {"100": "200"}, {"100": [7]}) == ""
+
+
+def test_task_sublists():
+    command = "source env; lstmcpipe_lst_core_r0_dl1 -c cfg.json "
+    command += "-f /logs/r0_to_dl1_0.sublist /logs/r0_to_dl1_1.sublist --output_dir /dl1 || exit \\$?"
+    assert task_sublists(command, [1]) == ["/logs/r0_to_dl1_1.sublist"]
+
+
+def test_recover_production(tmp_path, monkeypatch):
+    store = JobStore(tmp_path / "jobs.sqlite")
+    store.add_job("100", "r0_to_dl1", n_tasks=3, sbatch_command="sbatch --parsable --array=0-2%100 --wrap=cmd")
+    store.add_job("101", "merge_dl1", dependencies="100", sbatch_command="sbatch --parsable --wrap=merge")
+    sacct = "100_0|COMPLETED|00:10:00|0:0\n100_1|FAILED|00:01:00|1:0\n100_2|COMPLETED|00:10:00|0:0\n"
+    store.update_tasks(parse_sacct(sacct))
+    store.update_tasks(parse_sacct("101|PENDING|00:00:00|0:0\n"))
+
+    commands = []
+
+    def run_command(command):
+        commands.append(command)
+        return "200"
+
+    monkeypatch.setattr(recovery, "run_command", run_command)
+    assert recover_production(store, refresh=False) == {"100": "200"}
+    assert commands == [
+        "sbatch --parsable --array=1%100 --wrap=cmd",
+        "scontrol update JobId=101 Dependency=afterok:200",
+    ]
+    jobs = {job["jobid"]: job for job in store.jobs()}
+    assert jobs["100"]["recovered_by"] == "200"
+    assert jobs["101"]["dependencies"] == "200"
+    assert store.summary()["r0_to_dl1"]["tasks"] == 3
+
+    # already recovered
+    assert recover_production(store, refresh=False) == {}
@@ -0,0 +1,70 @@
+from lstmcpipe.resource_tuning import (
+    ResourceTuner,
+    parse_check_file,
+    parse_memory,
+    stage_of_job_name,
+    format_duration,
+)
+
+COLUMNS = [("JobID", 12), ("JobName", 10), ("State", 10), ("Elapsed", 10), ("MaxRSS", 10), ("Partition", 10)]
+
+
+def write_check_file(filename, rows):
+    lines = [
+        " ".join(f"{name:>{width}}" for name, width in COLUMNS),
+        " ".join("-" * width for _, width in COLUMNS),
+    ]
+    for row in rows:
+        lines.append(" ".join(f"{value:>{width}}" for value, (_, width) in zip(row, COLUMNS)))
+    filename.write_text("\n".join(lines) + "\n")
+
+
+def test_parse_check_file(tmp_path):
+    check_file = tmp_path / "check_MC_prod.txt"
+    write_check_file(
+        check_file,
+        [
+            ("100_0", "LST-r0_to+", "COMPLETED", "01:00:00", "", "long"),
+            ("100_0.batch", "batch", "COMPLETED", "01:00:00", "2G", ""),
+            ("101", "dl1_dl2", "OUT_OF_ME+", "00:10:00", "", "short"),
+            ("101.batch", "batch", "OUT_OF_ME+", "00:10:00", "32G", ""),
+        ],
+    )
+    records = parse_check_file(check_file)
+    assert records["100_0"]["elapsed"] == 3600
+    assert records["100_0"]["mem"] == 2 * 2**30
+    assert records["101"]["state"] == "OUT_OF_ME+"
+    assert parse_memory("100Gn") == 100 * 2**30
+    assert stage_of_job_name("LST-r0_to_dl1") == "r0_to_dl1"
+    assert stage_of_job_name("train_pipe") == "train_pipe"
+    assert format_duration(93610) == "1-02:00:10"
+
+
+def test_resource_tuner():
+    history = {"dl1_to_dl2": [{"elapsed": 600 * (i + 1), "mem": 2**30 * (i + 1)} for i in range(10)]}
+    tuner = ResourceTuner(history, margin=1.5, quantile=0.9)
+    options = tuner.options("dl1_to_dl2", default_partition="long")
+    assert options == {"mem": "14G", "time": "0-02:15:00", "partition": "short"}
+    assert tuner.options("dl1_to_dl2", default_partition="xxl") == {"mem": "14G", "time": "0-02:15:00"}
+    assert tuner.options("train_pipe") == {}
+
+
+def test_resource_tuner_from_check_files(tmp_path):
+    from lstmcpipe.io.job_store import JobStore
+
+    rows = []
+    for i in range(5):
+        rows.append((f"100_{i}", "LST-r0_to+", "COMPLETED", "01:00:00", "", "long"))
+        rows.append((f"100_{i}.batch", "batch", "COMPLETED", "01:00:00", "2G", ""))
+    rows.append(("101", "dl1_dl2", "TIMEOUT", "04:00:00", "", "short"))
+    write_check_file(tmp_path / "check_MC_prod.txt", rows)
+    # the truncated job names are resolved with the job store of the production
+    JobStore(tmp_path / "jobs_prod.sqlite").add_job("100", "r0_to_dl1", n_tasks=5)
+
+    tuner = ResourceTuner.from_config({"history": (tmp_path / "check_MC_*.txt").as_posix(), "margin": 1.0})
+    assert list(tuner.history) == ["r0_to_dl1"]
+    assert tuner.options("r0_to_dl1", default_partition="long") == {
+        "mem": "2G",
+        "time": "0-01:00:00",
+        "partition": "short",
+    }
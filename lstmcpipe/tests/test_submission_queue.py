@@ -0,0 +1,80 @@
+import itertools
+from lstmcpipe import submission_queue, utils
+from lstmcpipe.executors import SlurmExecutor
+from lstmcpipe.io.job_store import JobStore
+from lstmcpipe.submission_queue import SubmissionQueue, resolve_placeholders, is_placeholder, drain
+
+
+def test_resolve_placeholders():
+    command = "sbatch --parsable --dependency=afterok:Q1:Q2_3:100 --wrap='cmd /data/Q1/file'"
+    assert resolve_placeholders(command, {"Q1": "201"}) is None
+    assert (
+        resolve_placeholders(command, {"Q1": "201", "Q2": "202"})
+        == "sbatch --parsable --dependency=afterok:201:202_3:100 --wrap='cmd /data/Q1/file'"
+    )
+    assert is_placeholder("Q12_3")
+    assert not is_placeholder("12")
+
+
+def test_executor_queues_above_limit(tmp_path, monkeypatch):
+    jobids = itertools.count(100)
+    monkeypatch.setattr(utils, "run_command", lambda command: str(next(jobids)))
+    # the submitted array is in the slurm queue when it is queried again
+    job_counts = iter([6, 9])
+    monkeypatch.setattr(submission_queue, "current_job_count", lambda: next(job_counts))
+
+    executor = SlurmExecutor()
+    executor.job_limit = 10
+    executor.submission_queue = SubmissionQueue(tmp_path / "queue.json")
+    assert executor.submit_command("sbatch --array=0-2 --wrap=a", n_tasks=3) == "100"
+    assert executor.submit_command("sbatch --array=0-1 --wrap=b", n_tasks=2) == "Q1"
+    # queued after the previous job, even if it fits in the remaining capacity
+    assert executor.submit_command("sbatch --dependency=afterok:100:Q1 --wrap=c") == "Q2"
+    assert executor.n_queued == 2
+    assert [entry["placeholder"] for entry in executor.submission_queue.pending()] == ["Q1", "Q2"]
+
+
+def test_executor_submits_concurrently(tmp_path, monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    # both sbatch calls must be running at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    def run_command(command):
+        barrier.wait()
+        return command.split("=")[-1]
+
+    monkeypatch.setattr(utils, "run_command", run_command)
+    monkeypatch.setattr(submission_queue, "current_job_count", lambda: 0)
+    executor = SlurmExecutor()
+    executor.job_limit = 10
+    executor.submission_queue = SubmissionQueue(tmp_path / "queue.json")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        jobids = list(pool.map(executor.submit_command, ["sbatch --wrap=1", "sbatch --wrap=2"]))
+    assert jobids == ["1", "2"]
+    assert executor._capacity == 8
+
+
+def test_drain(tmp_path):
+    scancel_file = tmp_path / "scancel.sh"
+    scancel_file.touch()
+    store = JobStore(tmp_path / "jobs.sqlite")
+    store.add_job("Q1", "dl1_to_dl2")
+    store.add_job("Q2", "dl2_to_irfs", dependencies="Q1")
+    queue = SubmissionQueue(tmp_path / "queue.json", scancel_file=scancel_file, job_store=store.filename)
+    queue.push("sbatch --array=0-3 --wrap=a", n_tasks=4)
+    queue.push("sbatch --dependency=afterok:Q1 --wrap=b")
+
+    commands = []
+    job_counts = iter([8, 7, 3])
+
+    def run_command(command):
+        commands.append(command)
+        return str(200 + len(commands))
+
+    drain(queue, 10, poll_interval=0, job_count=lambda: next(job_counts), run_command=run_command)
+    assert commands == ["sbatch --array=0-3 --wrap=a", "sbatch --dependency=afterok:201 --wrap=b"]
+    assert queue.pending() == []
+    assert scancel_file.read_text() == "scancel 201,202"
+    assert {job["jobid"]: job["dependencies"] for job in store.jobs()} == {"201": None, "202": "201"}
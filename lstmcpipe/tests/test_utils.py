@@ -1,3 +1,4 @@
+import os
 import json
 import pytest
 import tempfile
@@ -132,3 +133,80 @@ def test_dump_lstchain_std_config():
         assert json.load(outfile.open())['GlobalPeakWindowSum']['apply_integration_correction']
         dump_lstchain_std_config(filename=outfile, allsky=True, overwrite=True)
         assert 'alt_tel' in json.load(outfile.open())['energy_regression_features']
+
+
+def test_submit_stage_as_job_arrays(tmp_path):
+    from ..utils import submit_stage_as_job_arrays
+    from ..dependency_graph import DependencyGraph
+    from ..executors import SlurmExecutor
+
+    class RecordingExecutor(SlurmExecutor):
+        def __init__(self):
+            self.stages = []
+
+        def submit(self, sbatch_stage):
+            self.stages.append(sbatch_stage)
+            return str(len(self.stages))
+
+    executor = RecordingExecutor()
+    graph = DependencyGraph()
+    graph.add("42", "/DL1/gamma/merged.h5")
+    tasks = [
+        {"command": "echo 0", "input": "/DL1/gamma/merged.h5", "output": "/DL2/gamma"},
+        {"command": "echo 1", "input": "/DL1/proton/merged.h5", "output": "/DL2/proton"},
+        {"command": "echo 2", "input": "/DL1/electron/merged.h5", "output": "/DL2/electron"},
+        {"command": "echo 3", "input": "/DL1/big.h5", "output": "/DL2/big", "extra_slurm_options": {"mem": "64G"}},
+    ]
+    batch_config = {"source_environment": "", "slurm_account": "", "executor": executor}
+
+    jobid2log, debug_log, jobids = submit_stage_as_job_arrays(
+        "dl1_to_dl2", tasks, batch_config, tasks_dir=tmp_path, dependency_graph=graph
+    )
+
+    # the tasks waiting for different jobs are in different arrays
+    assert jobids == ["1", "2", "3"]
+    assert list(jobid2log) == ["1", "2", "3"]
+    assert debug_log["1_0"] == "echo 0"
+    assert debug_log["2_1"] == "echo 2"
+    assert debug_log["3_0"] == "echo 3"
+    first, second, third = executor.stages
+    assert first.slurm_options["array"] == "0-0%100"
+    assert first.slurm_options["dependencies"] == "42"
+    assert second.slurm_options["array"] == "0-1%100"
+    assert "dependencies" not in second.slurm_options
+    assert third.slurm_options["mem"] == "64G"
+    assert "lstmcpipe_run_task_manifest --tasks" in first.wrap_cmd
+    assert Path(tmp_path, "dl1_to_dl2_1.tasks").read_text().splitlines() == ["echo 1", "echo 2"]
+    assert graph.dependencies("/DL2/proton/dl2.h5") == "2_0"
+
+
+def test_submit_concurrently():
+    import time
+    import threading
+    from ..utils import submit_concurrently
+
+    order = []
+    lock = threading.Lock()
+
+    def submit(jobid, delay):
+        time.sleep(delay)
+        with lock:
+            order.append(jobid)
+        return {jobid: f"sbatch {jobid}"}, jobid
+
+    calls = [dict(jobid=str(ii), delay=0.05 * (4 - ii)) for ii in range(4)]
+    results = submit_concurrently(submit, calls, max_workers=4, keys=["a", "a", "b", "c"])
+    assert [jobid for _, jobid in results] == ["0", "1", "2", "3"]
+    # calls sharing a key run in their original order
+    assert order.index("0") < order.index("1")
+    assert submit_concurrently(submit, calls[:2], max_workers=1)[1] == ({"1": "sbatch 1"}, "1")
+
+
+def test_process_files():
+    from ..utils import process_files
+
+    files = ["/a/run1.h5", "/b/run2.h5", "/c/run3.h5"]
+    assert process_files(os.path.basename, files) == ["run1.h5", "run2.h5", "run3.h5"]
+    assert process_files(os.path.basename, files, n_workers=2) == ["run1.h5", "run2.h5", "run3.h5"]
+    with pytest.raises(ValueError):
+        process_files(int, ["1", "a"], n_workers=2)
@@ -7,12 +7,14 @@ import logging
 import warnings
 import subprocess as sp
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from ruamel.yaml import YAML
 from pprint import pprint
 from copy import deepcopy
 from deepdiff import DeepDiff
 
 from . import prod_logs
+from .executors import get_executor, parse_array_range
 
 log = logging.getLogger(__name__)
 
@@ -50,6 +52,7 @@ def batch_mc_production_check(
     prod_config_file,
     batch_config,
     logs_files,
+    wait_for_jobs=True,
 ):
     """
     Check that the dl1_to_dl2 stage, and therefore, the whole workflow has ended correctly.
@@ -66,6 +69,8 @@ def batch_mc_production_check(
     batch_config: dict
     logs_files: dict
         Dictionary with logs files
+    wait_for_jobs: bool
+        Run the check once all the jobs succeeded (`afterok` dependency), otherwise right away
 
     Returns
     -------
@@ -79,7 +84,8 @@ def batch_mc_production_check(
     slurm_account = batch_config["slurm_account"]
 
     for stage, jobids in dict_jobids_all_stages.items():
-        all_pipeline_jobs.append(jobids)
+        if jobids:
+            all_pipeline_jobs.append(jobids)
         debug_log[f"SUMMARY_{stage}"] = jobids
 
     all_pipeline_jobs = ",".join(all_pipeline_jobs)
@@ -92,18 +98,31 @@ def batch_mc_production_check(
 
     cmd_wrap = f"touch {check_prod_file}; "
     cmd_wrap += (
-        f"sacct --format=jobid,jobname,nodelist,cputime,state,exitcode,avediskread,maxdiskread,avediskwrite,"
-        f"maxdiskwrite,AveVMSize,MaxVMSize,avecpufreq,reqmem -j {all_pipeline_jobs} >> {check_prod_file}; "
+        f"sacct --format=jobid,jobname%30,nodelist,cputime,state,exitcode,avediskread,maxdiskread,avediskwrite,"
+        f"maxdiskwrite,AveVMSize,MaxVMSize,avecpufreq,reqmem,elapsed,maxrss,partition -j {all_pipeline_jobs} "
+        f">> {check_prod_file}; "
         f"mv slurm-* IRFFITSWriter.provenance.log {log_directory.absolute().as_posix()} "
     )
 
     batch_cmd = "sbatch -p short --parsable"
     if slurm_account != "":
         batch_cmd += f" -A {slurm_account}"
-    batch_cmd += f" --dependency=afterok:{all_pipeline_jobs} -J prod_check" f' --wrap="{source_env} {cmd_wrap}"'
+    if all_pipeline_jobs and wait_for_jobs:
+        batch_cmd += f" --dependency=afterok:{all_pipeline_jobs}"
+    batch_cmd += " -J prod_check" f' --wrap="{source_env} {cmd_wrap}"'
 
-    jobid = os.popen(batch_cmd).read().strip("\n")
+    # submitted through the executor so that it is queued after the pipeline jobs if the job limit is reached
+    jobid = get_executor(batch_config.get("executor")).submit_command(batch_cmd)
     log.info(f"Submitted batch CHECK-job {jobid}")
+    job_store = getattr(batch_config.get("executor"), "job_store", None)
+    if job_store is not None:
+        job_store.add_job(
+            jobid,
+            "prod_check",
+            dependencies=all_pipeline_jobs if all_pipeline_jobs and wait_for_jobs else None,
+            command=cmd_wrap,
+            sbatch_command=batch_cmd,
+        )
     debug_log[f"prod_check_{jobid}"] = batch_cmd
 
     save_log_to_file(debug_log, logs_files["debug_file"], workflow_step="check_full_workflow")
@@ -239,6 +258,7 @@ class SbatchLstMCStage:
         extra_slurm_options=None,
         source_environment="",
         backend="",
+        executor=None,
     ):
         self.base_slurm_command = "sbatch --parsable"
         self.stage = stage
@@ -250,6 +270,7 @@ class SbatchLstMCStage:
         self.slurm_account = slurm_account
         self.slurm_dependencies = slurm_dependencies
         self.extra_slurm_options = extra_slurm_options
+        self.executor = get_executor(executor)
 
         self.compose_wrap_command(wrap_command, source_environment, backend)
 
@@ -284,7 +305,9 @@ class SbatchLstMCStage:
             source_env = f"{source_env.strip()}; "
         if backend != "" and not backend.strip().endswith(";"):
             backend = f"{backend.strip()}; "
-        self.wrap_cmd = f'--wrap="{backend}{source_env}{wrap_command}"'
+        # command run by the job, escaped to be passed as a double-quoted string by the shell
+        self.shell_command = f"{backend}{source_env}{wrap_command}"
+        self.wrap_cmd = f'--wrap="{self.shell_command}"'
 
     @property
     def slurm_command(self):
@@ -332,7 +355,17 @@ class SbatchLstMCStage:
 
     def submit(self):
         if self.wrap_cmd is not None and self.wrap_cmd != "":
-            jobid = run_command(self.slurm_command)
+            jobid = self.executor.submit(self)
+            if self.executor.job_store is not None:
+                options = self.slurm_options
+                self.executor.job_store.add_job(
+                    jobid,
+                    self.stage,
+                    n_tasks=len(parse_array_range(options.get("array"))),
+                    dependencies=options.get("dependencies"),
+                    command=self.shell_command,
+                    sbatch_command=self.slurm_command,
+                )
             return jobid
         else:
             raise ValueError(
@@ -348,12 +381,17 @@ class SbatchLstMCStage:
         """
         Construct the complet set of slurm options with the following priority order:
         - default ones for the stage
+        - the ones predicted from previous productions, if the executor has a `resource_tuner`
         - the general ones (job_name, error, output, account)
         - extra_slurm_options
         """
         # set all the slurm options with the following priority order: default, general, extra_slurm_options
         self._slurm_options = {}
         self._slurm_options.update(self.stage_default_options(self.stage))
+        if self.executor.resource_tuner is not None:
+            self._slurm_options.update(
+                self.executor.resource_tuner.options(self.stage, default_partition=self._slurm_options.get("partition"))
+            )
 
         if self.job_name is not None:
             self._slurm_options['job-name'] = self.job_name
@@ -407,3 +445,187 @@ class SbatchLstMCStage:
     @property
     def dl2_sens_plot_default_options(self):
         return {'job-name': 'dl2_sens_plot', 'partition': 'short'}
+
+
+def submit_stage_as_job_arrays(
+    stage,
+    tasks,
+    batch_config,
+    tasks_dir,
+    dependency_graph=None,
+    stage_dependencies=None,
+    n_jobs_parallel=100,
+    tasks_name=None,
+):
+    """
+    Submit the independent jobs of a stage as slurm job arrays instead of one sbatch per job.
+    Tasks sharing the same extra slurm options and the same dependencies are packed into a single array job, so that
+    every task only waits for the jobs producing its own input. The command of each task is written in a tasks file
+    (line number = array task index) run by `lstmcpipe_run_task_manifest`.
+
+    Parameters
+    ----------
+    stage: str
+        Stage name, see `SbatchLstMCStage._valid_stages`
+    tasks: list of dict
+        One dict per task with keys `command`, `input`, `output` and optionally `extra_slurm_options`
+    batch_config: dict
+        Dictionary containing the (full) source_environment, the slurm_account and the executor
+    tasks_dir: Path
+        Directory where the tasks files and the slurm logs of the arrays are written
+    dependency_graph: `lstmcpipe.dependency_graph.DependencyGraph` or None
+        If provided, each array depends on the jobs producing the input of its tasks and the output of each task
+        is registered in the graph as `jobid_taskid`.
+    stage_dependencies: str or None
+        Comma-separated job ids to depend on when no dependency graph is provided
+    n_jobs_parallel: int
+        Number of array tasks to be processed in parallel
+    tasks_name: str or None
+        Name of the tasks files and slurm logs, to submit several arrays of the same stage. Default: `stage`
+
+    Returns
+    -------
+    jobid2log: dict
+        {jobid: batch_cmd}
+    debug_log: dict
+        {jobid_taskid: task command}
+    jobids: list
+        job ids of the submitted arrays
+    """
+    tasks_dir = Path(tasks_dir)
+    tasks_dir.mkdir(exist_ok=True, parents=True)
+    tasks_name = stage if tasks_name is None else tasks_name
+
+    groups = {}
+    for task in tasks:
+        if dependency_graph is not None:
+            wait_jobs = dependency_graph.dependencies(task["input"])
+            wait_jobs = ",".join(sorted(set(wait_jobs.split(",")))) if wait_jobs else None
+        else:
+            wait_jobs = stage_dependencies
+        key = (json.dumps(dict(task.get("extra_slurm_options") or {}), sort_keys=True, default=str), wait_jobs)
+        groups.setdefault(key, []).append(task)
+
+    jobid2log = {}
+    debug_log = {}
+    jobids = []
+    produced_outputs = []
+    for igroup, ((_, wait_jobs), group) in enumerate(groups.items()):
+
+        tasks_file = tasks_dir.joinpath(f"{tasks_name}_{igroup}.tasks").resolve()
+        with open(tasks_file, "w") as file:
+            for task in group:
+                file.write(task["command"].replace("\n", " "))
+                file.write("\n")
+
+        array_options = {"array": f"0-{len(group) - 1}%{n_jobs_parallel}"}
+        array_options.update(group[0].get("extra_slurm_options") or {})
+        sbatch_array = SbatchLstMCStage(
+            stage,
+            wrap_command=f"lstmcpipe_run_task_manifest --tasks {tasks_file.as_posix()}",
+            slurm_error=tasks_dir.joinpath(f"{tasks_name}_{igroup}_%A_%a.e").resolve().as_posix(),
+            slurm_output=tasks_dir.joinpath(f"{tasks_name}_{igroup}_%A_%a.o").resolve().as_posix(),
+            slurm_dependencies=wait_jobs,
+            extra_slurm_options=array_options,
+            slurm_account=batch_config["slurm_account"],
+            source_environment=batch_config["source_environment"],
+            executor=batch_config.get("executor"),
+        )
+        jobid = sbatch_array.submit()
+        log.info(f"Submitted {len(group)} {stage} tasks as array job {jobid}")
+        jobid2log[jobid] = sbatch_array.slurm_command
+        jobids.append(jobid)
+        for itask, task in enumerate(group):
+            debug_log[f"{jobid}_{itask}"] = task["command"]
+            produced_outputs.append((f"{jobid}_{itask}", task["output"]))
+
+    if dependency_graph is not None:
+        for jobid, output in produced_outputs:
+            dependency_graph.add(jobid, output)
+
+    return jobid2log, debug_log, jobids
+
+
+def submit_concurrently(function, calls, max_workers=1, keys=None):
+    """
+    Call `function` for each set of keyword arguments in `calls` using a bounded pool of threads, to hide the
+    latency of the sbatch round trips. Calls sharing the same key (e.g. the same output directory, that the
+    submission functions may clean up) run sequentially, in their original order.
+
+    Parameters
+    ----------
+    function: callable
+        Submission function, e.g. `lstmcpipe.stages.mc_train.train_pipe`
+    calls: list of dict
+        Keyword arguments of each call
+    max_workers: int
+        Maximum number of concurrent calls. 1 submits sequentially.
+    keys: list or None
+        Key of each call. Default: all calls are independent.
+
+    Returns
+    -------
+    list: results of the calls, in the same order as `calls`
+    """
+    keys = list(range(len(calls))) if keys is None else [str(key) for key in keys]
+    groups = {}
+    for index, key in enumerate(keys):
+        groups.setdefault(key, []).append(index)
+
+    results = [None] * len(calls)
+
+    def run_group(indices):
+        for index in indices:
+            results[index] = function(**calls[index])
+
+    max_workers = max(1, min(int(max_workers), len(groups)))
+    if max_workers == 1:
+        for indices in groups.values():
+            run_group(indices)
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_group, indices) for indices in groups.values()]
+        for future in futures:
+            future.result()
+    return results
+
+
+def default_n_workers():
+    """
+    Number of CPUs allocated to the slurm task (`SLURM_CPUS_PER_TASK`), 1 outside of slurm
+    """
+    return int(os.environ.get("SLURM_CPUS_PER_TASK", 1))
+
+
+def process_files(function, files, n_workers=1, prefetch=None):
+    """
+    Apply `function` to every file of a sublist, using a pool of `n_workers` processes.
+    Each call keeps its own retry logic (e.g. `rerun_cmd`); the first exception raised by a call is
+    propagated once the pool is shut down.
+
+    Parameters
+    ----------
+    function: callable
+        Module-level function (it is sent to the worker processes) taking a file as argument
+    files: list
+    n_workers: int
+        Number of processes. 1 processes the files sequentially in the current process.
+    prefetch: callable or None
+        Non-blocking function called with the next file before processing the current one, when processing
+        sequentially (e.g. `lstmcpipe.io.scratch.ScratchArea.prefetch`)
+
+    Returns
+    -------
+    list: results of the calls, in the same order as `files`
+    """
+    n_workers = max(1, min(int(n_workers), len(files)))
+    if n_workers == 1:
+        results = []
+        for ii, file in enumerate(files):
+            if prefetch is not None and ii + 1 < len(files):
+                prefetch(files[ii + 1])
+            results.append(function(file))
+        return results
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        return list(pool.map(function, files))
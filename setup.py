@@ -41,6 +41,14 @@ entry_points = {
         "lstmcpipe_validate_config = lstmcpipe.scripts.script_lstmcpipe_validate_config:main",
         "lstmcpipe_generate_config = lstmcpipe.scripts.lstmcpipe_generate_config:main",
         "lstmcpipe_generate_nsb_levels_configs = lstmcpipe.scripts.generate_nsb_levels_configs:main",
+        "lstmcpipe_run_task_manifest = lstmcpipe.scripts.script_run_task_manifest:main",
+        "lstmcpipe_write_output_manifest = lstmcpipe.scripts.script_write_output_manifest:main",
+        "lstmcpipe_cache_store = lstmcpipe.scripts.script_cache_store:main",
+        "lstmcpipe_status = lstmcpipe.scripts.script_status:main",
+        "lstmcpipe_recover = lstmcpipe.scripts.script_recover:main",
+        "lstmcpipe_drain_queue = lstmcpipe.scripts.script_drain_queue:main",
+        "lstmcpipe_file_catalog = lstmcpipe.scripts.script_file_catalog:main",
+        "lstmcpipe_merge_dl1 = lstmcpipe.scripts.script_merge_dl1:main",
     ]
 }
 